@@ -1,4 +1,17 @@
 #!/bin/sh
 
 export PYTHONPATH=$(pwd)/dafiti_geelbe_scraper
+
+# Perfil de configuración (configs/<perfil>.conf.py). e.g: ./crawl.sh --profile prod dafiti
+if [ "$1" = "--profile" ]; then
+    export SCRAPER_PROFILE=$2
+    shift 2
+fi
+
+# Ambas arañas en el mismo proceso: ./crawl.sh all
+if [ "$1" = "all" ]; then
+    shift
+    exec python dafiti_geelbe_scraper/run_all.py $*
+fi
+
 scrapy crawl $*
\ No newline at end of file
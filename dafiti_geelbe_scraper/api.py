@@ -0,0 +1,289 @@
+'''
+Este script sirve los artículos escrapeados mediante una API HTTP de solo lectura (JSON)
+
+Endpoints:
+    GET /articles?brand=B&line=L&provider=P&min_price=X&max_price=Y&limit=N&after=ID
+    GET /articles/<id>
+
+- Paginación por clave (keyset): Los artículos se ordenan por id y cada página devuelve la url de
+la siguiente (parámetro after = último id de la página), por lo que pedir una página no
+requiere recorrer las anteriores.
+- Las consultas usan un conjunto (pool) de API_POOL_SIZE conexiones de solo lectura.
+- Cada respuesta tiene una cabecera ETag (hash del contenido). Si la petición incluye la cabecera
+If-None-Match con el mismo valor, se responde 304 sin contenido.
+- Las últimas API_CACHE_SIZE respuestas se guardan en memoria (LRU) mientras no cambien los datos
+(es decir, mientras no cambie la versión de los datos, ver report.data_version)
+
+Uso:
+    PYTHONPATH=dafiti_geelbe_scraper python dafiti_geelbe_scraper/api.py [--host H] [--port P]
+    PYTHONPATH=dafiti_geelbe_scraper python dafiti_geelbe_scraper/api.py --loadtest [--requests N] [--clients C]
+'''
+
+from config import global_config
+from storage import get_storage_backend
+from report import data_version
+from feeds import encode_json
+from logger import Logger
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, urlencode
+from collections import OrderedDict
+from queue import Queue
+from threading import Lock, Thread
+from hashlib import sha1
+import argparse
+import time
+import math
+import re
+
+
+# Rango de los enteros de la base de datos (64 bits con signo). Los ids y el parámetro after fuera
+# de este rango no pueden pasarse a las consultas.
+MIN_INTEGER, MAX_INTEGER = -2 ** 63, 2 ** 63 - 1
+
+ARTICLE_COLUMNS = ['id', 'name', 'brand', 'line', 'provider', 'price', 'image', 'sku', 'list_price']
+
+ARTICLES_QUERY = '''
+    SELECT a.id, a.name, b.name, l.name, p.name, a.price, a.image, a.sku, a.list_price
+    FROM Article a
+        JOIN Brand b ON b.id = a.brand
+        JOIN Line l ON l.id = a.line
+        JOIN Provider p ON p.id = a.provider
+    WHERE a.id > {param}
+        AND ({param} IS NULL OR b.name = {param})
+        AND ({param} IS NULL OR l.name = {param})
+        AND ({param} IS NULL OR p.name = {param})
+        AND ({param} IS NULL OR a.price >= {param})
+        AND ({param} IS NULL OR a.price <= {param})
+    ORDER BY a.id
+    LIMIT {param}
+'''
+
+ARTICLE_QUERY = '''
+    SELECT a.id, a.name, b.name, l.name, p.name, a.price, a.image, a.sku, a.list_price
+    FROM Article a
+        JOIN Brand b ON b.id = a.brand
+        JOIN Line l ON l.id = a.line
+        JOIN Provider p ON p.id = a.provider
+    WHERE a.id = {param}
+'''
+
+
+class ConnectionPool:
+    '''
+    Conjunto de conexiones de solo lectura a la base de datos compartido por los hilos del servidor.
+    '''
+    def __init__(self, backend, size):
+        self.connections = Queue()
+        for index in range(0, size):
+            self.connections.put(backend.connect_readonly())
+
+    def execute(self, query, params):
+        '''
+        Ejecuta una consulta con una de las conexiones (espera si están todas ocupadas)
+        :return: Devuelve las filas del resultado.
+        '''
+        connection = self.connections.get()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+        finally:
+            self.connections.put(connection)
+
+    def version(self):
+        connection = self.connections.get()
+        try:
+            return data_version(connection)
+        finally:
+            self.connections.put(connection)
+
+
+class LRUCache:
+    '''
+    Caché de tamaño acotado. Cuando está llena, se descarta el valor usado hace más tiempo.
+    '''
+    def __init__(self, size):
+        self.size = size
+        self.values = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.values:
+                return None
+            self.values.move_to_end(key)
+            return self.values[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.values[key] = value
+            self.values.move_to_end(key)
+            while len(self.values) > self.size:
+                self.values.popitem(last = False)
+
+
+class ArticlesAPI:
+    '''
+    Resuelve las peticiones de la API. Es independiente del servidor HTTP.
+    '''
+    def __init__(self, backend = None, pool_size = 4, cache_size = 1024, max_limit = 500):
+        backend = backend or get_storage_backend()
+        self.param = backend.param
+        self.pool = ConnectionPool(backend, pool_size)
+        self.cache = LRUCache(cache_size)
+        self.max_limit = max_limit
+        self.database_errors = backend.database_errors()
+        self.log = Logger()
+        self.articles_query = ARTICLES_QUERY.format(param = self.param)
+        self.article_query = ARTICLE_QUERY.format(param = self.param)
+
+    def get(self, url):
+        '''
+        :param url: Es la ruta y los parámetros de la petición. e.g: /articles?brand=Nike
+        :return: Devuelve una tupla (estado HTTP, ETag, contenido JSON). Si falla una consulta a la
+        base de datos, el estado es 500 (el error se muestra en el log, no en la respuesta)
+        '''
+        try:
+            version = self.pool.version()
+            if version is not None:
+                cached = self.cache.get((version, url))
+                if cached is not None:
+                    return cached
+            status, body = self.handle(url)
+        except self.database_errors as e:
+            self.log.error('Database error on {}: {}', url, e)
+            version, status, body = None, 500, encode_json({'error' : 'Database error'})
+
+        response = (status, '"{}"'.format(sha1(body).hexdigest()), body)
+        if version is not None and status == 200:
+            self.cache.put((version, url), response)
+        return response
+
+    def handle(self, url):
+        parts = urlsplit(url)
+        match = re.match(r'^/articles/(\d+)$', parts.path)
+        if match is not None:
+            article_id = int(match.group(1))
+            if article_id > MAX_INTEGER:
+                return 400, encode_json({'error' : 'Invalid article id'})
+            rows = self.pool.execute(self.article_query, (article_id,))
+            if len(rows) == 0:
+                return 404, encode_json({'error' : 'Article not found'})
+            return 200, encode_json(dict(zip(ARTICLE_COLUMNS, rows[0])))
+
+        if parts.path != '/articles':
+            return 404, encode_json({'error' : 'Not found'})
+
+        query = dict([(key, values[-1]) for key, values in parse_qs(parts.query).items()])
+        try:
+            after = int(query.get('after', 0))
+            limit = max(1, min(int(query.get('limit', 100)), self.max_limit))
+            min_price = float(query['min_price']) if 'min_price' in query else None
+            max_price = float(query['max_price']) if 'max_price' in query else None
+        except ValueError:
+            return 400, encode_json({'error' : 'Invalid parameter'})
+        if not MIN_INTEGER <= after <= MAX_INTEGER or \
+           any(price is not None and not math.isfinite(price) for price in (min_price, max_price)):
+            return 400, encode_json({'error' : 'Invalid parameter'})
+
+        brand, line, provider = query.get('brand'), query.get('line'), query.get('provider')
+        rows = self.pool.execute(self.articles_query, (after, brand, brand, line, line, provider, provider,
+                                                       min_price, min_price, max_price, max_price, limit))
+        articles = [dict(zip(ARTICLE_COLUMNS, row)) for row in rows]
+
+        # La siguiente página comienza después del último artículo de esta.
+        next_url = None
+        if len(articles) == limit:
+            query['after'] = articles[-1]['id']
+            next_url = '/articles?{}'.format(urlencode(query))
+        return 200, encode_json({'articles' : articles, 'next' : next_url})
+
+
+class APIRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 para que los clientes puedan reutilizar las conexiones (keep-alive)
+    protocol_version = 'HTTP/1.1'
+    # Las cabeceras y el contenido se escriben por separado. Sin esto, el algoritmo de Nagle
+    # retrasa las respuestas en las conexiones reutilizadas.
+    disable_nagle_algorithm = True
+    api = None
+
+    def do_GET(self):
+        status, etag, body = self.api.get(self.path)
+
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host, port, api):
+    APIRequestHandler.api = api
+    server = ThreadingHTTPServer((host, port), APIRequestHandler)
+    server.daemon_threads = True
+    return server
+
+
+def load_test(url, num_requests, num_clients):
+    '''
+    Realiza num_requests peticiones GET a la url indicada desde num_clients hilos. Cada hilo
+    reutiliza su conexión.
+    :return: Devuelve el número de peticiones por segundo.
+    '''
+    from http.client import HTTPConnection
+
+    parts = urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+
+    def client(count):
+        connection = HTTPConnection(parts.hostname, parts.port)
+        for index in range(0, count):
+            connection.request('GET', path)
+            connection.getresponse().read()
+        connection.close()
+
+    threads = [Thread(target = client, args = (num_requests // num_clients,)) for index in range(0, num_clients)]
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return (num_requests // num_clients) * num_clients / (time.time() - start_time)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Read-only HTTP API over the scraped articles')
+    parser.add_argument('--host', default = global_config.API_HOST)
+    parser.add_argument('--port', type = int, default = global_config.API_PORT)
+    parser.add_argument('--loadtest', action = 'store_true', help = 'Start the server and measure requests/sec')
+    parser.add_argument('--requests', type = int, default = 10000)
+    parser.add_argument('--clients', type = int, default = 8)
+    parser.add_argument('--path', default = '/articles?limit=100')
+    args = parser.parse_args()
+
+    api = ArticlesAPI(pool_size = global_config.API_POOL_SIZE, cache_size = global_config.API_CACHE_SIZE,
+                      max_limit = global_config.API_MAX_LIMIT)
+    server = serve(args.host, args.port, api)
+
+    if not args.loadtest:
+        print('Serving on http://{}:{}'.format(args.host, args.port))
+        server.serve_forever()
+    else:
+        Thread(target = server.serve_forever, daemon = True).start()
+        url = 'http://{}:{}{}'.format(args.host, server.server_address[1], args.path)
+        requests_per_second = load_test(url, args.requests, args.clients)
+        print('{}: {:.0f} requests/s ({} requests, {} clients)'.format(url, requests_per_second, args.requests, args.clients))
+        server.shutdown()
@@ -0,0 +1,146 @@
+'''
+Este script compara el rendimiento de las descargas con la configuración de Scrapy por defecto
+y con la de cada perfil de configuración del scraper (concurrencia y manejador de descargas, ver
+downloader.py) contra un servidor HTTP local que simula las páginas de un proveedor (mismo
+servidor para todas las peticiones, con un retardo de respuesta fijo)
+
+Para cada configuración se descargan el mismo número de páginas y se muestran las páginas por
+segundo y el porcentaje de peticiones que han reutilizado una conexión (según el número de
+conexiones que ha aceptado el servidor)
+
+Uso:
+    PYTHONPATH=dafiti_geelbe_scraper python dafiti_geelbe_scraper/bench_downloader.py [--pages N]
+        [--latency SEGUNDOS] [--page-size BYTES] [--profiles default,prod,...]
+'''
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+import argparse
+import time
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    '''
+    Servidor de páginas de prueba. Cuenta las conexiones aceptadas.
+    '''
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.0
+    body = b''
+    num_connections = 0
+    lock = Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            StandInRequestHandler.num_connections += 1
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def stand_in_server(latency, page_size):
+    StandInRequestHandler.latency = latency
+    StandInRequestHandler.body = ('<html><body>' + 'x' * page_size + '</body></html>').encode('utf-8')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInRequestHandler)
+    server.daemon_threads = True
+    Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+
+def benchmark(profiles, url, num_pages):
+    '''
+    Descarga num_pages páginas con cada configuración.
+    :param profiles: Listado de tuplas (nombre, settings de Scrapy)
+    :return: Devuelve un listado de tuplas (nombre, páginas por segundo, ratio de reutilización,
+    estadísticas de Scrapy)
+    '''
+    from scrapy import Spider, Request
+    from scrapy.crawler import CrawlerRunner
+    from twisted.internet import reactor, defer
+
+    class BenchSpider(Spider):
+        name = 'bench'
+
+        def start_requests(self):
+            for index in range(0, num_pages):
+                yield Request('{}/page/{}'.format(url, index), callback = self.parse, dont_filter = True)
+
+        def parse(self, response):
+            pass
+
+    results = []
+
+    @defer.inlineCallbacks
+    def run():
+        for name, settings in profiles:
+            settings = dict(settings, LOG_LEVEL = 'WARNING', TELNETCONSOLE_ENABLED = False)
+            crawler = CrawlerRunner(settings).create_crawler(BenchSpider)
+            connections = StandInRequestHandler.num_connections
+            start_time = time.time()
+            yield crawler.crawl()
+            elapsed = time.time() - start_time
+
+            stats = crawler.stats.get_stats()
+            responses = stats.get('response_received_count', 0)
+            new_connections = StandInRequestHandler.num_connections - connections
+            reuse_ratio = 1 - new_connections / responses if responses > 0 else 0.0
+            results.append((name, responses / elapsed, reuse_ratio, stats))
+        reactor.stop()
+
+    reactor.callWhenRunning(run)
+    reactor.run()
+    return results
+
+
+def profile_settings(profile):
+    '''
+    :return: Devuelve los settings de Scrapy de descarga del perfil de configuración indicado
+    ('default' para la configuración por defecto)
+    '''
+    from config import Config
+    from downloader import MeteredHTTP11DownloadHandler
+    from os.path import dirname, join
+
+    configs_dir = join(dirname(__file__), 'configs')
+    config = Config.load_from_file(join(configs_dir, 'default.conf.py'))
+    if profile != 'default':
+        config.override(Config.load_from_file(join(configs_dir, '{}.conf.py'.format(profile))))
+    return {
+        'DOWNLOAD_HANDLERS' : {'http' : MeteredHTTP11DownloadHandler},
+        'CONCURRENT_REQUESTS' : config.CONCURRENT_REQUESTS,
+        'CONCURRENT_REQUESTS_PER_DOMAIN' : config.CONCURRENT_REQUESTS_PER_DOMAIN,
+        'DOWNLOAD_DELAY' : config.DOWNLOAD_DELAY
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the downloader settings against a local HTTP server')
+    parser.add_argument('--pages', type = int, default = 2000)
+    parser.add_argument('--latency', type = float, default = 0.02)
+    parser.add_argument('--page-size', type = int, default = 50000)
+    parser.add_argument('--profiles', default = 'debug,default,prod', help = 'Configuration profiles, separated by commas')
+    args = parser.parse_args()
+
+    server = stand_in_server(args.latency, args.page_size)
+    url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    profiles = [('scrapy defaults', {})]
+    for profile in args.profiles.split(','):
+        settings = profile_settings(profile.strip())
+        profiles.append(('{} profile ({}/{})'.format(profile.strip(), settings['CONCURRENT_REQUESTS'],
+                                                     settings['CONCURRENT_REQUESTS_PER_DOMAIN']), settings))
+
+    for name, pages_per_second, reuse_ratio, stats in benchmark(profiles, url, args.pages):
+        report = '{}: {:.1f} pages/s, {:.0%} of the requests reused a connection'.format(name, pages_per_second, reuse_ratio)
+        if stats.get('downloader/connections/connect_time_avg') is not None:
+            report += ', {:.1f}ms per new connection'.format(stats['downloader/connections/connect_time_avg'] * 1000)
+        print(report)
+    server.shutdown()
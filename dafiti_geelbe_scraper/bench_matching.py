@@ -0,0 +1,117 @@
+'''
+Este script mide el tiempo de relacionar los artículos de dos proveedores (ver matching.py) con un
+catálogo sintético de --articles artículos por proveedor, guardado en una base de datos sqlite
+temporal.
+
+Una fracción (--shared) de los productos está en ambos proveedores con el nombre escrito de otra
+forma (mayúsculas, acentos, guiones y orden de las palabras). El resto solo está en uno de ellos.
+La referencia (sku) de cada artículo identifica su producto, por lo que se muestran también la
+precisión (parejas correctas / parejas) y la exhaustividad (parejas correctas / productos
+compartidos) de la relación.
+
+Uso:
+    PYTHONPATH=dafiti_geelbe_scraper python dafiti_geelbe_scraper/bench_matching.py [--articles N]
+        [--brands N] [--shared FRACCION] [--min-similarity S]
+'''
+
+from tempfile import mkdtemp
+from os.path import join
+import argparse
+import random
+import time
+
+
+KINDS = ['Camiseta', 'Pantalón', 'Zapatilla', 'Vestido', 'Chaqueta', 'Falda', 'Bolso', 'Gorra', 'Sudadera', 'Bermuda']
+STYLES = ['Básica', 'Deportiva', 'Estampada', 'Slim', 'Oversize', 'Clásica', 'Urbana', 'Running', 'Casual', 'Premium']
+COLORS = ['Azul', 'Negro', 'Blanco', 'Rojo', 'Verde', 'Gris', 'Beige', 'Rosa', 'Café', 'Amarillo']
+
+
+def product_name(random_state, number):
+    return '{} {} {} {}'.format(random_state.choice(KINDS), random_state.choice(STYLES), random_state.choice(COLORS),
+                                'Ref{}'.format(number))
+
+
+def rewrite_name(random_state, name):
+    '''
+    :return: Devuelve el nombre de un producto escrito como lo haría otro proveedor.
+    '''
+    words = name.split()
+    if random_state.random() < 0.5:
+        words[1], words[2] = words[2], words[1]
+    name = ' '.join(words)
+    if random_state.random() < 0.5:
+        name = name.upper()
+    if random_state.random() < 0.5:
+        name = name.replace(' Ref', '-REF ')
+    return name
+
+
+def synthetic_items(num_articles, num_brands, shared, seed = 0):
+    '''
+    :return: Devuelve los items de los dos proveedores. Los productos compartidos tienen la misma
+    referencia (sku) en ambos.
+    '''
+    random_state = random.Random(seed)
+    for index in range(0, num_articles):
+        brand = 'Brand {}'.format(index % num_brands)
+        name = product_name(random_state, index)
+        yield {'name' : name, 'provider' : 'dafiti', 'brand' : brand, 'line' : 'woman', 'price' : 100.0,
+               'sku' : 'P{}'.format(index)}
+
+        if random_state.random() < shared:
+            yield {'name' : rewrite_name(random_state, name), 'provider' : 'geelbe', 'brand' : brand.upper(),
+                   'line' : 'woman', 'price' : 100.0, 'sku' : 'P{}'.format(index)}
+        else:
+            number = num_articles + index
+            yield {'name' : product_name(random_state, number), 'provider' : 'geelbe', 'brand' : brand,
+                   'line' : 'woman', 'price' : 100.0, 'sku' : 'P{}'.format(number)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Measure article matching on a synthetic catalog')
+    parser.add_argument('--articles', type = int, default = 100000, help = 'Articles per provider')
+    parser.add_argument('--brands', type = int, default = 1000)
+    parser.add_argument('--shared', type = float, default = 0.5, help = 'Fraction of products on both providers')
+    parser.add_argument('--min-similarity', type = float, default = None)
+    args = parser.parse_args()
+
+    from config import global_config
+    global_config.set_value('OUTPUT_DATA_TO_SQLITE', join(mkdtemp(), 'articles.db'))
+
+    from db import db, db_session
+    from pipelines import DatabasePipeline
+    from entities.crawl_run import CrawlRun
+    from matching import match_articles
+
+    db.generate_mapping()
+    with db_session:
+        crawl = CrawlRun(spider = 'bench')
+        crawl.flush()
+        crawl_id = crawl.id
+
+    pipeline = DatabasePipeline()
+    pipeline.crawl_id = crawl_id
+    batch = []
+    for item in synthetic_items(args.articles, args.brands, args.shared):
+        batch.append(item)
+        if len(batch) == 1000:
+            pipeline.store_articles(batch)
+            batch = []
+    if len(batch) > 0:
+        pipeline.store_articles(batch)
+
+    min_similarity = args.min_similarity if args.min_similarity is not None else global_config.MATCHING_MIN_SIMILARITY
+    start_time = time.time()
+    num_matches = match_articles(min_similarity = min_similarity)
+    elapsed = time.time() - start_time
+
+    with db_session:
+        num_correct = db.select('SELECT COUNT(*) FROM ArticleMatch m JOIN Article a ON a.id = m.article '
+                                'JOIN Article o ON o.id = m.other WHERE a.sku = o.sku')[0]
+        num_shared = db.select("SELECT COUNT(*) FROM Article WHERE sku IN "
+                               "(SELECT sku FROM Article GROUP BY sku HAVING COUNT(*) > 1)")[0] // 2
+
+    print('{} articles per provider, {} brands, {} shared products'.format(args.articles, args.brands, num_shared))
+    print('{} matches in {:.1f}s ({:.0f} articles/s). Precision: {:.3f}, recall: {:.3f}'.format(
+        num_matches, elapsed, 2 * args.articles / elapsed, num_correct / max(num_matches, 1),
+        num_correct / max(num_shared, 1)))
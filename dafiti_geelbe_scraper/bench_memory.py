@@ -0,0 +1,155 @@
+'''
+Este script comprueba que el modo de memoria acotada (MEMORY_BOUNDED) escrapea un sitio grande
+con memoria constante. Escrapea un sitio sintético servido por un servidor HTTP local: --lists
+listados encadenados (cada uno enlaza al siguiente) con --products páginas de productos cada uno.
+
+Al terminar muestra la memoria residente del proceso a lo largo del escrapeo (ver
+extensions.MemorySnapshots). Termina con error si la memoria crece más de --max-growth MB desde
+que se ha escrapeado la cuarta parte del sitio, o si en modo de memoria acotada ninguna petición
+se ha guardado en disco (--max-queued es demasiado grande para el sitio). El test
+tests/test_extensions.py ejecuta este script con un sitio pequeño.
+
+Uso:
+    PYTHONPATH=dafiti_geelbe_scraper python dafiti_geelbe_scraper/bench_memory.py [--lists N]
+        [--products N] [--max-queued N] [--max-growth MB] [--interval SEGUNDOS] [--no-bounded]
+'''
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+import argparse
+import sys
+import re
+
+
+class SyntheticSiteRequestHandler(BaseHTTPRequestHandler):
+    '''
+    Sirve el sitio sintético:
+    - /list/<n>: Enlaces a los productos del listado y al listado n + 1 (si existe)
+    - /product/<n>/<i>: Nombre y precio del producto.
+    '''
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    num_lists = 0
+    num_products = 0
+
+    def do_GET(self):
+        match = re.match(r'^/(list|product)/(\d+)(?:/(\d+))?$', self.path)
+        if match is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        page, number = match.group(1), int(match.group(2))
+        if page == 'list':
+            links = ['<a class="product" href="/product/{}/{}">Product</a>'.format(number, index)
+                     for index in range(0, self.num_products)]
+            if number + 1 < self.num_lists:
+                links.append('<a class="next" href="/list/{}">Next</a>'.format(number + 1))
+            body = '<html><body>{}</body></html>'.format(''.join(links))
+        else:
+            body = '<html><body><h1>Product {}-{}</h1><span class="price">{}.99</span>{}</body></html>'.format(
+                number, match.group(3), number % 100, '<p>description</p>' * 200)
+
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def synthetic_site(num_lists, num_products):
+    SyntheticSiteRequestHandler.num_lists = num_lists
+    SyntheticSiteRequestHandler.num_products = num_products
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SyntheticSiteRequestHandler)
+    server.daemon_threads = True
+    Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+
+def crawl(url, bounded):
+    '''
+    Escrapea el sitio sintético.
+    :return: Devuelve las estadísticas de Scrapy.
+    '''
+    from scrapy.crawler import CrawlerProcess
+    from spiders.spider import Spider
+    from extensions import MemorySnapshots
+    from frontier import BoundedMemoryScheduler
+
+    class SyntheticSpider(Spider):
+        name = 'synthetic'
+
+        def start_requests(self):
+            yield self.request(url = url + '/list/0', callback = self.parse_list, request_type = 'listing',
+                               cb_kwargs = {'number' : 0})
+
+        def parse_list(self, response, number):
+            for product_url in response.css('a.product::attr(href)').extract():
+                yield self.request(url = response.urljoin(product_url), callback = self.parse_product,
+                                   request_type = 'leaf', cb_kwargs = {'list_number' : number})
+            next_url = response.css('a.next::attr(href)').extract_first()
+            if next_url is not None:
+                yield self.request(url = response.urljoin(next_url), callback = self.parse_list,
+                                   request_type = 'listing', cb_kwargs = {'number' : number + 1})
+
+        def parse_product(self, response, list_number):
+            yield {
+                'name' : response.css('h1::text').extract_first(),
+                'price' : response.css('span.price::text').extract_first(),
+                'list' : list_number
+            }
+
+    settings = {
+        'EXTENSIONS' : {MemorySnapshots : 520},
+        'CONCURRENT_REQUESTS' : 16,
+        'CONCURRENT_REQUESTS_PER_DOMAIN' : 16,
+        'LOG_LEVEL' : 'WARNING',
+        'TELNETCONSOLE_ENABLED' : False
+    }
+    if bounded:
+        settings['SCHEDULER'] = BoundedMemoryScheduler
+
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(SyntheticSpider)
+    process.crawl(crawler)
+    process.start()
+    return crawler.stats.get_stats()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Crawl a large synthetic site and check that memory stays constant')
+    parser.add_argument('--lists', type = int, default = 2000)
+    parser.add_argument('--products', type = int, default = 50)
+    parser.add_argument('--max-queued', type = int, default = 1000)
+    parser.add_argument('--max-growth', type = float, default = 32.0, help = 'Maximum RSS growth (MB)')
+    parser.add_argument('--interval', type = float, default = 5.0, help = 'Seconds between memory snapshots')
+    parser.add_argument('--no-bounded', action = 'store_true', help = 'Use the default in-memory scheduler')
+    args = parser.parse_args()
+
+    from config import global_config
+    global_config.set_value('MEMORY_MAX_QUEUED_REQUESTS', args.max_queued)
+    global_config.set_value('MEMORY_SNAPSHOT_INTERVAL', args.interval)
+
+    server = synthetic_site(args.lists, args.products)
+    stats = crawl('http://127.0.0.1:{}'.format(server.server_address[1]), bounded = not args.no_bounded)
+    server.shutdown()
+
+    snapshots = stats.get('memory/snapshots', [])
+    print('{} items, {} requests on disk. RSS (seconds, MB): {}'.format(
+        stats.get('item_scraped_count', 0), stats.get('scheduler/enqueued/disk', 0), snapshots))
+    if not args.no_bounded and stats.get('scheduler/enqueued/disk', 0) == 0:
+        print('No requests were queued on disk. Use a smaller --max-queued')
+        sys.exit(1)
+    if len(snapshots) < 4:
+        print('Not enough memory snapshots. Use a larger site or a shorter --interval')
+        sys.exit(1)
+
+    # La memoria puede crecer al principio (cachés, pools de conexiones...)
+    growth = snapshots[-1][1] - snapshots[len(snapshots) // 4][1]
+    print('RSS growth after warm-up: {:.1f}MB (max {:.1f}MB)'.format(growth, args.max_growth))
+    sys.exit(0 if growth <= args.max_growth else 1)
@@ -0,0 +1,156 @@
+'''
+Este script compara la velocidad de escrapeo (items por segundo) de la araña de Dafiti con 1 y con
+--shards procesos (ver shard.py). Escrapea un sitio que imita al de Dafiti servido por un servidor
+HTTP local: --brands marcas con iniciales repartidas entre todas las letras, 2 líneas por marca y
+--products productos por línea. --delay simula la latencia de la red en cada respuesta.
+
+Cada proceso escrapea las marcas de su rango de letras (DAFITI_BRAND_LETTERS, igual que shard.py)
+sin pipelines: Solo se mide el escrapeo. El tiempo incluye el arranque de los procesos. Termina
+con error si los fragmentos no escrapean exactamente los mismos items que un único proceso.
+
+Uso:
+    PYTHONPATH=dafiti_geelbe_scraper python dafiti_geelbe_scraper/bench_shard.py [--shards N]
+        [--brands N] [--products N] [--delay SEGUNDOS]
+'''
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from multiprocessing import cpu_count, get_context
+from threading import Thread
+from shard import BRAND_LETTERS, dafiti_shards
+import argparse
+import time
+import sys
+import re
+
+
+LINES = ['Mujer', 'Hombre']
+
+
+def brand_name(number):
+    '''
+    :return: Devuelve el nombre de la marca indicada. Las iniciales se reparten entre todas las
+    letras ('#' son las marcas que comienzan por un número)
+    '''
+    letter = BRAND_LETTERS[number % len(BRAND_LETTERS)]
+    return '{} Brand {}'.format(letter.upper() if letter != '#' else '1', number)
+
+
+class StandInSiteRequestHandler(BaseHTTPRequestHandler):
+    '''
+    Sirve el sitio que imita al de Dafiti:
+    - /marcas/: Listado de marcas.
+    - /brand/<n>: Líneas de productos de la marca.
+    - /brand/<n>/<línea>: Listado de productos de la marca en la línea.
+    '''
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    num_brands = 0
+    num_products = 0
+    delay = 0.0
+
+    def do_GET(self):
+        # Los enlaces a las marcas y a las líneas son absolutos, como en Dafiti.
+        url = 'http://{}'.format(self.headers['Host'])
+        match = re.match(r'^/brand/(\d+)(?:/(\d+))?$', self.path)
+        if self.path == '/marcas/':
+            body = ''.join(['<li class="brandsLetter"><a href="{}/brand/{}">{}</a></li>'.format(url, number, brand_name(number))
+                            for number in range(0, self.num_brands)])
+        elif match is not None and match.group(2) is None:
+            body = '<div class="fct-bd">{}</div>'.format(''.join(
+                ['<a href="{}/brand/{}/{}">{}</a>'.format(url, match.group(1), index, line) for index, line in enumerate(LINES)]))
+        elif match is not None:
+            body = '<ul>{}</ul>'.format(''.join([
+                '<li data-sku="SKU{0}-{1}-{2}"><div class="itm-product-main-info"><a href="/product/{0}/{1}/{2}">'
+                '<p class="itm-title">Product {0}-{1}-{2}</p></a><span class="itm-price">$ {3}.900</span></div></li>'.format(
+                    match.group(1), match.group(2), index, 10 + index % 90) for index in range(0, self.num_products)]))
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.delay > 0:
+            time.sleep(self.delay)
+        body = '<html><body>{}</body></html>'.format(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def stand_in_site(num_brands, num_products, delay):
+    StandInSiteRequestHandler.num_brands = num_brands
+    StandInSiteRequestHandler.num_products = num_products
+    StandInSiteRequestHandler.delay = delay
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInSiteRequestHandler)
+    server.daemon_threads = True
+    Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+
+def crawl_shard(args):
+    '''
+    Escrapea el sitio local con la araña de Dafiti (se ejecuta en un proceso distinto)
+    :param args: Es una tupla (url del sitio, variables de configuración del fragmento)
+    :return: Devuelve el número de items escrapeados.
+    '''
+    from scrapy.crawler import CrawlerProcess
+    from spiders.dafiti import DafitiSpider
+
+    url, shard_vars = args
+
+    class StandInDafitiSpider(DafitiSpider):
+        def request_brand_list(self):
+            return self.request(url = url + '/marcas/', callback = self.parse_brand_list, request_type = 'discovery')
+
+    process = CrawlerProcess({
+        'CONCURRENT_REQUESTS' : 16,
+        'CONCURRENT_REQUESTS_PER_DOMAIN' : 16,
+        'LOG_LEVEL' : 'WARNING',
+        'TELNETCONSOLE_ENABLED' : False
+    })
+    crawler = process.create_crawler(StandInDafitiSpider)
+    process.crawl(crawler, LOG_LEVEL = 'ERROR', **shard_vars)
+    process.start()
+    return crawler.stats.get_value('item_scraped_count', 0)
+
+
+def run(url, num_shards):
+    '''
+    Escrapea el sitio local repartido entre num_shards procesos.
+    :return: Devuelve una tupla (número de items, segundos)
+    '''
+    shards = dafiti_shards(num_shards) if num_shards > 1 else [{}]
+    start_time = time.time()
+    # Un proceso nuevo (spawn) por fragmento: El reactor de Twisted no puede reiniciarse.
+    with get_context('spawn').Pool(len(shards), maxtasksperchild = 1) as pool:
+        counts = pool.map(crawl_shard, [(url, shard_vars) for shard_vars in shards])
+    return sum(counts), time.time() - start_time
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Compare the Dafiti spider throughput with 1 and N shards')
+    parser.add_argument('--shards', type = int, default = cpu_count())
+    parser.add_argument('--brands', type = int, default = 200)
+    parser.add_argument('--products', type = int, default = 50)
+    parser.add_argument('--delay', type = float, default = 0.0, help = 'Seconds before each response')
+    args = parser.parse_args()
+
+    server = stand_in_site(args.brands, args.products, args.delay)
+    url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    results = {}
+    for num_shards in sorted(set([1, args.shards])):
+        num_items, elapsed = run(url, num_shards)
+        results[num_shards] = num_items
+        print('{} shards: {} items in {:.1f}s ({:.1f} items/s)'.format(num_shards, num_items, elapsed, num_items / elapsed))
+    server.shutdown()
+
+    expected = args.brands * len(LINES) * args.products
+    if any(num_items != expected for num_items in results.values()):
+        print('Expected {} items on every run'.format(expected))
+        sys.exit(1)
@@ -0,0 +1,74 @@
+'''
+Este script mide el tiempo de arranque del scraper en procesos nuevos, por etapas:
+
+- settings: Cargar los settings del proyecto (scrapy.cfg, settings.py)
+- spiders: Importar los módulos de las arañas (scrapy list)
+- spider: Crear el crawler y la araña indicada (scrapy crawl, antes de la primera petición)
+
+Para cada etapa muestra la mediana del tiempo acumulado desde el arranque y si la configuración
+del scraper (configs/*.conf.py) se ha cargado ya.
+
+Uso:
+    PYTHONPATH=dafiti_geelbe_scraper python dafiti_geelbe_scraper/bench_startup.py [--runs N] [--spider dafiti]
+'''
+
+from os.path import dirname, abspath
+from statistics import median
+import subprocess
+import argparse
+import json
+import sys
+import os
+
+
+def measure(spider_name):
+    '''
+    Mide las etapas del arranque en este proceso.
+    :return: Devuelve un listado de tuplas (etapa, segundos desde el arranque, configuración cargada)
+    '''
+    import time
+    start_time = time.time()
+    from scrapy.utils.project import get_project_settings
+    from scrapy.spiderloader import SpiderLoader
+    from scrapy.crawler import Crawler
+    import config
+
+    def config_loaded():
+        return config.DefaultConfig.singleton is not None
+
+    steps = []
+    settings = get_project_settings()
+    steps.append(('settings', time.time() - start_time, config_loaded()))
+
+    loader = SpiderLoader.from_settings(settings)
+    loader.list()
+    steps.append(('spiders', time.time() - start_time, config_loaded()))
+
+    crawler = Crawler(loader.load(spider_name), settings)
+    crawler._create_spider()
+    steps.append(('spider', time.time() - start_time, config_loaded()))
+    return steps
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Measure the scraper startup time')
+    parser.add_argument('--runs', type = int, default = 10)
+    parser.add_argument('--spider', default = 'dafiti')
+    parser.add_argument('--worker', action = 'store_true', help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.spider)))
+        sys.exit(0)
+
+    # scrapy.cfg está en el directorio padre del scraper.
+    project_dir = dirname(dirname(abspath(__file__)))
+    runs = []
+    for index in range(0, args.runs):
+        output = subprocess.run([sys.executable, '-W', 'ignore', abspath(__file__), '--worker', '--spider', args.spider],
+                                cwd = project_dir, env = dict(os.environ), stdout = subprocess.PIPE, check = True).stdout
+        runs.append(json.loads(output.decode().strip().splitlines()[-1]))
+
+    for index, (step, _, loaded) in enumerate(runs[0]):
+        seconds = median([run[index][1] for run in runs])
+        print('{:<10} {:>8.1f}ms  configuration {}'.format(step, seconds * 1000, 'loaded' if loaded else 'not loaded'))
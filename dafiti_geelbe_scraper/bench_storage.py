@@ -0,0 +1,198 @@
+'''
+Este script compara el rendimiento de los backends y perfiles de almacenamiento (ver storage.py)
+con un catálogo sintético de artículos:
+
+- insert: Artículos por segundo al cargar el catálogo por primera vez (bloques de --batch-size)
+- update: Artículos por segundo al cargarlo de nuevo con otros precios, mientras un lector
+consulta la base de datos. reads indica las consultas que ha completado el lector y read errors
+las que han fallado (por ejemplo, "database is locked" sin WAL)
+- by brand, prices, by name: Consultas por segundo de los artículos de una marca de un proveedor,
+del informe de precios (report.py) y de un artículo por nombre y proveedor.
+
+Con postgres se compara también la carga de la tabla staging con COPY (PostgresBackend) con la
+carga con executemany (la de StorageBackend)
+
+Cada configuración se ejecuta en un proceso distinto (pony solo puede enlazarse con una base de
+datos por proceso). El backend postgres usa la base de datos indicada, que se vacía: No debe
+usarse con una base de datos con datos reales.
+
+Uso:
+    PYTHONPATH=dafiti_geelbe_scraper python dafiti_geelbe_scraper/bench_storage.py [--articles N]
+        [--batch-size N] [--queries N] [--postgres-host HOST --postgres-database DB [--postgres-port P]
+        [--postgres-user U]]
+'''
+
+from tempfile import mkdtemp
+from functools import partial
+from os.path import join
+from threading import Thread, Event
+import subprocess
+import argparse
+import json
+import time
+import sys
+
+
+# Configuraciones comparadas: (nombre, variables de configuración)
+SQLITE_CONFIGS = [
+    ('sqlite default, no indexes', {'SQLITE_PROFILE' : 'default', 'STORAGE_CREATE_INDEXES' : False}),
+    ('sqlite default', {'SQLITE_PROFILE' : 'default', 'STORAGE_CREATE_INDEXES' : True}),
+    ('sqlite safe', {'SQLITE_PROFILE' : 'safe', 'STORAGE_CREATE_INDEXES' : True}),
+    ('sqlite fast', {'SQLITE_PROFILE' : 'fast', 'STORAGE_CREATE_INDEXES' : True})
+]
+
+
+def synthetic_items(num_articles, price_offset = 0.0):
+    '''
+    :return: Devuelve los items del catálogo sintético: 2 proveedores, 500 marcas y 3 líneas.
+    '''
+    for index in range(0, num_articles):
+        yield {
+            'name' : 'Product {}'.format(index // 2),
+            'provider' : ['dafiti', 'geelbe'][index % 2],
+            'brand' : 'Brand {}'.format(index % 500),
+            'line' : ['woman', 'man', 'child'][index % 3],
+            'price' : 1000.0 + index % 997 + price_offset,
+            'image' : 'http://example.com/{}.jpg'.format(index),
+            'sku' : 'SKU{}'.format(index)
+        }
+
+
+def run_config(config_vars, num_articles, batch_size, num_queries, staging = 'backend'):
+    '''
+    Ejecuta el benchmark con la configuración indicada (en este proceso)
+    :param staging: 'backend' para cargar la tabla staging como lo hace el backend, o
+    'executemany' para cargarla con executemany.
+    :return: Devuelve un diccionario con los resultados.
+    '''
+    from config import global_config
+    for var, value in config_vars.items():
+        global_config.set_value(var, value)
+
+    from db import db, db_session
+    from pipelines import DatabasePipeline
+    from entities.crawl_run import CrawlRun
+    from report import REPORT_QUERIES, REPORT_PARAMS
+    from storage import StorageBackend
+
+    db.generate_mapping()
+    backend = db.backend
+    if staging == 'executemany':
+        backend.load_staging_table = partial(StorageBackend.load_staging_table, backend)
+    with db_session:
+        if backend.name == 'postgres':
+            for table in ['PriceSnapshot', 'ArticleMatch', 'Article', 'CrawlRun']:
+                db.execute('DELETE FROM {}'.format(table))
+        crawl = CrawlRun(spider = 'bench')
+        crawl.flush()
+        crawl_id = crawl.id
+
+    pipeline = DatabasePipeline()
+    pipeline.crawl_id = crawl_id
+
+    def load(items):
+        start_time = time.time()
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == batch_size:
+                pipeline.store_articles(batch)
+                batch = []
+        if len(batch) > 0:
+            pipeline.store_articles(batch)
+        return num_articles / (time.time() - start_time)
+
+    results = {'insert' : load(synthetic_items(num_articles))}
+
+    # Un lector consulta el informe de precios mientras se actualizan los artículos.
+    stop = Event()
+    reads = {'ok' : 0, 'errors' : 0}
+    prices_query = REPORT_QUERIES['prices'].format(param = backend.param)
+
+    def reader():
+        connection = backend.connect_readonly()
+        while not stop.is_set():
+            try:
+                cursor = connection.cursor()
+                cursor.execute(prices_query, REPORT_PARAMS['prices']('dafiti', None, 100))
+                cursor.fetchall()
+                reads['ok'] += 1
+            except Exception:
+                reads['errors'] += 1
+                time.sleep(0.01)
+        connection.close()
+
+    thread = Thread(target = reader)
+    thread.start()
+    results['update'] = load(synthetic_items(num_articles, price_offset = 1.0))
+    stop.set()
+    thread.join()
+    results['reads'], results['read_errors'] = reads['ok'], reads['errors']
+
+    connection = backend.connect_readonly()
+    queries = {
+        'by_brand' : ('SELECT a.id, a.price FROM Article a WHERE a.provider = (SELECT id FROM Provider WHERE name = {param}) '
+                      'AND a.brand = (SELECT id FROM Brand WHERE name = {param})'.format(param = backend.param),
+                      lambda index: ('dafiti', 'Brand {}'.format(index % 500 // 2 * 2))),
+        'prices' : (prices_query, lambda index: REPORT_PARAMS['prices'](None, 'Brand {}'.format(index % 500), 100)),
+        'by_name' : ('SELECT a.id, a.price FROM Article a WHERE a.name = {param} AND '
+                     'a.provider = (SELECT id FROM Provider WHERE name = {param})'.format(param = backend.param),
+                     lambda index: ('Product {}'.format(index * 7 % (num_articles // 2)), 'geelbe'))
+    }
+    for name, (query, params) in queries.items():
+        start_time = time.time()
+        for index in range(0, num_queries):
+            cursor = connection.cursor()
+            cursor.execute(query, params(index))
+            cursor.fetchall()
+        results[name] = num_queries / (time.time() - start_time)
+    connection.close()
+    return results
+
+
+def format_results(name, results):
+    return '{:<31} {:>9.0f} {:>9.0f} {:>6} {:>6} {:>9.0f} {:>9.0f} {:>9.0f}'.format(
+        name, results['insert'], results['update'], results['reads'], results['read_errors'],
+        results['by_brand'], results['prices'], results['by_name'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Compare insert and query throughput across storage profiles')
+    parser.add_argument('--articles', type = int, default = 100000)
+    parser.add_argument('--batch-size', type = int, default = 500)
+    parser.add_argument('--queries', type = int, default = 500)
+    parser.add_argument('--postgres-host')
+    parser.add_argument('--postgres-port', type = int, default = 5432)
+    parser.add_argument('--postgres-user', default = 'postgres')
+    parser.add_argument('--postgres-password', default = '')
+    parser.add_argument('--postgres-database')
+    parser.add_argument('--worker', help = argparse.SUPPRESS)
+    parser.add_argument('--staging', default = 'backend', help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(run_config(json.loads(args.worker), args.articles, args.batch_size, args.queries, args.staging)))
+        sys.exit(0)
+
+    directory = mkdtemp()
+    configs = [(name, dict(config_vars, STORAGE_BACKEND = 'sqlite', OUTPUT_DATA_TO_SQLITE = join(directory, '{}.db'.format(index))),
+                'backend') for index, (name, config_vars) in enumerate(SQLITE_CONFIGS)]
+    if args.postgres_host is not None and args.postgres_database is not None:
+        postgres_vars = {
+            'STORAGE_BACKEND' : 'postgres', 'STORAGE_CREATE_INDEXES' : True,
+            'POSTGRES_HOST' : args.postgres_host, 'POSTGRES_PORT' : args.postgres_port,
+            'POSTGRES_USER' : args.postgres_user, 'POSTGRES_PASSWORD' : args.postgres_password,
+            'POSTGRES_DATABASE' : args.postgres_database
+        }
+        configs.append(('postgres (COPY + merge)', postgres_vars, 'backend'))
+        configs.append(('postgres (executemany + merge)', postgres_vars, 'executemany'))
+
+    print('{} articles, batches of {}, {} queries of each type'.format(args.articles, args.batch_size, args.queries))
+    print('{:<31} {:>9} {:>9} {:>6} {:>6} {:>9} {:>9} {:>9}'.format(
+        'config', 'insert/s', 'update/s', 'reads', 'errors', 'brand q/s', 'prices/s', 'name q/s'))
+    for name, config_vars, staging in configs:
+        output = subprocess.run([sys.executable, '-W', 'ignore', __file__, '--worker', json.dumps(config_vars),
+                                 '--articles', str(args.articles), '--batch-size', str(args.batch_size),
+                                 '--queries', str(args.queries), '--staging', staging],
+                                stdout = subprocess.PIPE, check = True).stdout
+        print(format_results(name, json.loads(output.decode().strip().splitlines()[-1])))
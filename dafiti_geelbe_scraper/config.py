@@ -1,9 +1,9 @@
 
-from copy import deepcopy
 from os.path import dirname, join, normpath, basename, isfile
 import importlib.util
 from re import match
-import inspect, sys
+from os import environ
+import sys
 
 class Config:
     '''
@@ -18,7 +18,9 @@ class Config:
         rutas relativas especificadas en las variables de configuración. Por defecto es
         el directorio padre de este script
         '''
-        self.vars = deepcopy(vars)
+        # Los valores de las variables son inmutables (booleanos, números, strings y rutas), por
+        # lo que basta con copiar el diccionario.
+        self.vars = dict(vars)
 
         config = self
         class PathProxy:
@@ -136,66 +138,117 @@ class Config:
     def check(self):
         '''
         Valida la configuración actual. Si la configuración actual no es válida, genera una
-        excepción
-        :return:
+        excepción.
+        Las variables deben estar declaradas en el esquema (SCHEMA). Los valores se convierten al
+        tipo de la variable si es necesario (por ejemplo, los indicados por línea de comandos)
         '''
         try:
-            # TODO
-            pass
+            for var, value in self.vars.items():
+                if var not in SCHEMA:
+                    raise ValueError('Unknown variable "{}"'.format(var))
+                self.vars[var] = SCHEMA[var].validate(var, value)
         except Exception as e:
             raise ValueError('Configuration is not valid: {}'.format(str(e)))
 
+
+    def freeze(self):
+        '''
+        Valida la configuración y devuelve una copia inmutable de la misma (instancia de la clase
+        FrozenConfig)
+        '''
+        config = self.copy()
+        config.check()
+        return FrozenConfig(config)
+
     def __str__(self):
         return str(self.vars)
 
 
 
 
+def get_profile():
+    '''
+    :return: Devuelve el nombre del perfil de configuración seleccionado (variable de entorno
+    SCRAPER_PROFILE) o None si no se ha seleccionado ninguno.
+    '''
+    profile = environ.get('SCRAPER_PROFILE', '').strip()
+    if profile in ['', 'default']:
+        return None
+    if not match('^\w+$', profile) or profile == 'local':
+        raise ValueError('Invalid configuration profile "{}"'.format(profile))
+    return profile
+
+
 class DefaultConfig:
     '''
     Es la configuración por defecto del dafiti_geelbe_scraper. Usa el patrón singleton.
     La configuración por defecto esta en el fichero "default.conf.py" en este mismo directorio.
+    El fichero no se carga hasta que se consulta la configuración por primera vez.
+
+    Sobre la configuración por defecto se aplican, en este orden:
+    - El perfil indicado en la variable de entorno SCRAPER_PROFILE (fichero configs/<perfil>.conf.py),
+    por ejemplo: SCRAPER_PROFILE=prod
+    - La configuración local, si existe (fichero configs/local.conf.py). No se guarda en el repositorio.
     '''
 
     class __Singleton(Config):
         def __init__(self):
             super().__init__()
-            self.override(Config.load_from_file(join(dirname(__file__), 'configs', 'default.conf.py')))
+            configs_dir = join(dirname(__file__), 'configs')
+            self.override(Config.load_from_file(join(configs_dir, 'default.conf.py')))
+
+            profile = get_profile()
+            if profile is not None:
+                profile_path = join(configs_dir, '{}.conf.py'.format(profile))
+                if not isfile(profile_path):
+                    raise ValueError('Configuration profile "{}" doesnt exist'.format(profile))
+                self.override(Config.load_from_file(profile_path))
+
+            local_path = join(configs_dir, 'local.conf.py')
+            if isfile(local_path):
+                self.override(Config.load_from_file(local_path))
 
     singleton = None
-    def __init__(self):
+
+    @staticmethod
+    def get_singleton():
         if DefaultConfig.singleton is None:
             DefaultConfig.singleton = DefaultConfig.__Singleton()
+        return DefaultConfig.singleton
 
     def __getattr__(self, item):
-        return getattr(DefaultConfig.singleton, item)
+        return getattr(DefaultConfig.get_singleton(), item)
 
     def __str__(self):
-        return str(DefaultConfig.singleton)
+        return str(DefaultConfig.get_singleton())
 
 
 class GlobalConfig:
     '''
     Esta clase representa la configuración global del dafiti_geelbe_scraper.
-    Usa el patrón singleton.
+    Usa el patrón singleton. Igual que DefaultConfig, se carga la primera vez que se consulta.
     '''
 
     class __Singleton(Config):
         def __init__(self):
             super().__init__()
             self.override(default_config)
+            self.check()
 
 
     singleton = None
-    def __init__(self):
+
+    @staticmethod
+    def get_singleton():
         if GlobalConfig.singleton is None:
             GlobalConfig.singleton = GlobalConfig.__Singleton()
+        return GlobalConfig.singleton
 
     def __getattr__(self, item):
-        return getattr(GlobalConfig.singleton, item)
+        return getattr(GlobalConfig.get_singleton(), item)
 
     def __str__(self):
-        return str(GlobalConfig.singleton)
+        return str(GlobalConfig.get_singleton())
 
 
 class Path:
@@ -203,7 +256,7 @@ class Path:
     Esta clase se usa para configurar rutas a ficheros en las variables de configuración.
     '''
     def __init__(self, file):
-        root_path = dirname(inspect.getfile(sys._getframe(1)))
+        root_path = dirname(sys._getframe(1).f_code.co_filename)
         self.path = normpath(join(root_path, file))
         #if not isfile(self.path):
         #    raise ValueError('File "{}" doesnt exist'.format(self.path))
@@ -215,6 +268,242 @@ class Path:
         return repr(self.path)
 
 
+class Variable:
+    '''
+    Declaración de una variable de configuración en el esquema.
+    '''
+    def __init__(self, type, nullable = False, choices = None, ignore_case = False, min = None):
+        '''
+        Inicializa la instancia.
+        :param type: Es el tipo de la variable: bool, int, float, str o Path
+        :param nullable: Indica si la variable puede ser None (o no establecerse)
+        :param choices: Es un listado opcional con los posibles valores de la variable.
+        :param ignore_case: Si es True, los valores se comparan con choices sin distinguir
+        mayúsculas de minúsculas.
+        :param min: Es el valor mínimo de la variable (variables numéricas)
+        '''
+        self.type, self.nullable = type, nullable
+        self.choices, self.ignore_case, self.min = choices, ignore_case, min
+
+
+    def convert(self, value):
+        '''
+        Convierte un valor al tipo de esta variable. Los strings (por ejemplo, indicados por línea
+        de comandos) se convierten al tipo adecuado.
+        '''
+        if self.type is bool:
+            if isinstance(value, bool):
+                return value
+            if isinstance(value, str) and value.lower() in ['true', 'yes', '1', 'false', 'no', '0']:
+                return value.lower() in ['true', 'yes', '1']
+        elif self.type in (int, float):
+            if isinstance(value, str):
+                return self.type(value)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                if self.type is int and value != int(value):
+                    raise ValueError('expected an integer, got {}'.format(value))
+                return self.type(value)
+        elif self.type is Path:
+            if isinstance(value, (str, Path)):
+                return value
+        elif isinstance(value, self.type):
+            return value
+        raise ValueError('expected {}, got {}'.format(self.type.__name__, repr(value)))
+
+
+    def validate(self, var, value):
+        '''
+        Valida el valor de la variable cuyo nombre se indica como parámetro.
+        :return: Devuelve el valor convertido al tipo de la variable.
+        '''
+        if isinstance(value, str) and self.nullable and value == 'None':
+            value = None
+        if value is None:
+            if not self.nullable:
+                raise ValueError('Variable "{}" must be set'.format(var))
+            return None
+
+        try:
+            value = self.convert(value)
+        except ValueError as e:
+            raise ValueError('Invalid value for variable "{}": {}'.format(var, e))
+
+        if self.choices is not None:
+            choices = [choice.lower() if self.ignore_case and isinstance(choice, str) else choice for choice in self.choices]
+            if (value.lower() if self.ignore_case else value) not in choices:
+                raise ValueError('Invalid value for variable "{}": {}. Possible values: {}'.format(
+                    var, repr(value), ', '.join([repr(choice) for choice in self.choices])))
+        if self.min is not None and value < self.min:
+            raise ValueError('Invalid value for variable "{}": must be at least {}'.format(var, self.min))
+        return value
+
+
+# Esquema de la configuración. Todas las variables de configuración (ficheros configs/*.conf.py
+# y argumentos de las arañas) deben declararse aquí.
+SCHEMA = {
+    # Salida de datos
+    'STORAGE_BACKEND' : Variable(str, choices = ['sqlite', 'postgres']),
+    'STORAGE_BATCH_SIZE' : Variable(int, min = 1),
+    'STORAGE_CREATE_INDEXES' : Variable(bool),
+    'OUTPUT_DATA_TO_SQLITE' : Variable(Path, nullable = True),
+    'SQLITE_PROFILE' : Variable(str, choices = ['default', 'safe', 'fast']),
+    'SQLITE_JOURNAL_MODE' : Variable(str, nullable = True, ignore_case = True,
+                                     choices = ['DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF']),
+    'SQLITE_SYNCHRONOUS' : Variable(str, nullable = True, ignore_case = True, choices = ['OFF', 'NORMAL', 'FULL', 'EXTRA']),
+    'SQLITE_CACHE_SIZE' : Variable(int, nullable = True),
+    'SQLITE_MMAP_SIZE' : Variable(int, nullable = True, min = 0),
+    'SQLITE_BUSY_TIMEOUT' : Variable(int, nullable = True, min = 0),
+    'POSTGRES_HOST' : Variable(str),
+    'POSTGRES_PORT' : Variable(int, min = 1),
+    'POSTGRES_USER' : Variable(str),
+    'POSTGRES_PASSWORD' : Variable(str),
+    'POSTGRES_DATABASE' : Variable(str),
+    'OUTPUT_DATA_TO_FEED' : Variable(Path, nullable = True),
+    'FEED_FORMAT' : Variable(str, choices = ['jsonl', 'csv']),
+    'FEED_COMPRESSION' : Variable(str, nullable = True, choices = ['gzip', 'zstd']),
+    'FEED_ROTATE_BYTES' : Variable(int, nullable = True, min = 1),
+    'FEED_ROTATE_ITEMS' : Variable(int, nullable = True, min = 1),
+    'FEED_FLUSH_INTERVAL' : Variable(float, min = 0),
+    'OUTPUT_EXPORT_DIR' : Variable(Path, nullable = True),
+    'EXPORT_FORMAT' : Variable(str, choices = ['parquet', 'arrow']),
+    'EXPORT_ROW_GROUP_SIZE' : Variable(int, min = 1),
+    'MATCHING_MIN_SIMILARITY' : Variable(float, min = 0),
+    'OUTPUT_DELTA_DIR' : Variable(Path, nullable = True),
+    'REPORT_CACHE_DIR' : Variable(Path, nullable = True),
+    'REPORT_STALE_CRAWL_HOURS' : Variable(float, min = 0),
+    'API_HOST' : Variable(str),
+    'API_PORT' : Variable(int, min = 0),
+    'API_POOL_SIZE' : Variable(int, min = 1),
+    'API_CACHE_SIZE' : Variable(int, min = 1),
+    'API_MAX_LIMIT' : Variable(int, min = 1),
+    'OUTPUT_IMAGES_DIR' : Variable(Path, nullable = True),
+    'IMAGES_CONCURRENCY' : Variable(int, min = 1),
+    'IMAGES_THUMBNAIL_SIZES' : Variable(str, nullable = True),
+
+    # Escrapeo
+    'PRIORITIZE_LEAF_REQUESTS' : Variable(bool),
+    'ITEM_MILESTONES' : Variable(str, nullable = True),
+
+    'DAFITI_EXTRACTION_MODE' : Variable(str, choices = ['html', 'json']),
+
+    # Fragmentos del escrapeo (ver shard.py)
+    'DAFITI_BRAND_LETTERS' : Variable(str, nullable = True),
+    'GEELBE_LINES' : Variable(str, nullable = True),
+    'GEELBE_PAGE_OFFSET' : Variable(int, min = 0),
+    'GEELBE_PAGE_STEP' : Variable(int, min = 1),
+
+    # Modo de muestreo (ver sampling.py)
+    'SAMPLE_SEED' : Variable(int, nullable = True),
+    'SAMPLE_SIZE' : Variable(int, min = 1),
+    'SAMPLE_GEELBE_MAX_PAGE' : Variable(int, min = 1),
+    'SAMPLE_MAX_ITEMS' : Variable(int, nullable = True, min = 1),
+    'SAMPLE_MAX_SECONDS' : Variable(float, nullable = True, min = 0),
+    'SAMPLE_MIN_SUCCESS_RATE' : Variable(float, min = 0),
+
+    # Vigilancia de la extracción de items (ver middlewares.py)
+    'EXTRACTION_HEALTH_WINDOW' : Variable(int, min = 1),
+    'EXTRACTION_HEALTH_MIN_PAGES' : Variable(int, min = 1),
+    'EXTRACTION_HEALTH_MIN_ITEM_RATE' : Variable(float, min = 0),
+    'EXTRACTION_HEALTH_ACTION' : Variable(str, choices = ['abort', 'throttle', 'log']),
+    'EXTRACTION_HEALTH_THROTTLE_DELAY' : Variable(float, min = 0),
+
+    # Presupuestos de tamaño de las respuestas (ver middlewares.py)
+    'RESPONSE_MAX_SIZE_LISTING' : Variable(int, nullable = True, min = 1),
+    'RESPONSE_MAX_SIZE_PRODUCT' : Variable(int, nullable = True, min = 1),
+    'RESPONSE_MAX_SIZE_LAZYLOAD' : Variable(int, nullable = True, min = 1),
+    'RESPONSE_MAX_SIZE_SPLASH' : Variable(int, nullable = True, min = 1),
+
+    # Frontera compartida (ver frontier.py)
+    'FRONTIER_BROKER' : Variable(str, nullable = True, choices = ['local', 'redis']),
+    'FRONTIER_QUEUE' : Variable(str, nullable = True),
+    'FRONTIER_LOCAL_PATH' : Variable(Path),
+    'FRONTIER_REDIS_URL' : Variable(str),
+    'FRONTIER_LEASE_SECONDS' : Variable(float, min = 1),
+
+    # Modo de memoria acotada (ver frontier.py y extensions.py)
+    'MEMORY_BOUNDED' : Variable(bool),
+    'MEMORY_MAX_QUEUED_REQUESTS' : Variable(int, min = 1),
+    'MEMORY_QUEUE_PATH' : Variable(Path),
+    'MEMORY_SNAPSHOT_INTERVAL' : Variable(float, nullable = True, min = 1),
+
+    # Logs y depuración
+    'LOG_LEVEL' : Variable(str, ignore_case = True, choices = ['INFO', 'WARNING', 'ERROR', 'DEBUG']),
+    'OUTPUT_LOGS_TO_STDOUT' : Variable(bool),
+    'OUTPUT_GEELBE_SPIDER_LOG' : Variable(Path, nullable = True),
+    'OUTPUT_DAFITI_SPIDER_LOG' : Variable(Path, nullable = True),
+    'OUTPUT_PONY_LOGS_TO_STDOUT' : Variable(bool),
+
+    # Ejecución
+    'CONCURRENT_REQUESTS' : Variable(int, min = 1),
+    'CONCURRENT_REQUESTS_PER_DOMAIN' : Variable(int, min = 1),
+    'DOWNLOAD_DELAY' : Variable(float, min = 0),
+    'DOWNLOADER_HTTP2' : Variable(bool),
+    'SPLASH_PROXY_URL' : Variable(str),
+    'SPLASH_CONCURRENCY' : Variable(int, min = 1),
+    'SPLASH_TIMEOUT' : Variable(float, min = 0)
+}
+
+
+class FrozenConfig:
+    '''
+    Es una configuración validada e inmutable. Cada variable del esquema es un atributo (slot)
+    de la instancia, por lo que el acceso es directo. Las rutas (config.path.X) también se
+    calculan una única vez.
+    Tiene los mismos métodos de consulta que la clase Config.
+    '''
+    __slots__ = ['path'] + list(SCHEMA.keys())
+
+    class PathValues:
+        __slots__ = list(SCHEMA.keys())
+
+    def __init__(self, config):
+        '''
+        Inicializa la instancia.
+        :param config: Es una configuración validada (instancia de la clase Config)
+        '''
+        paths = FrozenConfig.PathValues()
+        for var in SCHEMA:
+            object.__setattr__(self, var, config.get_value(var))
+            setattr(paths, var, config.get_path(var))
+        object.__setattr__(self, 'path', paths)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('Configuration is frozen')
+
+    def copy(self):
+        '''
+        :return: Devuelve una copia modificable de esta configuración (instancia de la clase Config)
+        '''
+        return Config(self.vars)
+
+    @property
+    def vars(self):
+        return dict([(var, getattr(self, var)) for var in SCHEMA if getattr(self, var) is not None])
+
+    def get_value(self, var, default = None):
+        value = getattr(self, var, None)
+        return default if value is None else value
+
+    def has_value(self, var, value):
+        return self.get_value(var) == value
+
+    def is_set(self, var):
+        return self.get_value(var) is not None
+
+    def is_true(self, var):
+        return self.has_value(var, True)
+
+    def get_path(self, var, default = None):
+        value = getattr(self.path, var, None)
+        return default if value is None else value
+
+    def check(self):
+        pass
+
+    def __str__(self):
+        return str(self.vars)
+
+
 def path(*args, **kwargs):
     '''
     Es un shortcut del constructor de clase Path.
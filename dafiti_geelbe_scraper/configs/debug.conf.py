@@ -6,4 +6,13 @@ y establecerla a True (para activar el modo depuración)
 
 OUTPUT_LOGS_TO_STDOUT = True
 OUTPUT_PONY_LOGS_TO_STDOUT = True
-LOG_LEVEL = 'DEBUG'
\ No newline at end of file
+LOG_LEVEL = 'DEBUG'
+
+# -----------------------------------------------
+# CONFIGURACIÓN DE EJECUCIÓN DEL SCRAPER
+# -----------------------------------------------
+
+CONCURRENT_REQUESTS = 4
+CONCURRENT_REQUESTS_PER_DOMAIN = 2
+STORAGE_BATCH_SIZE = 20
+SPLASH_CONCURRENCY = 1
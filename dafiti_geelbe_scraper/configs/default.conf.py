@@ -7,15 +7,198 @@ from config import path
 
 # -----------------------------------------------
 # CONFIGURACIÓN DE ESCRAPEO
-# TODO
+
+# Las peticiones de páginas que generan items se procesan antes que las de páginas de
+# descubrimiento (marcas, líneas, listados)
+PRIORITIZE_LEAF_REQUESTS = True
+
+# Se guarda en las estadísticas de las arañas el tiempo que se tarda en obtener este número de
+# items (números separados por comas). e.g: items/time_to_1000
+ITEM_MILESTONES = '1,100,1000,10000'
+
+# Modo de extracción de los productos de los listados de Dafiti. Posibles valores:
+# 'json' (datos estructurados JSON-LD incluidos en la página, completados con los productos del HTML;
+# si no los tiene, se usa solo el HTML), 'html' (selectores sobre el HTML del listado, no extrae la imagen)
+DAFITI_EXTRACTION_MODE = 'json'
+
+# Rangos de letras iniciales de las marcas de Dafiti que se escrapean, separados por comas.
+# '#' representa las marcas que no comienzan por una letra. e.g: 'a-f,#'. None para escrapear todas.
+DAFITI_BRAND_LETTERS = None
+
+# Líneas de Geelbe que se escrapean, separadas por comas ('woman', 'man', 'child'). None para
+# escrapear todas.
+GEELBE_LINES = None
+
+# Páginas de los listados de productos de Geelbe que se escrapean: Se comienza por la página
+# 1 + GEELBE_PAGE_OFFSET y se avanza de GEELBE_PAGE_STEP en GEELBE_PAGE_STEP páginas.
+GEELBE_PAGE_OFFSET = 0
+GEELBE_PAGE_STEP = 1
+
+# Semilla del modo de muestreo (canary, ver sampling.py). Si no es None, solo se escrapea una
+# muestra determinista del catálogo: SAMPLE_SIZE marcas de Dafiti (estratificadas por letra
+# inicial) o SAMPLE_SIZE páginas de cada línea de Geelbe (entre las SAMPLE_GEELBE_MAX_PAGE primeras)
+SAMPLE_SEED = None
+SAMPLE_SIZE = 20
+SAMPLE_GEELBE_MAX_PAGE = 50
+
+# El escrapeo en modo de muestreo termina al obtener SAMPLE_MAX_ITEMS items o tras
+# SAMPLE_MAX_SECONDS segundos (None para no limitar)
+SAMPLE_MAX_ITEMS = 500
+SAMPLE_MAX_SECONDS = 120
+
+# Porcentaje mínimo (entre 0 y 1) de páginas de productos de las que deben extraerse items en
+# modo de muestreo. Si no se alcanza, el informe de la muestra se muestra como error.
+SAMPLE_MIN_SUCCESS_RATE = 0.9
+
+# Vigilancia de la extracción de items: Si de menos del EXTRACTION_HEALTH_MIN_ITEM_RATE (entre 0 y 1)
+# de las últimas EXTRACTION_HEALTH_WINDOW páginas de productos de un callback se extraen items
+# (y se han procesado al menos EXTRACTION_HEALTH_MIN_PAGES), se aplica la acción
+# EXTRACTION_HEALTH_ACTION. Posibles valores: 'abort' (termina el escrapeo),
+# 'throttle' (el retardo entre peticiones pasa a ser EXTRACTION_HEALTH_THROTTLE_DELAY segundos), 'log'
+EXTRACTION_HEALTH_WINDOW = 200
+EXTRACTION_HEALTH_MIN_PAGES = 50
+EXTRACTION_HEALTH_MIN_ITEM_RATE = 0.5
+EXTRACTION_HEALTH_ACTION = 'abort'
+EXTRACTION_HEALTH_THROTTLE_DELAY = 5.0
+
+# Tamaño máximo (bytes, descomprimido) de las respuestas según el tipo de página: Listados,
+# páginas de productos, listados de Geelbe (lazyLoad) y páginas renderizadas por Splash. Las
+# respuestas más grandes se descartan sin terminar de descargarlas o descomprimirlas.
+# None para no limitar el tamaño.
+RESPONSE_MAX_SIZE_LISTING = 4 * 1024 * 1024
+RESPONSE_MAX_SIZE_PRODUCT = 2 * 1024 * 1024
+RESPONSE_MAX_SIZE_LAZYLOAD = 1024 * 1024
+RESPONSE_MAX_SIZE_SPLASH = 8 * 1024 * 1024
+
+# Cola de peticiones compartida por varias arañas (ver frontier.py). Posibles valores: None (cada
+# araña tiene su propia cola), 'local' (fichero sqlite FRONTIER_LOCAL_PATH, varios procesos del
+# mismo equipo), 'redis' (servidor FRONTIER_REDIS_URL, varios equipos)
+FRONTIER_BROKER = None
+
+# Nombre de la cola compartida. None para usar el nombre de la araña. Al terminar el escrapeo,
+# la cola se vacía (peticiones y huellas); si se interrumpe, se conserva para continuarlo.
+FRONTIER_QUEUE = None
+
+# Fichero sqlite del broker 'local' y url del servidor del broker 'redis'
+FRONTIER_LOCAL_PATH = path('data/frontier.db')
+FRONTIER_REDIS_URL = 'redis://localhost:6379/0'
+
+# Segundos durante los que una araña toma prestada una petición de la cola compartida. Si no la
+# procesa antes, la petición vuelve a la cola.
+FRONTIER_LEASE_SECONDS = 300.0
+
+# Modo de memoria acotada (ver frontier.BoundedMemoryScheduler): Solo se mantienen en memoria las
+# MEMORY_MAX_QUEUED_REQUESTS peticiones pendientes de mayor prioridad. El resto, y las huellas de
+# las peticiones ya vistas, se guardan en el fichero sqlite MEMORY_QUEUE_PATH.
+MEMORY_BOUNDED = False
+MEMORY_MAX_QUEUED_REQUESTS = 1000
+MEMORY_QUEUE_PATH = path('data/memory_queue.db')
+
+# Cada MEMORY_SNAPSHOT_INTERVAL segundos se guarda en las estadísticas de la araña la memoria usada
+# por el proceso y el número de peticiones, respuestas e items vivos (memory/*). None para no
+# guardarla.
+MEMORY_SNAPSHOT_INTERVAL = 30.0
+
 # -----------------------------------------------
 
 # -----------------------------------------------
 # CONFIGURACIÓN DE SALIDA DE DATOS
 
-# Fichero de base de datos sqlite de salida de los datos escrapeados.
+# Backend de almacenamiento de los datos escrapeados. Posibles valores: 'sqlite', 'postgres'
+STORAGE_BACKEND = 'sqlite'
+
+# Número de artículos que se guardan en la base de datos en cada bloque.
+STORAGE_BATCH_SIZE = 500
+
+# Crea el índice de cobertura (provider, brand, line, price) de los artículos. Lo usan las
+# consultas por proveedor y los informes de precios. Pony crea los índices de brand y line.
+STORAGE_CREATE_INDEXES = True
+
+# Fichero de base de datos sqlite de salida de los datos escrapeados (backend 'sqlite')
 OUTPUT_DATA_TO_SQLITE = path('data/articles.db')
 
+# Perfil de configuración de la base de datos sqlite. Posibles valores:
+# 'default' (valores por defecto de sqlite), 'safe' (WAL, synchronous = FULL),
+# 'fast' (WAL, synchronous = NORMAL, caché y mmap más grandes)
+# Los modos con WAL permiten leer la base de datos mientras las arañas escriben en ella.
+SQLITE_PROFILE = 'fast'
+
+# Sobrecargan los valores del perfil de sqlite (None para usar el valor del perfil)
+SQLITE_JOURNAL_MODE = None
+SQLITE_SYNCHRONOUS = None
+SQLITE_CACHE_SIZE = None
+SQLITE_MMAP_SIZE = None
+SQLITE_BUSY_TIMEOUT = None
+
+# Conexión a la base de datos PostgreSQL (backend 'postgres'). Requiere el paquete psycopg2
+POSTGRES_HOST = 'localhost'
+POSTGRES_PORT = 5432
+POSTGRES_USER = 'scraper'
+POSTGRES_PASSWORD = ''
+POSTGRES_DATABASE = 'articles'
+
+# Directorio donde se escriben los items escrapeados en formato JSON lines o CSV (feed).
+# Si es None, no se escribe el feed.
+OUTPUT_DATA_TO_FEED = None
+
+# Formato de los ficheros del feed. Posibles valores: 'jsonl', 'csv'
+FEED_FORMAT = 'jsonl'
+
+# Compresión de los ficheros del feed. Posibles valores: None, 'gzip', 'zstd' (requiere el paquete zstandard)
+FEED_COMPRESSION = 'gzip'
+
+# Se crea un nuevo fichero del feed cuando el actual supera este tamaño en bytes (None para no rotar por tamaño)
+FEED_ROTATE_BYTES = 64 * 1024 * 1024
+
+# Se crea un nuevo fichero del feed cuando el actual tiene este número de items (None para no rotar por items)
+FEED_ROTATE_ITEMS = None
+
+# Número máximo de segundos sin vaciar los datos del feed al fichero.
+FEED_FLUSH_INTERVAL = 1.0
+
+# Directorio donde se escribe, al terminar cada escrapeo, un feed JSON lines con los cambios del
+# catálogo: Artículos nuevos, eliminados y cambios de precio. Si es None, no se escribe.
+OUTPUT_DELTA_DIR = None
+
+# Directorio de salida de la exportación de artículos a ficheros columnares (export.py)
+OUTPUT_EXPORT_DIR = path('data/export')
+
+# Formato de la exportación de artículos. Posibles valores: 'parquet', 'arrow'
+EXPORT_FORMAT = 'parquet'
+
+# Número de filas de cada grupo de filas de los ficheros exportados.
+EXPORT_ROW_GROUP_SIZE = 65536
+
+# Similitud mínima (entre 0 y 1) de los nombres de dos artículos de distintos proveedores de la
+# misma marca para considerar que son el mismo producto (ver matching.py)
+MATCHING_MIN_SIMILARITY = 0.6
+
+# Directorio de la caché de resultados de los informes (ver report.py). None para no usar caché.
+REPORT_CACHE_DIR = path('data/report_cache')
+
+# Las ejecuciones de las arañas sin terminar que comenzaron hace más de estas horas se consideran
+# abortadas: No impiden usar la caché de los informes ni la de la API (ver report.data_version)
+REPORT_STALE_CRAWL_HOURS = 24.0
+
+# API HTTP de solo lectura de los artículos (ver api.py): Dirección, número de conexiones a la
+# base de datos, número de respuestas en caché y número máximo de artículos por página.
+API_HOST = '127.0.0.1'
+API_PORT = 8080
+API_POOL_SIZE = 4
+API_CACHE_SIZE = 1024
+API_MAX_LIMIT = 500
+
+# Directorio del almacén de imágenes de los artículos (ver images.py). Si es None, no se descargan
+# las imágenes.
+OUTPUT_IMAGES_DIR = None
+
+# Número máximo de descargas de imágenes simultáneas.
+IMAGES_CONCURRENCY = 4
+
+# Tamaños (en píxeles, separados por comas) de las miniaturas de las imágenes. Requiere el paquete
+# Pillow. None para no generar miniaturas.
+IMAGES_THUMBNAIL_SIZES = '128,512'
+
 # -----------------------------------------------
 
 
@@ -46,4 +229,18 @@ OUTPUT_PONY_LOGS_TO_STDOUT = False
 # -----------------------------------------------
 
 # Establece la url del proxy usado para prcoesar el código javascript de las páginas.
-SPLASH_PROXY_URL = 'http://localhost:8050'
\ No newline at end of file
+SPLASH_PROXY_URL = 'http://localhost:8050'
+
+# Número máximo de páginas que Splash renderiza a la vez (slot de descarga "splash") y segundos
+# máximos de renderizado de cada página.
+SPLASH_CONCURRENCY = 2
+SPLASH_TIMEOUT = 60.0
+
+# Número máximo de peticiones simultáneas (en total y a cada servidor) y segundos de espera entre
+# peticiones consecutivas al mismo servidor. Los perfiles (prod, debug) sobrecargan estos valores.
+CONCURRENT_REQUESTS = 16
+CONCURRENT_REQUESTS_PER_DOMAIN = 8
+DOWNLOAD_DELAY = 0.0
+
+# Usa HTTP/2 (varias peticiones simultáneas por conexión) en las peticiones https.
+DOWNLOADER_HTTP2 = False
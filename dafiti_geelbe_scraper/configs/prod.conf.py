@@ -10,4 +10,10 @@ Configuración adicional del proyecto para entorno de producción
 # CONFIGURACIÓN DE EJECUCIÓN DEL SCRAPER
 # -----------------------------------------------
 
-SPLASH_PROXY_URL = 'http://splashproxy.herokuapp.com:80'
\ No newline at end of file
+SPLASH_PROXY_URL = 'http://splashproxy.herokuapp.com:80'
+
+CONCURRENT_REQUESTS = 32
+CONCURRENT_REQUESTS_PER_DOMAIN = 16
+STORAGE_BATCH_SIZE = 2000
+SPLASH_CONCURRENCY = 5
+SPLASH_TIMEOUT = 90.0
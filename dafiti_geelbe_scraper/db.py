@@ -2,40 +2,59 @@
 import pony
 from pony.orm import Database as PonyDatabase, set_sql_debug
 from config import global_config
-from os import remove
-from os.path import exists
+from storage import get_storage_backend
 
 class Database:
     '''
     Representa una base de datos.
     Antes de interactuar con el esquema, debe invocarse el método generate_mapping
-    para generar el mapeado orm a la base de datos sqlite.
+    para generar el mapeado orm a la base de datos.
+    El proveedor de la base de datos depende del backend de almacenamiento (variable de
+    configuración STORAGE_BACKEND). Por defecto es sqlite. La base de datos se enlaza al generar
+    el mapeado: Importar los módulos de las entidades no carga la configuración.
     '''
     class __Singleton(PonyDatabase):
         def __init__(self):
-            db_path = global_config.path.OUTPUT_DATA_TO_SQLITE
+            super().__init__()
+            self.backend = None
+            self.mapping_generated = False
+
+        def generate_mapping(self, create_tables = True, config = global_config, **kwargs):
+            '''
+            Enlaza la base de datos con el backend de almacenamiento y genera el mapeado.
+            :param config: Es la configuración de la que se leen el backend y sus parámetros.
+            '''
+            # El mapeado solo se genera una vez por proceso, aunque haya varias arañas.
+            if self.mapping_generated:
+                return
+            self.mapping_generated = True
 
-            #if exists(db_path):
-            #    remove(db_path)
+            self.backend = get_storage_backend(config)
+            self.backend.bind(self)
 
             logs_enabled = all([
-                global_config.path.OUTPUT_DATA_TO_SQLITE,
-                global_config.OUTPUT_PONY_LOGS_TO_STDOUT,
-                global_config.LOG_LEVEL.lower() in ['debug', 'warning', 'error']
+                config.path.OUTPUT_DATA_TO_SQLITE,
+                config.OUTPUT_PONY_LOGS_TO_STDOUT,
+                config.LOG_LEVEL.lower() in ['debug', 'warning', 'error']
             ])
-
-            super().__init__()
-            super().bind(provider='sqlite', filename=db_path, create_db=True)
-
             set_sql_debug(logs_enabled)
 
-            self.mapping_generated = False
-
-        def generate_mapping(self, create_tables = True, **kwargs):
             # Antes de generar el mapeado, importamos las entidades del modelo.
+            from entities.brand import Brand
+            from entities.line import Line
+            from entities.provider import Provider
+            from entities.crawl_run import CrawlRun
             from entities.article import Article
+            from entities.price_snapshot import PriceSnapshot
+            from entities.article_match import ArticleMatch
             super().generate_mapping(create_tables = create_tables, **kwargs)
 
+            with pony.orm.db_session:
+                # Pony no permite índices con atributos float. Ver PriceSnapshot.biggest_drops
+                self.execute('CREATE INDEX IF NOT EXISTS idx_pricesnapshot__crawl_change ON PriceSnapshot (crawl, change)')
+                if config.is_true('STORAGE_CREATE_INDEXES'):
+                    self.backend.create_indexes(self)
+
     singleton = None
     def __init__(self):
         if self.singleton is None:
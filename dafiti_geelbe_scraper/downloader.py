@@ -0,0 +1,78 @@
+'''
+Este script define el manejador de descargas HTTP(S) del scraper. Es el manejador HTTP/1.1 de
+Scrapy (pool de CONCURRENT_REQUESTS_PER_DOMAIN conexiones persistentes por servidor), que además
+registra métricas de las conexiones en las estadísticas de la araña:
+- downloader/connections/requests: Peticiones que han pedido una conexión al pool.
+- downloader/connections/new: Conexiones nuevas.
+- downloader/connections/reuse_ratio: Porcentaje de peticiones que reutilizan una conexión.
+- downloader/connections/connect_time_avg: Tiempo medio (segundos) de establecimiento de las
+conexiones nuevas.
+
+Un pool más grande que CONCURRENT_REQUESTS_PER_DOMAIN no mejora el rendimiento: Nunca hay más
+conexiones simultáneas con un servidor (ver bench_downloader.py)
+
+Si DOWNLOADER_HTTP2 es True, las peticiones https usan el manejador HTTP/2 de Scrapy (varias
+peticiones simultáneas por conexión). Ver settings.py
+'''
+
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from twisted.web.client import HTTPConnectionPool
+import time
+
+
+class MeteredConnectionPool(HTTPConnectionPool):
+    '''
+    Pool de conexiones de Twisted que cuenta las conexiones nuevas y reutilizadas.
+    '''
+    def __init__(self, reactor, stats = None):
+        super().__init__(reactor, persistent = True)
+        self.stats = stats
+        self.num_requests = 0
+        self.num_connections = 0
+        self.connect_time = 0.0
+
+    def getConnection(self, key, endpoint):
+        # Si hay una conexión libre con el servidor, se reutiliza. Si no, se crea (_newConnection)
+        self.num_requests += 1
+        deferred = super().getConnection(key, endpoint)
+        self.update_stats()
+        return deferred
+
+    def _newConnection(self, key, endpoint):
+        self.num_connections += 1
+        start_time = time.time()
+
+        def connected(connection):
+            self.connect_time += time.time() - start_time
+            self.update_stats()
+            return connection
+
+        return super()._newConnection(key, endpoint).addCallback(connected)
+
+    def update_stats(self):
+        if self.stats is None:
+            return
+        self.stats.set_value('downloader/connections/requests', self.num_requests)
+        self.stats.set_value('downloader/connections/new', self.num_connections)
+        self.stats.set_value('downloader/connections/reuse_ratio',
+                             round(1 - self.num_connections / self.num_requests, 4) if self.num_requests > 0 else 0.0)
+        if self.num_connections > 0:
+            self.stats.set_value('downloader/connections/connect_time_avg', round(self.connect_time / self.num_connections, 4))
+
+
+class MeteredHTTP11DownloadHandler(HTTP11DownloadHandler):
+    '''
+    Manejador de descargas HTTP/1.1 con métricas de conexión.
+    '''
+    def __init__(self, settings, crawler = None):
+        super().__init__(settings, crawler)
+        from twisted.internet import reactor
+
+        # Mismo pool que el de HTTP11DownloadHandler
+        self._pool = MeteredConnectionPool(reactor, stats = crawler.stats if crawler is not None else None)
+        self._pool.maxPersistentPerHost = settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN')
+        self._pool._factory.noisy = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler)
@@ -1,6 +1,10 @@
 
 from .entity import Entity, EntityMixins
-from pony.orm import PrimaryKey, Required, Optional, composite_key
+from .brand import Brand
+from .line import Line
+from .provider import Provider
+from .crawl_run import CrawlRun
+from pony.orm import PrimaryKey, Required, Optional, Set, composite_key
 import scrapy
 from item_processors import *
 from scrapy.loader.processors import TakeFirst
@@ -14,10 +18,21 @@ class Article(Entity, EntityMixins):
     id = PrimaryKey(int, auto=True)
     price = Required(float)
     name = Required(str)
-    line = Required(str)
-    brand = Required(str)
-    provider = Required(str)
+    line = Required(Line)
+    brand = Required(Brand)
+    # Las consultas por proveedor usan el índice (provider, brand, line, price). Ver storage.ARTICLE_INDEXES
+    provider = Required(Provider, index = False)
     image = Optional(str)
+    # Referencia del artículo en la tienda del proveedor y precio sin descuento (si se conocen)
+    sku = Optional(str)
+    list_price = Optional(float)
+    # Primera y última ejecución de las arañas en la que se encontró el artículo.
+    first_seen = Optional(CrawlRun, reverse = 'new_articles')
+    last_seen = Optional(CrawlRun, reverse = 'articles')
+    snapshots = Set('PriceSnapshot')
+    # Artículos de otros proveedores que corresponden al mismo producto (ver matching.py)
+    matches = Set('ArticleMatch', reverse = 'article')
+    matched_by = Set('ArticleMatch', reverse = 'other')
     composite_key(name, provider)
 
 
@@ -29,5 +44,5 @@ class Article(Entity, EntityMixins):
         brand = scrapy.Field(input_processor = NameFormatter(), output_processor = TakeFirst(), mandatory = True)
         provider = scrapy.Field(output_processor = TakeFirst(), mandatory = True)
         image = scrapy.Field(output_processor = TakeFirst(), mandatory = False)
-
-
+        sku = scrapy.Field(output_processor = TakeFirst(), mandatory = False)
+        list_price = scrapy.Field(input_processor = ToFloat(), output_processor = TakeFirst(), mandatory = False)
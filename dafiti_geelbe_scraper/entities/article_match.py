@@ -0,0 +1,17 @@
+
+from .entity import Entity, EntityMixins
+from pony.orm import PrimaryKey, Required, composite_index
+
+class ArticleMatch(Entity, EntityMixins):
+    '''
+    Relaciona dos artículos de distintos proveedores que corresponden al mismo producto
+    (ver matching.py). article es el artículo del primer proveedor y other el del segundo.
+    '''
+
+    # Definición de atributos de la entidad (Base de datos)
+    article = Required('Article', reverse = 'matches')
+    other = Required('Article', reverse = 'matched_by')
+    # Similitud de los nombres de los artículos (coseno TF-IDF, entre 0 y 1)
+    similarity = Required(float)
+    PrimaryKey(article, other)
+    composite_index(other, article)
@@ -0,0 +1,13 @@
+
+from .entity import Entity, EntityMixins, LookupEntityMixins
+from pony.orm import PrimaryKey, Required, Set
+
+class Brand(Entity, EntityMixins, LookupEntityMixins):
+    '''
+    Representa la entidad Marca. Es una tabla de diccionario referenciada por los artículos.
+    '''
+
+    # Definición de atributos de la entidad (Base de datos)
+    id = PrimaryKey(int, auto=True)
+    name = Required(str, unique=True)
+    articles = Set('Article')
@@ -0,0 +1,22 @@
+
+from .entity import Entity, EntityMixins
+from pony.orm import PrimaryKey, Required, Optional, Set
+from datetime import datetime
+
+class CrawlRun(Entity, EntityMixins):
+    '''
+    Representa una ejecución de una de las arañas (un escrapeo completo de un proveedor)
+    '''
+
+    # Definición de atributos de la entidad (Base de datos)
+    id = PrimaryKey(int, auto=True)
+    spider = Required(str)
+    started = Required(datetime, default = datetime.now)
+    finished = Optional(datetime)
+    # Si es True, la ejecución no ha escrapeado todo el catálogo (ver Spider.is_partial_crawl) o no
+    # ha terminado normalmente. No se usa como ejecución anterior al calcular el feed de cambios.
+    partial = Required(bool, default = False)
+    snapshots = Set('PriceSnapshot')
+    # Artículos encontrados por última vez (articles) o por primera vez (new_articles) en esta ejecución.
+    articles = Set('Article', reverse = 'last_seen')
+    new_articles = Set('Article', reverse = 'first_seen')
@@ -34,4 +34,40 @@ class EntityMixins:
         entity = cls(**fields)
         return entity
 
+
+class LookupEntityMixins:
+    '''
+    Mixin para las entidades que actúan como tablas de diccionario (marcas, líneas, proveedores...)
+    Cada valor de texto se guarda una única vez y el resto de entidades lo referencian por su id.
+    Mantiene una caché en memoria (nombre -> id) para que no sea necesaria una consulta por cada
+    item procesado.
+    '''
+    _interned = {}
+
+    @classmethod
+    def intern(cls, name):
+        '''
+        Devuelve el id de la entidad con el nombre indicado. Si no existe, se crea.
+        Debe invocarse dentro de una sesión de base de datos (db_session)
+        :param name: Es el nombre (marca, línea, proveedor...)
+        :return: Devuelve el id de la entidad.
+        '''
+        cache = LookupEntityMixins._interned.setdefault(cls.__name__, {})
+        if name not in cache:
+            entity = cls.get(name = name)
+            if entity is None:
+                entity = cls(name = name)
+                entity.flush()
+            cache[name] = entity.id
+        return cache[name]
+
+
+    @classmethod
+    def clear_interned(cls):
+        '''
+        Vacía la caché de nombres de esta entidad. Debe invocarse si se deshace una transacción
+        en la que se hayan creado nuevas entidades.
+        '''
+        LookupEntityMixins._interned.pop(cls.__name__, None)
+
 Entity = db.Entity
\ No newline at end of file
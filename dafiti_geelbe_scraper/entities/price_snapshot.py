@@ -0,0 +1,47 @@
+
+from .entity import Entity, EntityMixins
+from .crawl_run import CrawlRun
+from pony.orm import PrimaryKey, Required, Optional, select
+
+class PriceSnapshot(Entity, EntityMixins):
+    '''
+    Representa el precio de un artículo en una ejecución de las arañas. Solo se guarda un
+    nuevo registro cuando el precio cambia respecto al último escrapeo (o la primera vez que
+    se encuentra el artículo)
+    '''
+
+    # Definición de atributos de la entidad (Base de datos)
+    article = Required('Article')
+    crawl = Required(CrawlRun)
+    price = Required(float)
+    previous_price = Optional(float)
+    # Diferencia price - previous_price. Es None si no hay precio anterior.
+    change = Optional(float)
+    PrimaryKey(article, crawl)
+    # Pony no permite índices con atributos float: El índice (crawl, change) se crea después de
+    # generar el mapeado (ver db.py)
+
+
+    @classmethod
+    def price_history(cls, article):
+        '''
+        :param article: Es un artículo (o su id)
+        :return: Devuelve los precios del artículo ordenados de más antiguo a más reciente.
+        Resuelto con la clave primaria (article, crawl)
+        '''
+        article_id = article if isinstance(article, int) else article.id
+        return select(snapshot for snapshot in cls if snapshot.article.id == article_id).order_by(
+            lambda snapshot: snapshot.crawl.id)[:]
+
+
+    @classmethod
+    def biggest_drops(cls, crawl, limit = 100):
+        '''
+        :param crawl: Es la ejecución de las arañas (o su id)
+        :param limit: Es el número máximo de resultados.
+        :return: Devuelve los artículos cuyo precio más ha bajado en la ejecución indicada,
+        respecto de la anterior. Resuelto con el índice (crawl, change)
+        '''
+        crawl_id = crawl if isinstance(crawl, int) else crawl.id
+        return select(snapshot for snapshot in cls if snapshot.crawl.id == crawl_id and snapshot.change < 0).order_by(
+            lambda snapshot: snapshot.change)[:limit]
@@ -0,0 +1,175 @@
+'''
+Este script exporta los artículos de la base de datos a ficheros en formato columnar
+(Parquet o Arrow IPC) para que puedan analizarse sin recorrer la base de datos fila a fila.
+
+Los artículos se leen por bloques y se escriben en grupos de filas de tamaño acotado, por lo
+que la memoria usada no depende del tamaño del catálogo. Las columnas brand, line y provider se
+codifican como diccionarios.
+
+Los ficheros se particionan por proveedor y fecha de la última ejecución en la que se
+encontró el artículo:
+    <directorio de salida>/provider=dafiti/crawl_date=2017-06-01/articles.parquet
+
+Requiere el paquete pyarrow.
+
+Uso:
+    PYTHONPATH=dafiti_geelbe_scraper python dafiti_geelbe_scraper/export.py [--format parquet|arrow]
+        [--output directorio] [--row-group-size N]
+'''
+
+from config import global_config
+from db import db, db_session
+from os import makedirs
+from os.path import join
+import argparse
+
+
+EXPORT_QUERY = '''
+    SELECT a.id, a.name, b.name, l.name, p.name, a.price, a.image, c.started
+    FROM Article a
+        JOIN Brand b ON b.id = a.brand
+        JOIN Line l ON l.id = a.line
+        JOIN Provider p ON p.id = a.provider
+        LEFT JOIN CrawlRun c ON c.id = a.last_seen
+    ORDER BY a.provider, a.last_seen
+'''
+
+EXPORT_COLUMNS = ['id', 'name', 'brand', 'line', 'provider', 'price', 'image']
+
+# Extensión de los ficheros según el formato.
+EXPORT_EXTENSIONS = {
+    'parquet' : 'parquet',
+    'arrow' : 'arrow'
+}
+
+
+class ColumnarWriter:
+    '''
+    Escribe los artículos de una partición en un fichero Parquet o Arrow IPC, por grupos de filas.
+    Cada columna codificada como diccionario tiene un único diccionario por fichero, que crece con
+    cada grupo de filas: Arrow IPC no permite reemplazar un diccionario, solo ampliarlo (deltas)
+    '''
+    def __init__(self, file_path, format):
+        import pyarrow as pa
+
+        self.pa = pa
+        self.schema = pa.schema([
+            ('id', pa.int64()),
+            ('name', pa.string()),
+            ('brand', pa.dictionary(pa.int32(), pa.string())),
+            ('line', pa.dictionary(pa.int32(), pa.string())),
+            ('provider', pa.dictionary(pa.int32(), pa.string())),
+            ('price', pa.float64()),
+            ('image', pa.string())
+        ])
+
+        self.dictionaries = dict([(field.name, {}) for field in self.schema if pa.types.is_dictionary(field.type)])
+
+        if format == 'parquet':
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(file_path, self.schema, compression = 'zstd')
+        else:
+            self.writer = pa.ipc.new_file(file_path, self.schema,
+                                          options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas = True))
+
+    def write(self, rows):
+        '''
+        Escribe un grupo de filas.
+        :param rows: Tuplas con los valores de las columnas EXPORT_COLUMNS
+        '''
+        pa = self.pa
+        columns = list(zip(*rows))
+        arrays = []
+        for field, values in zip(self.schema, columns):
+            if pa.types.is_dictionary(field.type):
+                dictionary = self.dictionaries[field.name]
+                indices = [None if value is None else dictionary.setdefault(value, len(dictionary)) for value in values]
+                arrays.append(pa.DictionaryArray.from_arrays(pa.array(indices, type = field.type.index_type),
+                                                             pa.array(list(dictionary.keys()), type = pa.string())))
+            else:
+                arrays.append(pa.array(values, type = field.type))
+        batch = pa.RecordBatch.from_arrays(arrays, schema = self.schema)
+        self.writer.write_table(pa.Table.from_batches([batch]))
+
+    def close(self):
+        self.writer.close()
+
+
+def crawl_date(started):
+    '''
+    :return: Devuelve la fecha (YYYY-MM-DD) de una ejecución de las arañas. El valor puede ser
+    una fecha o un string según el proveedor de la base de datos.
+    '''
+    if started is None:
+        return 'unknown'
+    return str(started)[:10]
+
+
+@db_session
+def export_articles(output_dir, format = 'parquet', row_group_size = 65536):
+    '''
+    Exporta todos los artículos de la base de datos.
+    :param output_dir: Es el directorio de salida.
+    :param format: Es el formato de los ficheros: 'parquet' o 'arrow'
+    :param row_group_size: Es el número de filas de cada grupo de filas. También es el número
+    máximo de filas que se mantienen en memoria.
+    :return: Devuelve un diccionario con el número de artículos exportados por fichero.
+    '''
+    if format not in EXPORT_EXTENSIONS:
+        raise ValueError('Invalid export format "{}"'.format(format))
+
+    connection = db.get_connection()
+    cursor = db.backend.streaming_cursor(connection)
+    cursor.execute(EXPORT_QUERY)
+
+    files = {}
+    partition, writer, rows = None, None, []
+
+    def flush():
+        if len(rows) > 0:
+            writer.write(rows)
+            del rows[:]
+
+    while True:
+        block = cursor.fetchmany(row_group_size)
+        if len(block) == 0:
+            break
+
+        for row in block:
+            row_partition = (row[4], crawl_date(row[7]))
+
+            # Como las filas están ordenadas, solo hay un fichero abierto a la vez.
+            if row_partition != partition:
+                if writer is not None:
+                    flush()
+                    writer.close()
+                partition = row_partition
+                directory = join(output_dir, 'provider={}'.format(partition[0]), 'crawl_date={}'.format(partition[1]))
+                makedirs(directory, exist_ok = True)
+                file_path = join(directory, 'articles.{}'.format(EXPORT_EXTENSIONS[format]))
+                writer = ColumnarWriter(file_path, format)
+                files[file_path] = 0
+
+            rows.append(row[:7])
+            files[file_path] += 1
+            if len(rows) >= row_group_size:
+                flush()
+
+    if writer is not None:
+        flush()
+        writer.close()
+    cursor.close()
+    return files
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Export scraped articles to columnar files')
+    parser.add_argument('--format', default = global_config.EXPORT_FORMAT or 'parquet', choices = list(EXPORT_EXTENSIONS.keys()))
+    parser.add_argument('--output', default = global_config.path.OUTPUT_EXPORT_DIR)
+    parser.add_argument('--row-group-size', type = int, default = global_config.EXPORT_ROW_GROUP_SIZE or 65536)
+    args = parser.parse_args()
+
+    db.generate_mapping()
+    files = export_articles(args.output, format = args.format, row_group_size = args.row_group_size)
+    for file_path, count in sorted(files.items()):
+        print('{}: {} articles'.format(file_path, count))
@@ -0,0 +1,205 @@
+'''
+Este script define extensiones de Scrapy para el dafiti_geelbe_scraper.
+'''
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from sampling import percentile
+from collections import deque
+import time
+import sys
+
+
+class ItemMilestones:
+    '''
+    Guarda en las estadísticas de la araña los segundos que se tarda en obtener un número
+    determinado de items (variable de configuración ITEM_MILESTONES). e.g: items/time_to_1000
+    '''
+    def __init__(self, stats, milestones):
+        self.stats = stats
+        self.milestones = sorted(milestones)
+        self.start_time = None
+        self.num_items = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        # Scrapy crea las extensiones después de crear la araña.
+        config = crawler.spider.get_config()
+        milestones = [int(milestone) for milestone in (config.ITEM_MILESTONES or '').split(',') if milestone.strip()]
+        extension = cls(crawler.stats, milestones)
+        crawler.signals.connect(extension.spider_opened, signal = signals.spider_opened)
+        crawler.signals.connect(extension.item_scraped, signal = signals.item_scraped)
+        return extension
+
+    def spider_opened(self, spider):
+        self.start_time = time.time()
+        self.num_items = 0
+
+    def item_scraped(self, item, spider):
+        self.num_items += 1
+        if len(self.milestones) > 0 and self.num_items == self.milestones[0]:
+            self.milestones.pop(0)
+            self.stats.set_value('items/time_to_{}'.format(self.num_items), round(time.time() - self.start_time, 3),
+                                 spider = spider)
+
+
+class SamplingReport:
+    '''
+    Extensión del modo de muestreo (ver sampling.py). Solo tiene efecto si la araña tiene
+    establecida la variable SAMPLE_SEED:
+    - Termina el escrapeo al obtener SAMPLE_MAX_ITEMS items o tras SAMPLE_MAX_SECONDS segundos.
+    - Al terminar, guarda en las estadísticas (sample/*) y muestra en el log de la araña el
+    porcentaje de páginas de productos (peticiones de tipo 'leaf') de las que se han extraído
+    items y la latencia de las peticiones por tipo.
+    '''
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.enabled = False
+        self.timeout = None
+
+        # Latencias de las respuestas por tipo de petición.
+        self.latencies = {}
+        self.leaf_pages = set()
+        self.leaf_pages_with_items = set()
+        self.num_items = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        extension = cls(crawler)
+        crawler.signals.connect(extension.spider_opened, signal = signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal = signals.spider_closed)
+        crawler.signals.connect(extension.response_received, signal = signals.response_received)
+        crawler.signals.connect(extension.item_scraped, signal = signals.item_scraped)
+        return extension
+
+    def spider_opened(self, spider):
+        config = spider.get_config()
+        self.enabled = config.is_set('SAMPLE_SEED')
+        if not self.enabled:
+            return
+
+        if config.is_set('SAMPLE_MAX_SECONDS'):
+            from twisted.internet import reactor
+            self.timeout = reactor.callLater(config.SAMPLE_MAX_SECONDS, self.close_spider, spider, 'sample_timeout')
+
+    def close_spider(self, spider, reason):
+        self.timeout = None
+        self.crawler.engine.close_spider(spider, reason)
+
+    def response_received(self, response, request, spider):
+        if not self.enabled:
+            return
+        request_type = request.meta.get('request_type', 'unknown')
+        self.latencies.setdefault(request_type, []).append(request.meta.get('download_latency', 0.0))
+        if request_type == 'leaf':
+            self.leaf_pages.add(request.url)
+
+    def item_scraped(self, item, response, spider):
+        if not self.enabled:
+            return
+        self.num_items += 1
+        self.leaf_pages_with_items.add(response.url)
+
+        max_items = spider.get_config().SAMPLE_MAX_ITEMS
+        if max_items is not None and self.num_items == max_items:
+            self.close_spider(spider, 'sample_item_count')
+
+    def spider_closed(self, spider, reason):
+        if not self.enabled:
+            return
+        if self.timeout is not None and self.timeout.active():
+            self.timeout.cancel()
+
+        stats = self.crawler.stats
+        num_pages = len(self.leaf_pages)
+        success_rate = len(self.leaf_pages_with_items & self.leaf_pages) / num_pages if num_pages > 0 else 0.0
+        stats.set_value('sample/items', self.num_items, spider = spider)
+        stats.set_value('sample/leaf_pages', num_pages, spider = spider)
+        stats.set_value('sample/success_rate', round(success_rate, 4), spider = spider)
+
+        lines = ['Sample finished ({}). {} items from {} product pages. Success rate: {:.1%}'.format(
+            reason, self.num_items, num_pages, success_rate)]
+        for request_type, latencies in sorted(self.latencies.items()):
+            p50, p95 = percentile(latencies, 0.5), percentile(latencies, 0.95)
+            stats.set_value('sample/latency_p50/{}'.format(request_type), round(p50, 3), spider = spider)
+            stats.set_value('sample/latency_p95/{}'.format(request_type), round(p95, 3), spider = spider)
+            lines.append('{} requests: {}, latency p50: {:.3f}s, p95: {:.3f}s'.format(
+                request_type, len(latencies), p50, p95))
+
+        # Se muestra el informe como error si no se extraen items de suficientes páginas.
+        if success_rate < spider.get_config().SAMPLE_MIN_SUCCESS_RATE:
+            spider.log.error('{}', '\n'.join(lines))
+        else:
+            spider.log.warning('{}', '\n'.join(lines))
+
+
+def get_rss():
+    '''
+    :return: Devuelve la memoria residente (RSS) del proceso en bytes. Si el sistema no tiene
+    /proc, devuelve el máximo alcanzado.
+    '''
+    from os import sysconf
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss está en bytes en macOS y en KiB en el resto de sistemas.
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class MemorySnapshots:
+    '''
+    Cada MEMORY_SNAPSHOT_INTERVAL segundos guarda en las estadísticas de la araña:
+    - memory/rss, memory/rss_max: Memoria residente del proceso (bytes), actual y máxima.
+    - memory/rss_growth: Crecimiento de la memoria desde la primera instantánea.
+    - memory/live/<clase>: Número de peticiones, respuestas, items y selectores vivos.
+    - memory/snapshots: Listado con las últimas instantáneas (segundos, MB de memoria residente)
+    Al terminar se toma una última instantánea.
+    '''
+    def __init__(self, crawler, interval):
+        self.crawler = crawler
+        self.interval = interval
+        self.task = None
+        self.start_time = None
+        self.start_rss = None
+        self.snapshots = deque(maxlen = 100)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        interval = crawler.spider.get_config().MEMORY_SNAPSHOT_INTERVAL
+        if interval is None:
+            raise NotConfigured()
+        extension = cls(crawler, interval)
+        crawler.signals.connect(extension.spider_opened, signal = signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal = signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        from twisted.internet.task import LoopingCall
+
+        self.start_time = time.time()
+        self.task = LoopingCall(self.snapshot, spider)
+        self.task.start(self.interval, now = True)
+
+    def spider_closed(self, spider, reason):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        self.snapshot(spider)
+
+    def snapshot(self, spider):
+        from scrapy.utils.trackref import live_refs
+
+        stats = self.crawler.stats
+        rss = get_rss()
+        if self.start_rss is None:
+            self.start_rss = rss
+        self.snapshots.append((round(time.time() - self.start_time, 1), round(rss / (1024 * 1024), 1)))
+
+        stats.set_value('memory/rss', rss, spider = spider)
+        stats.max_value('memory/rss_max', rss, spider = spider)
+        stats.set_value('memory/rss_growth', rss - self.start_rss, spider = spider)
+        stats.set_value('memory/snapshots', list(self.snapshots), spider = spider)
+        for cls, references in live_refs.items():
+            stats.set_value('memory/live/{}'.format(cls.__name__), len(references), spider = spider)
@@ -0,0 +1,269 @@
+'''
+Este script define especificaciones declarativas de extracción de datos: Para cada campo se
+indica un selector CSS o XPath, opcionalmente una expresión regular, y procesadores que se
+aplican al valor extraído.
+
+Los selectores se compilan una única vez (al importar el módulo) a objetos XPath de lxml, por
+lo que extraer un campo no requiere traducir ni analizar el selector de nuevo. Las
+especificaciones de Dafiti y Geelbe están al final del script: Si cambia el marcado de una de
+las páginas, basta con modificar su especificación.
+
+También define la extracción de productos de los datos estructurados (JSON-LD) que incluyen
+las páginas. Si está instalado el paquete orjson, se usa para decodificarlos.
+'''
+
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+from item_loader import MissingFieldError
+import re
+
+try:
+    import orjson
+    decode_json = orjson.loads
+except ImportError:
+    import json
+    decode_json = json.loads
+
+
+# Traductor de selectores CSS a XPath. Admite los pseudo-elementos ::text y ::attr(nombre)
+css_translator = HTMLTranslator()
+
+
+class Regex:
+    '''
+    Procesador que devuelve el primer grupo de una expresión regular aplicada al valor, o None si
+    no coincide.
+    '''
+    def __init__(self, pattern, flags = re.DOTALL, search = False):
+        '''
+        Inicializa la instancia.
+        :param search: Si es True, la expresión regular puede coincidir en cualquier parte del
+        valor. Si es False, debe coincidir al principio.
+        '''
+        self.regex = re.compile(pattern, flags)
+        self.function = self.regex.search if search else self.regex.match
+
+    def __call__(self, value):
+        match = self.function(value)
+        return match.group(1) if match else None
+
+
+def parse_price(value):
+    '''
+    Normaliza un precio con separadores de miles y decimales a un número con punto decimal.
+    Una coma separa los decimales; un punto seguido de grupos de 3 cifras separa los miles.
+    e.g: parse_price('129.900') = '129900', parse_price('1.299.900,50') = '1299900.50',
+    parse_price('129.90') = '129.90'
+    '''
+    value = value.strip()
+    if ',' in value:
+        return value.replace('.', '').replace(',', '.')
+    if re.match(r'^\d{1,3}(\.\d{3})+$', value):
+        return value.replace('.', '')
+    return value
+
+
+class MissingContainerError(MissingFieldError):
+    '''
+    Se genera cuando ningún elemento de una página coincide con el selector de los elementos de los
+    que se extraen los items. El atributo field es el selector, para que ExtractionHealthMiddleware
+    lo muestre como cualquier otro campo que no se encuentra.
+    '''
+    def __init__(self, selector):
+        ValueError.__init__(self, 'No elements match "{}"'.format(selector))
+        self.field = selector
+
+
+class Field:
+    '''
+    Especificación de extracción de un campo.
+    '''
+    def __init__(self, css = None, xpath = None, regex = None, join = None, source = None,
+                 processors = [], required = False):
+        '''
+        Inicializa la instancia.
+        :param css: Es el selector CSS del campo.
+        :param xpath: Es la expresión XPath del campo (si no se indica el selector CSS)
+        :param regex: Si se indica, se aplica a cada valor seleccionado y el valor del campo es el
+        primer grupo de la primera coincidencia (igual que Selector.re_first)
+        :param join: Si se indica, el valor del campo son todos los valores seleccionados, unidos
+        con este separador. Si no, el valor es el primero.
+        :param source: Si se indica, el campo no se selecciona de la página, sino que se obtiene
+        del valor de otro campo de la especificación (declarado antes)
+        :param processors: Funciones que se aplican en orden al valor. Si alguna devuelve None,
+        el valor del campo es None.
+        :param required: Si es True, se genera MissingFieldError si el valor del campo es None.
+        '''
+        if css is not None:
+            xpath = css_translator.css_to_xpath(css)
+        self.xpath = etree.XPath(xpath) if xpath is not None else None
+        self.regex = Regex(regex) if regex is not None else None
+        self.join, self.source = join, source
+        self.processors = list(processors)
+        self.required = required
+
+    def select(self, node):
+        '''
+        :param node: Es el nodo de lxml a partir del cual se evalúa la expresión XPath.
+        :return: Devuelve el valor del campo seleccionado en el nodo, sin procesar.
+        '''
+        values = [value if isinstance(value, str) else etree.tostring(value, encoding = 'unicode', method = 'html', with_tail = False)
+                  for value in self.xpath(node)]
+
+        if self.regex is not None:
+            values = [value for value in map(self.regex, values) if value is not None]
+        if self.join is not None:
+            return self.join.join(values)
+        return values[0] if len(values) > 0 else None
+
+    def process(self, value):
+        for processor in self.processors:
+            if value is None:
+                break
+            value = processor(value)
+        return value
+
+
+class ExtractionSpec:
+    '''
+    Especificación de extracción de un item: Diccionario nombre del campo -> Field
+    '''
+    def __init__(self, fields):
+        self.fields = list(fields.items())
+
+    def extract(self, selector):
+        '''
+        Extrae los campos de la especificación.
+        :param selector: Es un selector de Scrapy (o una respuesta). Los campos se evalúan a partir
+        de su nodo.
+        :return: Devuelve un diccionario con los valores de los campos (None si no se encuentran)
+        '''
+        node = selector.root if hasattr(selector, 'root') else selector.selector.root
+        values = {}
+        for name, field in self.fields:
+            value = values.get(field.source) if field.source is not None else field.select(node)
+            value = field.process(value)
+            if value is None and field.required:
+                raise MissingFieldError(name)
+            values[name] = value
+        return values
+
+
+
+# Scripts de datos estructurados JSON-LD de una página.
+# Los textos son cadenas str normales (orjson no admite las subclases de str de lxml)
+JSON_LD_SCRIPTS = etree.XPath('//script[@type = "application/ld+json"]/text()', smart_strings = False)
+
+
+def json_ld_objects(data):
+    '''
+    Recorre un documento JSON-LD (listas, @graph, listados de items...)
+    :return: Devuelve un generador con todos los objetos (diccionarios) del documento.
+    '''
+    if isinstance(data, list):
+        for value in data:
+            yield from json_ld_objects(value)
+    elif isinstance(data, dict):
+        yield data
+        for value in data.values():
+            if isinstance(value, (list, dict)):
+                yield from json_ld_objects(value)
+
+
+def json_ld_products(selector):
+    '''
+    Extrae los productos (objetos de tipo Product) de los datos estructurados JSON-LD de una página.
+    Los scripts que no son JSON válido se ignoran.
+    :param selector: Es un selector de Scrapy o una respuesta.
+    :return: Devuelve un listado de diccionarios con los campos name, sku, url, image, price y list_price
+    '''
+    node = selector.root if hasattr(selector, 'root') else selector.selector.root
+    products = []
+    for script in JSON_LD_SCRIPTS(node):
+        try:
+            data = decode_json(script)
+        except ValueError:
+            continue
+
+        for value in json_ld_objects(data):
+            # @type puede ser un tipo o un listado de tipos
+            types = value.get('@type')
+            if not (types == 'Product' or (isinstance(types, list) and 'Product' in types)):
+                continue
+
+            # Las ofertas pueden ser un objeto o un listado. Si es un rango de precios (AggregateOffer),
+            # el precio es el menor y el precio sin descuento el mayor.
+            offers = value.get('offers') or {}
+            if isinstance(offers, list):
+                offers = offers[0] if len(offers) > 0 else {}
+            image = value.get('image')
+            if isinstance(image, list):
+                image = image[0] if len(image) > 0 else None
+            if isinstance(image, dict):
+                image = image.get('url')
+
+            products.append({
+                'name' : value.get('name'),
+                'sku' : str(value['sku']) if value.get('sku') is not None else None,
+                'url' : value.get('url', offers.get('url')),
+                'image' : image,
+                'price' : offers.get('price', offers.get('lowPrice')),
+                'list_price' : offers.get('highPrice')
+            })
+    return products
+
+
+def merge_products(products, other_products, keys = ('sku', 'url')):
+    '''
+    Combina dos listados de productos de una misma página (e.g: los de los datos estructurados y
+    los del HTML). Dos productos son el mismo si coincide alguno de los campos keys (no vacío). Los
+    campos de products tienen prioridad; los que no tienen valor se completan con los del producto
+    de other_products. Los productos de other_products sin correspondencia se añaden al final.
+    :return: Devuelve un nuevo listado de diccionarios.
+    '''
+    merged = [dict(product) for product in products]
+    index = {}
+    for product in merged:
+        for key in keys:
+            if product.get(key):
+                index.setdefault((key, product[key]), product)
+
+    for other in other_products:
+        product = next((index[(key, other[key])] for key in keys if other.get(key) and (key, other[key]) in index), None)
+        if product is None:
+            merged.append(dict(other))
+            continue
+        for name, value in other.items():
+            if product.get(name) is None:
+                product[name] = value
+    return merged
+
+
+
+
+# Especificaciones de extracción de las páginas de Dafiti y Geelbe.
+
+# Producto de un listado de productos de Dafiti (cada elemento DAFITI_PRODUCT_CONTAINER). El precio
+# tiene separadores de miles (e.g: "$ 129.900"). La referencia es el atributo data-sku del elemento
+# del producto que contiene al div.
+DAFITI_PRODUCT_CONTAINER = 'div.itm-product-main-info'
+DAFITI_PRODUCT = ExtractionSpec({
+    'name' : Field(css = 'p.itm-title::text'),
+    'price' : Field(css = 'span.itm-price:not(.price-prefix-listing)::text', regex = r'^\D*([\d\.,]+)\s*$',
+                    processors = [parse_price]),
+    'sku' : Field(xpath = 'ancestor-or-self::*[@data-sku][1]/@data-sku'),
+    'url' : Field(css = 'a::attr(href)')
+})
+
+# Página de un producto de Geelbe. La marca y la línea se extraen de la descripción del producto:
+# <b>Marca</b>: Nombre de la marca<br>
+GEELBE_PRODUCT = ExtractionSpec({
+    'description' : Field(xpath = '//div[@itemprop = "description"]/node()', join = '\n'),
+    'name' : Field(xpath = '//h1[@itemprop = "name"]/text()'),
+    'price' : Field(xpath = '//span[@itemprop = "price"]/text()'),
+    'image' : Field(css = '.fotos > img::attr(src)'),
+    'brand' : Field(source = 'description', required = True, processors = [
+        Regex(r'<b>Marca</b>([^<]+)<br>', search = True), Regex(r'^\s*:\s*([ \w]+)\s*$'), Regex(r'^[ ]*([ \w]*\w)[ ]*$')]),
+    'line' : Field(source = 'description', required = True, processors = [
+        Regex(r'<b>L.nea</b>([^<]+)<br>', search = True), Regex(r'^\s*:\s*([ \w]+)\s*$'), Regex(r'^[ ]*([ \w]*\w)[ ]*$')])
+})
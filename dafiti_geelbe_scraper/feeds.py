@@ -0,0 +1,230 @@
+'''
+Este script define un escritor de feeds: Ficheros con un registro por línea (JSON lines o CSV),
+opcionalmente comprimidos (gzip o zstd), que se rotan al alcanzar un tamaño o número de
+registros máximo.
+
+Los registros se codifican y escriben en un hilo en segundo plano, y los ficheros se vacían
+periódicamente para que otros procesos puedan leerlos mientras se escriben.
+
+La compresión zstd requiere el paquete zstandard (si no está instalado, el escritor no acepta
+esta compresión). Si está instalado el paquete orjson, se usa
+para codificar los registros en JSON.
+'''
+
+from threading import Thread
+from queue import Queue, Empty
+from os import makedirs
+from os.path import join
+from datetime import datetime
+import time
+from io import StringIO
+import gzip
+import csv
+
+try:
+    import orjson
+    def encode_json(record):
+        return orjson.dumps(record) + b'\n'
+except ImportError:
+    import json
+    def encode_json(record):
+        return (json.dumps(record, ensure_ascii = False) + '\n').encode('utf-8')
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Extensiones de los ficheros según su formato y compresión.
+FEED_FORMATS = {
+    'jsonl' : 'jsonl',
+    'csv' : 'csv'
+}
+FEED_COMPRESSIONS = {
+    None : '',
+    'gzip' : '.gz',
+    'zstd' : '.zst'
+}
+
+
+class FeedFile:
+    '''
+    Representa un fichero del feed abierto para escritura.
+    '''
+    def __init__(self, file_path, compression = None):
+        self.file_path = file_path
+        self.raw = open(file_path, 'wb')
+        self.num_records = 0
+
+        if compression is None:
+            self.stream = self.raw
+        elif compression == 'gzip':
+            self.stream = gzip.GzipFile(fileobj = self.raw, mode = 'wb')
+        else:
+            self.zstd_flush = zstandard.FLUSH_BLOCK
+            self.stream = zstandard.ZstdCompressor().stream_writer(self.raw, closefd = False)
+        self.compression = compression
+
+    def write(self, data):
+        self.stream.write(data)
+
+    def flush(self):
+        '''
+        Vacía los datos pendientes al fichero. Los datos escritos hasta ahora pueden leerse
+        (y descomprimirse) aunque el fichero siga abierto.
+        '''
+        if self.compression == 'zstd':
+            self.stream.flush(self.zstd_flush)
+        else:
+            self.stream.flush()
+        self.raw.flush()
+
+    def size(self):
+        '''
+        :return: Devuelve el tamaño actual del fichero en disco (comprimido)
+        '''
+        return self.raw.tell()
+
+    def close(self):
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.close()
+
+
+class FeedWriter:
+    '''
+    Escribe registros (diccionarios) en un feed en segundo plano.
+    Los ficheros se nombran <prefijo>-<fecha>-<número de fichero>.<formato>[.gz|.zst]
+    '''
+    def __init__(self, directory, prefix, format = 'jsonl', compression = None, fields = None,
+                 rotate_bytes = None, rotate_items = None, flush_interval = 1.0):
+        '''
+        Inicializa la instancia.
+        :param directory: Es el directorio donde se guardan los ficheros.
+        :param prefix: Es el prefijo de los nombres de los ficheros.
+        :param format: Es el formato de los ficheros: 'jsonl' o 'csv'
+        :param compression: Es la compresión de los ficheros: None, 'gzip' o 'zstd'
+        :param fields: Son los nombres de los campos de los registros (obligatorio en formato csv)
+        :param rotate_bytes: Si se indica, se crea un nuevo fichero cuando el actual supera este
+        tamaño (en bytes, comprimido)
+        :param rotate_items: Si se indica, se crea un nuevo fichero cuando el actual tiene este
+        número de registros.
+        :param flush_interval: Es el número máximo de segundos que pasan sin que se vacíen los
+        datos al fichero.
+        '''
+        if format not in FEED_FORMATS:
+            raise ValueError('Invalid feed format "{}"'.format(format))
+        if compression not in FEED_COMPRESSIONS:
+            raise ValueError('Invalid feed compression "{}"'.format(compression))
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError('The zstandard package must be installed to use zstd feed compression')
+        if format == 'csv' and fields is None:
+            raise ValueError('Fields must be specified for csv feeds')
+
+        self.directory, self.prefix = directory, prefix
+        self.format, self.compression, self.fields = format, compression, fields
+        self.rotate_bytes, self.rotate_items = rotate_bytes, rotate_items
+        self.flush_interval = flush_interval
+
+        self.timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.num_files = 0
+        self.file = None
+        self.file_paths = []
+        self.error = None
+
+        makedirs(directory, exist_ok = True)
+
+        self.queue = Queue(maxsize = 10000)
+        self.thread = Thread(target = self.run, name = 'FeedWriter-{}'.format(prefix), daemon = True)
+        self.thread.start()
+
+
+    def write(self, record):
+        '''
+        Añade un registro al feed. Se escribirá en segundo plano.
+        '''
+        if self.error is not None:
+            raise self.error
+        self.queue.put(record)
+
+    def close(self):
+        '''
+        Escribe los registros pendientes y cierra el fichero actual.
+        :return: Devuelve las rutas de los ficheros escritos.
+        '''
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.file_paths
+
+
+    def encode(self, record):
+        if self.format == 'jsonl':
+            return encode_json(record)
+
+        buffer = StringIO()
+        csv.writer(buffer).writerow([record.get(field) for field in self.fields])
+        return buffer.getvalue().encode('utf-8')
+
+    def open_file(self):
+        self.num_files += 1
+        file_name = '{}-{}-{:05d}.{}{}'.format(self.prefix, self.timestamp, self.num_files,
+                                               FEED_FORMATS[self.format], FEED_COMPRESSIONS[self.compression])
+        self.file = FeedFile(join(self.directory, file_name), self.compression)
+        self.file_paths.append(self.file.file_path)
+        if self.format == 'csv':
+            buffer = StringIO()
+            csv.writer(buffer).writerow(self.fields)
+            self.file.write(buffer.getvalue().encode('utf-8'))
+
+    def must_rotate(self):
+        return (self.rotate_items is not None and self.file.num_records >= self.rotate_items) or \
+               (self.rotate_bytes is not None and self.file.size() >= self.rotate_bytes)
+
+    def run(self):
+        '''
+        Bucle del hilo en segundo plano.
+        '''
+        try:
+            pending = False
+            last_flush = time.time()
+            while True:
+                # Esperamos como mucho hasta el siguiente vaciado, aunque sigan llegando registros.
+                timeout = max(0, last_flush + self.flush_interval - time.time()) if pending else None
+                try:
+                    record = self.queue.get(timeout = timeout)
+                except Empty:
+                    record = Empty
+
+                if record is None:
+                    break
+
+                if record is not Empty:
+                    if self.file is None:
+                        self.open_file()
+                    self.file.write(self.encode(record))
+                    self.file.num_records += 1
+                    if not pending:
+                        pending, last_flush = True, time.time()
+
+                    if self.must_rotate():
+                        self.file.close()
+                        self.file = None
+                        pending = False
+
+                if pending and time.time() - last_flush >= self.flush_interval:
+                    self.file.flush()
+                    pending, last_flush = False, time.time()
+        except Exception as e:
+            self.error = e
+            # Descartamos los registros pendientes para no bloquear a quien escribe.
+            while True:
+                record = self.queue.get()
+                if record is None:
+                    break
+        finally:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,517 @@
+'''
+Este script define una cola de peticiones compartida (frontera) para que varias arañas, en uno
+o varios equipos, colaboren en el mismo escrapeo.
+
+Las peticiones pendientes y las huellas (fingerprints) de las peticiones ya vistas se guardan en
+un broker:
+- RedisBroker: Servidor Redis (requiere el paquete redis). Para varios equipos.
+- LocalBroker: Fichero sqlite. Para varios procesos en el mismo equipo y para pruebas.
+
+Entrega "al menos una vez": Al sacar una petición de la cola, el proceso la toma prestada durante
+FRONTIER_LEASE_SECONDS segundos. Si no confirma (ack) que la ha procesado antes de que expire el
+préstamo (por ejemplo, porque el proceso ha terminado inesperadamente), la petición vuelve a la cola.
+
+Se activa con la variable de configuración FRONTIER_BROKER ('local' o 'redis'). El nombre de la
+cola es FRONTIER_QUEUE (por defecto, el nombre de la araña). Todas las arañas que usen la misma cola
+comparten el escrapeo.
+
+El mismo LocalBroker sirve de cola en disco del modo de memoria acotada (MEMORY_BOUNDED, ver
+BoundedMemoryScheduler), con una cola privada para cada araña.
+
+Uso (administración de las colas):
+    PYTHONPATH=dafiti_geelbe_scraper python dafiti_geelbe_scraper/frontier.py <stats|clear> <cola>
+'''
+
+from config import global_config
+from collections import deque
+from os import getpid
+from uuid import uuid4
+import sqlite3
+import os
+import re
+import pickle
+import time
+import sys
+
+
+class Broker:
+    '''
+    Clase base de los brokers de la frontera.
+    '''
+    def push(self, queue, payload, priority = 0):
+        '''
+        Añade una petición (serializada) a la cola. Las peticiones con mayor prioridad salen antes.
+        '''
+        raise NotImplementedError()
+
+    def pop(self, queue, lease_seconds):
+        '''
+        Saca una petición de la cola y la toma prestada durante lease_seconds segundos.
+        Antes, las peticiones cuyo préstamo ha expirado vuelven a la cola.
+        :return: Devuelve una tupla (id del préstamo, petición serializada) o None si la cola está vacía.
+        '''
+        raise NotImplementedError()
+
+    def ack(self, queue, lease):
+        '''
+        Confirma que la petición prestada se ha procesado. Se elimina definitivamente de la cola.
+        '''
+        raise NotImplementedError()
+
+    def add_fingerprint(self, queue, fingerprint):
+        '''
+        Añade la huella de una petición al conjunto de peticiones vistas.
+        :return: Devuelve True si la huella no estaba en el conjunto.
+        '''
+        raise NotImplementedError()
+
+    def pending(self, queue):
+        '''
+        :return: Devuelve el número de peticiones en la cola o prestadas.
+        '''
+        raise NotImplementedError()
+
+    def clear(self, queue):
+        '''
+        Elimina todas las peticiones y huellas de la cola.
+        '''
+        raise NotImplementedError()
+
+    def stats(self, queue):
+        '''
+        :return: Devuelve un diccionario con el número de peticiones en cola, prestadas y huellas.
+        '''
+        raise NotImplementedError()
+
+
+class LocalBroker(Broker):
+    '''
+    Broker que guarda las colas en un fichero sqlite. Pueden compartirlo varios procesos
+    del mismo equipo.
+    Cada operación se confirma por separado (autocommit). Con WAL y synchronous = NORMAL, las
+    confirmaciones no esperan a que los datos lleguen al disco (fsync), solo los checkpoints: Si el
+    proceso termina inesperadamente no se pierde nada; si se apaga el equipo, las últimas operaciones.
+    '''
+    def __init__(self, file_path):
+        self.connection = sqlite3.connect(file_path, timeout = 30, isolation_level = None, check_same_thread = False)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS frontier_request (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                payload BLOB NOT NULL,
+                lease TEXT,
+                lease_deadline REAL
+            )''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS idx_frontier_request__queue '
+                                'ON frontier_request (queue, lease, priority DESC, id)')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS frontier_fingerprint (
+                queue TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                PRIMARY KEY (queue, fingerprint)
+            ) WITHOUT ROWID''')
+
+    def push(self, queue, payload, priority = 0):
+        self.connection.execute('INSERT INTO frontier_request (queue, priority, payload) VALUES (?, ?, ?)',
+                                (queue, priority, payload))
+
+    def pop(self, queue, lease_seconds):
+        now = time.time()
+        cursor = self.connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute('UPDATE frontier_request SET lease = NULL, lease_deadline = NULL '
+                           'WHERE queue = ? AND lease IS NOT NULL AND lease_deadline < ?', (queue, now))
+            row = cursor.execute('SELECT id, payload FROM frontier_request WHERE queue = ? AND lease IS NULL '
+                                 'ORDER BY priority DESC, id LIMIT 1', (queue,)).fetchone()
+            if row is None:
+                cursor.execute('COMMIT')
+                return None
+            id, payload = row
+            lease = '{}:{}'.format(id, uuid4().hex)
+            cursor.execute('UPDATE frontier_request SET lease = ?, lease_deadline = ? WHERE id = ?',
+                           (lease, now + lease_seconds, id))
+            cursor.execute('COMMIT')
+            return lease, payload
+        except:
+            cursor.execute('ROLLBACK')
+            raise
+
+    def ack(self, queue, lease):
+        id = int(lease.split(':')[0])
+        # Si el préstamo ha expirado y otro proceso ha tomado la petición, no se elimina.
+        self.connection.execute('DELETE FROM frontier_request WHERE id = ? AND lease = ?', (id, lease))
+
+    def add_fingerprint(self, queue, fingerprint):
+        cursor = self.connection.execute('INSERT OR IGNORE INTO frontier_fingerprint (queue, fingerprint) VALUES (?, ?)',
+                                         (queue, fingerprint))
+        return cursor.rowcount > 0
+
+    def pending(self, queue):
+        return self.connection.execute('SELECT COUNT(*) FROM frontier_request WHERE queue = ?', (queue,)).fetchone()[0]
+
+    def clear(self, queue):
+        self.connection.execute('DELETE FROM frontier_request WHERE queue = ?', (queue,))
+        self.connection.execute('DELETE FROM frontier_fingerprint WHERE queue = ?', (queue,))
+
+    def queues(self):
+        '''
+        :return: Devuelve los nombres de las colas que tienen peticiones o huellas.
+        '''
+        return [row[0] for row in self.connection.execute(
+            'SELECT DISTINCT queue FROM frontier_request UNION SELECT DISTINCT queue FROM frontier_fingerprint')]
+
+    def stats(self, queue):
+        queued, leased = self.connection.execute(
+            'SELECT COUNT(*) - COUNT(lease), COUNT(lease) FROM frontier_request WHERE queue = ?', (queue,)).fetchone()
+        fingerprints = self.connection.execute('SELECT COUNT(*) FROM frontier_fingerprint WHERE queue = ?',
+                                               (queue,)).fetchone()[0]
+        return {'queued' : queued, 'leased' : leased, 'fingerprints' : fingerprints}
+
+
+class RedisBroker(Broker):
+    '''
+    Broker que guarda las colas en un servidor Redis (5.0 o superior). Cada cola usa las claves:
+    - <cola>:pending: Conjunto ordenado con los ids de las peticiones en cola (por prioridad)
+    - <cola>:leases: Conjunto ordenado con los ids de las peticiones prestadas (por fin del préstamo)
+    - <cola>:payloads, <cola>:scores: Peticiones serializadas y sus prioridades
+    - <cola>:owners: Identificador del préstamo de cada petición prestada
+    - <cola>:fingerprints: Conjunto de huellas
+    '''
+
+    # Devuelve las peticiones con préstamos expirados a la cola, y saca y presta la siguiente
+    # petición, de forma atómica.
+    POP_SCRIPT = '''
+        local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+        for _, id in ipairs(expired) do
+            redis.call('ZREM', KEYS[2], id)
+            redis.call('HDEL', KEYS[5], id)
+            redis.call('ZADD', KEYS[1], redis.call('HGET', KEYS[4], id), id)
+        end
+        local popped = redis.call('ZPOPMIN', KEYS[1])
+        if #popped == 0 then
+            return nil
+        end
+        local id = popped[1]
+        redis.call('ZADD', KEYS[2], ARGV[2], id)
+        redis.call('HSET', KEYS[5], id, ARGV[3])
+        return {id, redis.call('HGET', KEYS[3], id)}
+    '''
+
+    # Elimina una petición prestada, solo si el préstamo sigue siendo del proceso que confirma.
+    ACK_SCRIPT = '''
+        if redis.call('HGET', KEYS[5], ARGV[1]) ~= ARGV[2] then
+            return 0
+        end
+        redis.call('ZREM', KEYS[2], ARGV[1])
+        redis.call('HDEL', KEYS[3], ARGV[1])
+        redis.call('HDEL', KEYS[4], ARGV[1])
+        redis.call('HDEL', KEYS[5], ARGV[1])
+        return 1
+    '''
+
+    def __init__(self, url):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.pop_script = self.redis.register_script(self.POP_SCRIPT)
+        self.ack_script = self.redis.register_script(self.ACK_SCRIPT)
+
+    def keys(self, queue):
+        return ['{}:{}'.format(queue, key) for key in ['pending', 'leases', 'payloads', 'scores', 'owners']]
+
+    def push(self, queue, payload, priority = 0):
+        pending, leases, payloads, scores, owners = self.keys(queue)
+        id = self.redis.incr('{}:seq'.format(queue))
+        pipeline = self.redis.pipeline()
+        pipeline.hset(payloads, id, payload)
+        pipeline.hset(scores, id, -priority)
+        pipeline.zadd(pending, {id : -priority})
+        pipeline.execute()
+
+    def pop(self, queue, lease_seconds):
+        now = time.time()
+        token = uuid4().hex
+        result = self.pop_script(keys = self.keys(queue), args = [now, now + lease_seconds, token])
+        if result is None:
+            return None
+        id, payload = result
+        id = id.decode() if isinstance(id, bytes) else str(id)
+        return '{}:{}'.format(id, token), payload
+
+    def ack(self, queue, lease):
+        id, token = lease.split(':')
+        # Si el préstamo ha expirado y otro proceso ha tomado la petición, no se elimina.
+        self.ack_script(keys = self.keys(queue), args = [id, token])
+
+    def add_fingerprint(self, queue, fingerprint):
+        return self.redis.sadd('{}:fingerprints'.format(queue), fingerprint) == 1
+
+    def pending(self, queue):
+        pending, leases, payloads, scores, owners = self.keys(queue)
+        return self.redis.zcard(pending) + self.redis.zcard(leases)
+
+    def clear(self, queue):
+        self.redis.delete(*(self.keys(queue) + ['{}:seq'.format(queue), '{}:fingerprints'.format(queue)]))
+
+    def stats(self, queue):
+        pending, leases, payloads, scores, owners = self.keys(queue)
+        return {
+            'queued' : self.redis.zcard(pending),
+            'leased' : self.redis.zcard(leases),
+            'fingerprints' : self.redis.scard('{}:fingerprints'.format(queue))
+        }
+
+
+# Broker del proceso actual (ver get_broker)
+broker = None
+
+def get_broker(config = global_config):
+    '''
+    :return: Devuelve el broker indicado en la configuración (variable FRONTIER_BROKER). Se crea
+    una única instancia por proceso.
+    '''
+    global broker
+    if broker is None:
+        if config.FRONTIER_BROKER == 'redis':
+            broker = RedisBroker(config.FRONTIER_REDIS_URL)
+        elif config.FRONTIER_BROKER == 'local':
+            broker = LocalBroker(config.path.FRONTIER_LOCAL_PATH)
+        else:
+            raise ValueError('Invalid frontier broker "{}"'.format(config.FRONTIER_BROKER))
+    return broker
+
+
+def get_queue_name(spider):
+    '''
+    :return: Devuelve el nombre de la cola de la frontera de la araña indicada.
+    '''
+    return spider.get_config().FRONTIER_QUEUE or spider.name
+
+
+class FrontierScheduler:
+    '''
+    Planificador de Scrapy que saca y mete las peticiones en la frontera compartida. Sustituye
+    también al filtro de peticiones duplicadas (dupefilter)
+    Las peticiones deben poder serializarse: Los callbacks deben ser métodos de la araña.
+    '''
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.broker = get_broker(crawler.spider.get_config())
+        self.lease_seconds = crawler.spider.get_config().FRONTIER_LEASE_SECONDS
+        self.spider = None
+        self.queue = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def open(self, spider):
+        self.spider = spider
+        self.queue = get_queue_name(spider)
+
+    def close(self, reason):
+        # Si el escrapeo ha terminado (no quedan peticiones en la cola ni prestadas a otros
+        # procesos), se vacía la cola: Las huellas harían que el siguiente escrapeo descartase sus
+        # peticiones iniciales. Si se ha interrumpido, se conservan para poder continuarlo.
+        if reason == 'finished' and self.broker.pending(self.queue) == 0:
+            self.broker.clear(self.queue)
+
+    def fingerprint(self, request):
+        if hasattr(self.crawler, 'request_fingerprinter'):
+            return self.crawler.request_fingerprinter.fingerprint(request).hex()
+        from scrapy.utils.request import request_fingerprint
+        return request_fingerprint(request)
+
+    def enqueue_request(self, request):
+        # Las peticiones que se reintentan o redirigen conservan el préstamo de la original. La
+        # original ya no es necesaria una vez que la nueva está en la cola (o se ha descartado)
+        lease = request.meta.pop('frontier_lease', None)
+        if not request.dont_filter and not self.broker.add_fingerprint(self.queue, self.fingerprint(request)):
+            if lease is not None:
+                self.broker.ack(self.queue, lease)
+            self.stats.inc_value('frontier/filtered', spider = self.spider)
+            return False
+
+        payload = pickle.dumps(request.to_dict(spider = self.spider), protocol = pickle.HIGHEST_PROTOCOL)
+        self.broker.push(self.queue, payload, request.priority)
+        if lease is not None:
+            self.broker.ack(self.queue, lease)
+
+        self.stats.inc_value('frontier/enqueued', spider = self.spider)
+        return True
+
+    def next_request(self):
+        from scrapy.utils.request import request_from_dict
+
+        result = self.broker.pop(self.queue, self.lease_seconds)
+        if result is None:
+            return None
+        lease, payload = result
+        request = request_from_dict(pickle.loads(payload), spider = self.spider)
+        request.meta['frontier_lease'] = lease
+        self.stats.inc_value('frontier/dequeued', spider = self.spider)
+        return request
+
+    def has_pending_requests(self):
+        # Incluye las peticiones prestadas a otros procesos: Pueden generar nuevas peticiones.
+        return self.broker.pending(self.queue) > 0
+
+    def __len__(self):
+        return self.broker.pending(self.queue)
+
+
+class FrontierMiddleware:
+    '''
+    Middleware (de araña y de descarga) que confirma las peticiones de la frontera:
+    - Cuando la araña ha terminado de procesar la respuesta.
+    - Cuando la descarga falla definitivamente (tras los reintentos)
+    Debe registrarse en SPIDER_MIDDLEWARES y en DOWNLOADER_MIDDLEWARES.
+    '''
+    def ack(self, request, spider):
+        lease = request.meta.pop('frontier_lease', None) if request is not None else None
+        if lease is not None:
+            get_broker(spider.get_config()).ack(get_queue_name(spider), lease)
+
+    def process_spider_output(self, response, result, spider):
+        for item in result:
+            yield item
+        self.ack(response.request, spider)
+
+    def process_spider_exception(self, response, exception, spider):
+        self.ack(response.request, spider)
+
+    def process_exception(self, request, exception, spider):
+        self.ack(request, spider)
+
+
+def pid_exists(pid):
+    '''
+    :return: Devuelve True si hay un proceso en ejecución con el pid indicado.
+    '''
+    if os.name == 'nt':
+        # En Windows, os.kill con la señal 0 envía CTRL_C_EVENT. Se supone que el proceso sigue vivo.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # El proceso existe, pero es de otro usuario.
+        return True
+    return True
+
+
+class BoundedMemoryScheduler(FrontierScheduler):
+    '''
+    Planificador del modo de memoria acotada (MEMORY_BOUNDED). Mantiene en memoria como máximo
+    MEMORY_MAX_QUEUED_REQUESTS peticiones pendientes (las de mayor prioridad). El resto, y las
+    huellas de las peticiones vistas (en lugar del dupefilter), se guardan en una cola privada de
+    la araña en un LocalBroker (fichero MEMORY_QUEUE_PATH). La cola se vacía al empezar y al
+    terminar el escrapeo. Al empezar también se eliminan las colas de la araña de procesos que ya
+    no existen.
+    '''
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.max_queued = crawler.spider.get_config().MEMORY_MAX_QUEUED_REQUESTS
+        self.broker = None
+        self.spider = None
+        self.queue = None
+
+        # Peticiones en memoria (prioridad -> peticiones) y número de peticiones en disco por prioridad.
+        self.queues = {}
+        self.num_queued = 0
+        self.disk_priorities = {}
+
+    def open(self, spider):
+        self.spider = spider
+        self.broker = LocalBroker(spider.get_config().path.MEMORY_QUEUE_PATH)
+        # Varios procesos pueden escrapear con la misma araña (ver shard.py)
+        self.queue = '{}-{}'.format(spider.name, getpid())
+        self.broker.clear(self.queue)
+
+        # Colas de procesos de la araña que terminaron sin vaciarlas (e.g: el proceso se interrumpió)
+        for queue in self.broker.queues():
+            match = re.match(r'^{}-(\d+)$'.format(re.escape(spider.name)), queue)
+            if match is not None and not pid_exists(int(match.group(1))):
+                self.broker.clear(queue)
+                self.stats.inc_value('scheduler/stale_queues_cleared', spider = spider)
+
+    def close(self, reason):
+        self.broker.clear(self.queue)
+
+    def enqueue_request(self, request):
+        if not request.dont_filter and not self.broker.add_fingerprint(self.queue, self.fingerprint(request)):
+            self.stats.inc_value('dupefilter/filtered', spider = self.spider)
+            return False
+
+        if self.num_queued >= self.max_queued:
+            lowest = min(self.queues)
+            if request.priority <= lowest:
+                self.push_to_disk(request)
+                return True
+            # La petición desplaza a disco a la última petición de menor prioridad en memoria.
+            self.push_to_disk(self.pop_from_memory(lowest, last = True))
+
+        self.queues.setdefault(request.priority, deque()).append(request)
+        self.num_queued += 1
+        self.stats.inc_value('scheduler/enqueued/memory', spider = self.spider)
+        return True
+
+    def next_request(self):
+        highest = max(self.queues) if self.num_queued > 0 else None
+        highest_on_disk = max(self.disk_priorities) if len(self.disk_priorities) > 0 else None
+        if highest is None and highest_on_disk is None:
+            return None
+
+        if highest_on_disk is None or (highest is not None and highest >= highest_on_disk):
+            self.stats.inc_value('scheduler/dequeued/memory', spider = self.spider)
+            return self.pop_from_memory(highest)
+
+        from scrapy.utils.request import request_from_dict
+
+        # La cola es privada: La petición se confirma al sacarla (no hace falta el préstamo)
+        lease, payload = self.broker.pop(self.queue, self.spider.get_config().FRONTIER_LEASE_SECONDS)
+        self.broker.ack(self.queue, lease)
+        request = request_from_dict(pickle.loads(payload), spider = self.spider)
+        self.disk_priorities[request.priority] -= 1
+        if self.disk_priorities[request.priority] == 0:
+            del self.disk_priorities[request.priority]
+        self.stats.inc_value('scheduler/dequeued/disk', spider = self.spider)
+        return request
+
+    def pop_from_memory(self, priority, last = False):
+        queue = self.queues[priority]
+        request = queue.pop() if last else queue.popleft()
+        if len(queue) == 0:
+            del self.queues[priority]
+        self.num_queued -= 1
+        return request
+
+    def push_to_disk(self, request):
+        payload = pickle.dumps(request.to_dict(spider = self.spider), protocol = pickle.HIGHEST_PROTOCOL)
+        self.broker.push(self.queue, payload, request.priority)
+        self.disk_priorities[request.priority] = self.disk_priorities.get(request.priority, 0) + 1
+        self.stats.inc_value('scheduler/enqueued/disk', spider = self.spider)
+
+    def has_pending_requests(self):
+        return len(self) > 0
+
+    def __len__(self):
+        return self.num_queued + sum(self.disk_priorities.values())
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] not in ['stats', 'clear']:
+        print('Usage: frontier.py <stats|clear> <queue>')
+        sys.exit(1)
+
+    command, queue = sys.argv[1:]
+    if command == 'stats':
+        print(get_broker().stats(queue))
+    else:
+        get_broker().clear(queue)
@@ -0,0 +1,126 @@
+'''
+Este script define el almacén de imágenes de los artículos. Las imágenes se guardan
+direccionadas por contenido: El nombre de cada fichero es el hash SHA-256 de su contenido, por
+lo que una imagen que aparece en varios artículos, proveedores o escrapeos se guarda una sola vez.
+
+    <OUTPUT_IMAGES_DIR>/full/ab/abcdef....jpg
+    <OUTPUT_IMAGES_DIR>/thumbs/<tamaño>/ab/abcdef....jpg
+    <OUTPUT_IMAGES_DIR>/index.db
+
+El índice (index.db, sqlite) relaciona la url de cada imagen con su hash y la cabecera ETag de
+la última descarga, de forma que las imágenes que no han cambiado no se descargan de nuevo
+(petición condicional con If-None-Match)
+
+Las miniaturas requieren el paquete Pillow: Si no está instalado, no se generan. Ver el pipeline
+ImagePipeline (pipelines.py)
+'''
+
+from os import makedirs, replace
+from os.path import join, exists, splitext
+from urllib.parse import urlparse
+from hashlib import sha256
+from io import BytesIO
+from threading import get_ident
+import sqlite3
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# Extensiones de las imágenes según su tipo de contenido.
+IMAGE_EXTENSIONS = {
+    'image/jpeg' : '.jpg',
+    'image/png' : '.png',
+    'image/gif' : '.gif',
+    'image/webp' : '.webp'
+}
+
+
+class ImageStore:
+    '''
+    Almacén de imágenes direccionado por contenido.
+    '''
+    def __init__(self, directory, thumbnail_sizes = []):
+        '''
+        Inicializa la instancia.
+        :param directory: Es el directorio del almacén.
+        :param thumbnail_sizes: Son los tamaños (en píxeles, lado mayor) de las miniaturas que se
+        generan para cada imagen nueva.
+        '''
+        self.directory = directory
+        self.thumbnail_sizes = thumbnail_sizes
+        makedirs(directory, exist_ok = True)
+
+        self.index = sqlite3.connect(join(directory, 'index.db'), isolation_level = None)
+        self.index.execute('PRAGMA journal_mode = WAL')
+        self.index.execute('''
+            CREATE TABLE IF NOT EXISTS image (
+                url TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                etag TEXT
+            ) WITHOUT ROWID''')
+
+    def get_path(self, hash, extension, thumbnail_size = None):
+        '''
+        :return: Devuelve la ruta de la imagen con el hash indicado (o de su miniatura)
+        '''
+        if thumbnail_size is None:
+            return join(self.directory, 'full', hash[:2], hash + extension)
+        return join(self.directory, 'thumbs', str(thumbnail_size), hash[:2], hash + '.jpg')
+
+    def lookup(self, url):
+        '''
+        :return: Devuelve una tupla (hash, etag) con los datos de la última descarga de la imagen
+        con la url indicada, o None si no se ha descargado nunca.
+        '''
+        return self.index.execute('SELECT hash, etag FROM image WHERE url = ?', (url,)).fetchone()
+
+    def register(self, url, hash, etag):
+        self.index.execute('INSERT OR REPLACE INTO image (url, hash, etag) VALUES (?, ?, ?)', (url, hash, etag))
+
+    def put(self, url, data, content_type = None):
+        '''
+        Guarda una imagen en el almacén si no existe ya. Puede invocarse desde otro hilo (no usa
+        el índice)
+        :return: Devuelve una tupla (hash, True si la imagen es nueva)
+        '''
+        hash = sha256(data).hexdigest()
+        extension = IMAGE_EXTENSIONS.get((content_type or '').split(';')[0].strip().lower())
+        if extension is None:
+            extension = splitext(urlparse(url).path)[1].lower() or '.img'
+
+        file_path = self.get_path(hash, extension)
+        if exists(file_path):
+            return hash, False
+
+        makedirs(join(self.directory, 'full', hash[:2]), exist_ok = True)
+        # El fichero se escribe con otro nombre y se renombra, para que nunca haya imágenes a medias
+        # (aunque dos hilos guarden la misma imagen a la vez)
+        part_path = '{}.{}.part'.format(file_path, get_ident())
+        with open(part_path, 'wb') as fh:
+            fh.write(data)
+        replace(part_path, file_path)
+
+        # Si la imagen no puede decodificarse, se guarda sin miniaturas.
+        try:
+            self.make_thumbnails(hash, data)
+        except OSError:
+            pass
+        return hash, True
+
+    def make_thumbnails(self, hash, data):
+        if len(self.thumbnail_sizes) == 0 or Image is None:
+            return
+
+        image = Image.open(BytesIO(data)).convert('RGB')
+        for size in self.thumbnail_sizes:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size))
+            file_path = self.get_path(hash, None, size)
+            makedirs(join(self.directory, 'thumbs', str(size), hash[:2]), exist_ok = True)
+            thumbnail.save(file_path, 'JPEG', quality = 85)
+
+    def close(self):
+        self.index.close()
@@ -1,12 +1,23 @@
 
 from scrapy.loader import ItemLoader as ScrapyItemLoader
 
+
+class MissingFieldError(ValueError):
+    '''
+    Se genera al cargar un item al que le falta un campo obligatorio, o al extraer de una página
+    un campo que no se encuentra. El atributo field es el nombre del campo.
+    '''
+    def __init__(self, field):
+        super().__init__('Missing attribute "{}" on item'.format(field))
+        self.field = field
+
+
 class ItemLoader(ScrapyItemLoader):
     '''
     Esta clase es un wrapper sobre la clase ItemLoader de scrapy.
     Tiene una funcionalidad añadida: Comprueba al calcular finalmente los valores de
     los campos del item, si están presentes o no. Si algún campo no está presente y se ha
-    marcado como obligatorio, se genera una excepción al cargar el item (de tipo ValueError)
+    marcado como obligatorio, se genera una excepción al cargar el item (de tipo MissingFieldError)
     Los campos pueden marcarse como obligatorios pasandoles el atributo "mandatory" a True en
     la declaración del mismo (clase Item)
     '''
@@ -26,5 +37,5 @@ class ItemLoader(ScrapyItemLoader):
             field = item.fields[field_name]
             if 'mandatory' in field and field['mandatory']:
                 if item.get(field_name) is None:
-                    raise ValueError('Missing attribute "{}" on item'.format(field_name))
+                    raise MissingFieldError(field_name)
         return item
\ No newline at end of file
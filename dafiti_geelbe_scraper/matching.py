@@ -0,0 +1,169 @@
+'''
+Este script relaciona los artículos de dos proveedores (por defecto Dafiti y Geelbe) que
+corresponden al mismo producto, y guarda las parejas en la tabla ArticleMatch.
+
+- Los nombres y las marcas se normalizan: Minúsculas, sin acentos ni signos de puntuación, y
+con las palabras separadas por un único espacio.
+- Solo se comparan artículos de la misma marca (bloques por marca normalizada)
+- Cada nombre se representa como un vector TF-IDF disperso de sus palabras. La similitud de dos
+artículos es el coseno de sus vectores. Dentro de cada bloque, los candidatos se buscan con
+un índice invertido (palabra -> artículos del segundo proveedor), por lo
+que solo se comparan artículos que comparten alguna palabra poco frecuente.
+- Dos artículos se relacionan si cada uno es el más parecido al otro y su similitud es al
+menos MATCHING_MIN_SIMILARITY.
+
+Uso:
+    PYTHONPATH=dafiti_geelbe_scraper python dafiti_geelbe_scraper/matching.py [--providers dafiti geelbe]
+        [--min-similarity 0.6]
+'''
+
+from config import global_config
+from db import db, db_session
+from unicodedata import normalize
+from math import log, sqrt
+import argparse
+import time
+import re
+
+
+MATCHING_QUERY = '''
+    SELECT a.id, a.name, b.name, p.name
+    FROM Article a
+        JOIN Brand b ON b.id = a.brand
+        JOIN Provider p ON p.id = a.provider
+    WHERE p.name = {param} OR p.name = {param}
+'''
+
+DELETE_MATCHES_QUERY = '''
+    DELETE FROM ArticleMatch
+    WHERE article IN (SELECT a.id FROM Article a JOIN Provider p ON p.id = a.provider WHERE p.name IN ({param}, {param}))
+        AND other IN (SELECT a.id FROM Article a JOIN Provider p ON p.id = a.provider WHERE p.name IN ({param}, {param}))
+'''
+
+
+def normalize_name(name):
+    '''
+    Normaliza el nombre de un artículo o de una marca.
+    e.g: normalize_name('  Camiseta   Básica-Azul ') = 'camiseta basica azul'
+    '''
+    name = normalize('NFKD', name or '').encode('ascii', 'ignore').decode().lower()
+    return ' '.join(re.findall('[a-z0-9]+', name))
+
+
+def tfidf_vectors(token_lists):
+    '''
+    :param token_lists: Listado con las palabras de cada nombre.
+    :return: Devuelve el vector TF-IDF normalizado (diccionario palabra -> peso) de cada nombre.
+    '''
+    document_frequency = {}
+    for tokens in token_lists:
+        for token in set(tokens):
+            document_frequency[token] = document_frequency.get(token, 0) + 1
+
+    num_documents = len(token_lists)
+    idf = dict([(token, log((1 + num_documents) / (1 + frequency)) + 1)
+                for token, frequency in document_frequency.items()])
+
+    vectors = []
+    for tokens in token_lists:
+        vector = {}
+        for token in tokens:
+            vector[token] = vector.get(token, 0.0) + idf[token]
+        norm = sqrt(sum([weight * weight for weight in vector.values()]))
+        vectors.append(dict([(token, weight / norm) for token, weight in vector.items()]) if norm > 0 else {})
+    return vectors
+
+
+def match_block(left, right, min_similarity, max_postings = 1000):
+    '''
+    Relaciona los artículos de un bloque (misma marca)
+    :param left: Listado de tuplas (id, vector) con los artículos del primer proveedor.
+    :param right: Listado de tuplas (id, vector) con los artículos del segundo proveedor.
+    :param max_postings: Las palabras que aparecen en más artículos del segundo proveedor no se
+    usan para buscar candidatos (aunque sí para calcular la similitud). Evita comparar todos con
+    todos en bloques grandes.
+    :return: Devuelve un listado de tuplas (id del primero, id del segundo, similitud)
+    '''
+    index = {}
+    for position, (_, vector) in enumerate(right):
+        for token in vector:
+            index.setdefault(token, []).append(position)
+
+    # Mejor candidato de cada artículo, en ambos sentidos.
+    best_right = {}
+    best_left = {}
+    for left_position, (_, vector) in enumerate(left):
+        candidates = set()
+        for token in vector:
+            postings = index.get(token, ())
+            if len(postings) <= max_postings:
+                candidates.update(postings)
+
+        for position in candidates:
+            other = right[position][1]
+            score = sum([weight * other.get(token, 0.0) for token, weight in vector.items()])
+            if score > best_right.get(left_position, (None, 0.0))[1]:
+                best_right[left_position] = (position, score)
+            if score > best_left.get(position, (None, 0.0))[1]:
+                best_left[position] = (left_position, score)
+
+    matches = []
+    for left_position, (position, score) in best_right.items():
+        if score >= min_similarity and best_left[position][0] == left_position:
+            matches.append((left[left_position][0], right[position][0], min(score, 1.0)))
+    return matches
+
+
+@db_session
+def match_articles(providers = ('dafiti', 'geelbe'), min_similarity = 0.6):
+    '''
+    Relaciona los artículos de los dos proveedores indicados y reemplaza las parejas anteriores
+    de la tabla ArticleMatch.
+    :return: Devuelve el número de parejas.
+    '''
+    connection = db.get_connection()
+    cursor = db.backend.streaming_cursor(connection)
+    cursor.execute(MATCHING_QUERY.format(param = db.backend.param), tuple(providers))
+
+    ids, brands, sides, token_lists = [], [], [], []
+    while True:
+        rows = cursor.fetchmany(10000)
+        if len(rows) == 0:
+            break
+        for id, name, brand, provider in rows:
+            ids.append(id)
+            brands.append(normalize_name(brand))
+            sides.append(0 if provider == providers[0] else 1)
+            token_lists.append(normalize_name(name).split())
+    cursor.close()
+
+    # Los pesos de las palabras se calculan con todos los artículos de ambos proveedores.
+    blocks = {}
+    for id, brand, side, vector in zip(ids, brands, sides, tfidf_vectors(token_lists)):
+        blocks.setdefault(brand, ([], []))[side].append((id, vector))
+
+    matches = []
+    for left, right in blocks.values():
+        if len(left) > 0 and len(right) > 0:
+            matches.extend(match_block(left, right, min_similarity))
+
+    # Se reemplazan las parejas anteriores de estos dos proveedores, en cualquier orden (una
+    # ejecución anterior ha podido indicarlos al revés)
+    cursor = connection.cursor()
+    cursor.execute(DELETE_MATCHES_QUERY.format(param = db.backend.param), tuple(providers) * 2)
+    cursor.executemany('INSERT INTO ArticleMatch (article, other, similarity) VALUES ({})'.format(
+        ', '.join([db.backend.param] * 3)), matches)
+    connection.commit()
+    return len(matches)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Match the same products across two providers')
+    parser.add_argument('--providers', nargs = 2, default = ['dafiti', 'geelbe'])
+    parser.add_argument('--min-similarity', type = float, default = global_config.MATCHING_MIN_SIMILARITY)
+    args = parser.parse_args()
+
+    db.generate_mapping()
+    start_time = time.time()
+    num_matches = match_articles(providers = args.providers, min_similarity = args.min_similarity)
+    print('{} matches in {:.1f}s'.format(num_matches, time.time() - start_time))
@@ -0,0 +1,79 @@
+'''
+Este script define funciones para calcular y mostrar métricas de las arañas a partir de las
+estadísticas de Scrapy (crawler.stats)
+'''
+
+
+def elapsed_seconds(stats):
+    '''
+    :return: Devuelve los segundos transcurridos entre el inicio y el final (o el momento actual)
+    del escrapeo, según las estadísticas de una araña.
+    '''
+    from datetime import datetime
+
+    start_time = stats.get('start_time')
+    if start_time is None:
+        return 0.0
+    finish_time = stats.get('finish_time')
+    if finish_time is None:
+        finish_time = datetime.now(start_time.tzinfo) if start_time.tzinfo is not None else datetime.now()
+    return max((finish_time - start_time).total_seconds(), 0.0)
+
+
+def throughput(stats):
+    '''
+    :return: Devuelve un diccionario con las métricas de rendimiento de una araña: items,
+    respuestas, segundos y items y respuestas por segundo.
+    '''
+    items = stats.get('item_scraped_count', 0)
+    responses = stats.get('response_received_count', 0)
+    seconds = elapsed_seconds(stats)
+    return {
+        'items' : items,
+        'responses' : responses,
+        'seconds' : seconds,
+        'items_per_second' : items / seconds if seconds > 0 else 0.0,
+        'responses_per_second' : responses / seconds if seconds > 0 else 0.0,
+        'time_to_1000_items' : stats.get('items/time_to_1000'),
+        'connection_reuse_ratio' : stats.get('downloader/connections/reuse_ratio')
+    }
+
+
+def combined_throughput(stats_by_spider):
+    '''
+    :param stats_by_spider: Diccionario con las estadísticas de cada araña (nombre -> estadísticas)
+    :return: Devuelve las métricas de rendimiento del conjunto de las arañas. El tiempo es el
+    de la araña que más ha tardado.
+    '''
+    metrics = [throughput(stats) for stats in stats_by_spider.values()]
+    items = sum([metric['items'] for metric in metrics])
+    responses = sum([metric['responses'] for metric in metrics])
+    seconds = max([metric['seconds'] for metric in metrics] + [0.0])
+    return {
+        'items' : items,
+        'responses' : responses,
+        'seconds' : seconds,
+        'items_per_second' : items / seconds if seconds > 0 else 0.0,
+        'responses_per_second' : responses / seconds if seconds > 0 else 0.0
+    }
+
+
+def format_throughput(name, metrics):
+    report = '{}: {} items, {} responses in {:.1f}s ({:.2f} items/s, {:.2f} responses/s)'.format(
+        name, metrics['items'], metrics['responses'], metrics['seconds'],
+        metrics['items_per_second'], metrics['responses_per_second'])
+    if metrics.get('time_to_1000_items') is not None:
+        report += '. First 1000 items in {:.1f}s'.format(metrics['time_to_1000_items'])
+    if metrics.get('connection_reuse_ratio') is not None:
+        report += '. {:.0%} of the requests reused a connection'.format(metrics['connection_reuse_ratio'])
+    return report
+
+
+def throughput_report(stats_by_spider):
+    '''
+    :return: Devuelve un informe (string) con el rendimiento de cada araña y del conjunto.
+    '''
+    lines = [format_throughput(name, throughput(stats)) for name, stats in sorted(stats_by_spider.items())]
+    if len(stats_by_spider) > 1:
+        lines.append(format_throughput('total', combined_throughput(stats_by_spider)))
+    return '\n'.join(lines)
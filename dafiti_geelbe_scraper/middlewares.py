@@ -5,7 +5,22 @@
 # See documentation in:
 # http://doc.scrapy.org/en/latest/topics/spider-middleware.html
 
-from scrapy import signals
+from scrapy import signals, Request
+from scrapy.exceptions import IgnoreRequest
+from collections import deque
+import zlib
+
+# La descompresión de brotli por bloques requiere brotli >= 1.2 (output_buffer_limit). Con
+# versiones anteriores, no se acepta la codificación 'br'.
+try:
+    import brotli
+    if not hasattr(brotli.Decompressor, 'can_accept_more_data'):
+        brotli = None
+except ImportError:
+    brotli = None
+
+# Excepciones de los descompresores
+DECOMPRESSION_ERRORS = (zlib.error,) + ((brotli.error,) if brotli is not None else ())
 
 
 class DafitiGeelbeScraperSpiderMiddleware(object):
@@ -54,3 +69,298 @@ class DafitiGeelbeScraperSpiderMiddleware(object):
 
     def spider_opened(self, spider):
         spider.logger.info('Spider opened: %s' % spider.name)
+
+
+class ExtractionHealthMiddleware:
+    '''
+    Vigila la extracción de items de las páginas de productos (peticiones de tipo 'leaf') de
+    cada callback de la araña. Para cada callback mantiene una ventana con las últimas
+    EXTRACTION_HEALTH_WINDOW páginas: Cuántos items se han extraído de cada una y qué campos
+    no se han encontrado.
+
+    Si el porcentaje de páginas de las que se extraen items baja de EXTRACTION_HEALTH_MIN_ITEM_RATE
+    (una vez procesadas al menos EXTRACTION_HEALTH_MIN_PAGES páginas), se muestra en el log qué
+    campos han dejado de encontrarse y se aplica la acción EXTRACTION_HEALTH_ACTION:
+    - 'abort': Se termina el escrapeo (motivo 'extraction_unhealthy')
+    - 'throttle': Se aumenta el retardo entre peticiones a EXTRACTION_HEALTH_THROTTLE_DELAY segundos.
+    - 'log': Solo se muestra el aviso.
+
+    Las estadísticas extraction/<callback>/pages, empty_pages y missing/<campo> contienen los
+    totales del escrapeo. Si no se encuentra en una página el elemento que contiene los items (ver
+    extraction.MissingContainerError), el campo es su selector.
+    '''
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.windows = {}
+        self.unhealthy = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_spider_output(self, response, result, spider):
+        if response.meta.get('request_type') != 'leaf':
+            yield from result
+            return
+
+        num_items = 0
+        for value in result:
+            if not isinstance(value, Request):
+                num_items += 1
+            yield value
+
+        # Los errores de extracción los registra la araña (Spider.extraction_error)
+        missing = [getattr(error, 'field', 'unknown') for error in response.meta.get('extraction_errors', [])]
+        self.record_page(spider, self.get_callback_name(response, spider), num_items, missing)
+
+    def process_spider_exception(self, response, exception, spider):
+        if response.meta.get('request_type') == 'leaf':
+            self.record_page(spider, self.get_callback_name(response, spider), 0,
+                             [getattr(exception, 'field', 'unknown')])
+
+
+    def get_callback_name(self, response, spider):
+        callback = response.request.callback if response.request is not None else None
+        return getattr(callback, '__name__', 'parse')
+
+    def record_page(self, spider, callback, num_items, missing):
+        '''
+        Registra el resultado de la extracción de una página y comprueba la ventana del callback.
+        :param num_items: Es el número de items extraídos de la página.
+        :param missing: Son los nombres de los campos que no se han encontrado (uno por cada
+        item que no se ha podido extraer)
+        '''
+        config = spider.get_config()
+        stats = self.crawler.stats
+        stats.inc_value('extraction/{}/pages'.format(callback), spider = spider)
+        if num_items == 0:
+            stats.inc_value('extraction/{}/empty_pages'.format(callback), spider = spider)
+        for field in missing:
+            stats.inc_value('extraction/{}/missing/{}'.format(callback, field), spider = spider)
+
+        window = self.windows.setdefault(callback, deque(maxlen = config.EXTRACTION_HEALTH_WINDOW))
+        window.append((num_items, set(missing)))
+        if len(window) < config.EXTRACTION_HEALTH_MIN_PAGES or callback in self.unhealthy:
+            return
+
+        item_rate = len([page for page in window if page[0] > 0]) / len(window)
+        if item_rate >= config.EXTRACTION_HEALTH_MIN_ITEM_RATE:
+            return
+
+        self.unhealthy.add(callback)
+        self.on_unhealthy(spider, callback, item_rate, window)
+
+    def on_unhealthy(self, spider, callback, item_rate, window):
+        '''
+        Se invoca cuando el porcentaje de páginas de un callback de las que se extraen items
+        está por debajo del mínimo.
+        '''
+        config = spider.get_config()
+
+        # Porcentaje de páginas de la ventana en las que falta cada campo.
+        missing = {}
+        for _, fields in window:
+            for field in fields:
+                missing[field] = missing.get(field, 0) + 1
+        fields = ', '.join(['{} ({:.0%})'.format(field, count / len(window))
+                            for field, count in sorted(missing.items(), key = lambda item: -item[1])])
+
+        spider.log.error('Extraction unhealthy on {}: items extracted from {:.0%} of the last {} pages. '
+                         'Missing fields or selectors: {}', callback, item_rate, len(window), fields or 'none')
+        self.crawler.stats.set_value('extraction/{}/unhealthy'.format(callback), True, spider = spider)
+
+        action = config.EXTRACTION_HEALTH_ACTION
+        if action == 'abort':
+            self.crawler.engine.close_spider(spider, 'extraction_unhealthy')
+        elif action == 'throttle':
+            # El retardo se aplica a las ranuras de descarga existentes y a las nuevas.
+            delay = config.EXTRACTION_HEALTH_THROTTLE_DELAY
+            spider.download_delay = delay
+            for slot in self.crawler.engine.downloader.slots.values():
+                slot.delay = max(slot.delay, delay)
+
+
+
+class ResponseTooLargeError(IgnoreRequest):
+    '''
+    Se genera cuando una respuesta supera el presupuesto de tamaño de su petición.
+    '''
+    pass
+
+
+def zlib_chunks(body, wbits, chunk_size, members = False):
+    '''
+    Descomprime un contenido zlib (gzip o deflate) por bloques.
+    :param members: Si es True, el contenido puede tener varios miembros gzip concatenados: Se
+    descomprimen todos. Lo que sigue al último miembro y no es otro miembro se ignora.
+    :return: Devuelve un generador con los bloques descomprimidos (de hasta chunk_size bytes)
+    '''
+    data = body
+    while True:
+        decompressor = zlib.decompressobj(wbits)
+        while not decompressor.eof:
+            chunk = decompressor.decompress(data, chunk_size) if len(data) > 0 else decompressor.flush()
+            yield chunk
+            data = decompressor.unconsumed_tail
+            if len(data) == 0 and len(chunk) == 0:
+                # El contenido está truncado.
+                return
+        data = decompressor.unused_data
+        if not members or not data.startswith(b'\x1f\x8b'):
+            return
+
+
+def brotli_chunks(body, chunk_size):
+    '''
+    Descomprime un contenido brotli por bloques (requiere brotli >= 1.2)
+    :return: Devuelve un generador con los bloques descomprimidos (brotli puede devolver bloques
+    algo mayores que chunk_size)
+    '''
+    decompressor = brotli.Decompressor()
+    yield decompressor.process(body, output_buffer_limit = chunk_size)
+    while not decompressor.is_finished():
+        chunk = decompressor.process(b'', output_buffer_limit = chunk_size)
+        if len(chunk) == 0:
+            # El contenido está truncado.
+            return
+        yield chunk
+
+
+def decompress(body, encoding, max_size = None, chunk_size = 64 * 1024):
+    '''
+    Descomprime el contenido de una respuesta por bloques, sin superar max_size bytes.
+    :param encoding: Es la codificación del contenido: 'gzip', 'x-gzip', 'deflate' o 'br' (si está
+    instalado el paquete brotli)
+    :return: Devuelve el contenido descomprimido.
+    :raise ResponseTooLargeError: Si el contenido descomprimido ocupa más de max_size bytes. La
+    descompresión se detiene en cuanto se supera (no se descomprime el resto)
+    '''
+    if encoding == 'br':
+        sources = [lambda: brotli_chunks(body, chunk_size)]
+    elif encoding in ('gzip', 'x-gzip'):
+        sources = [lambda: zlib_chunks(body, 16 + zlib.MAX_WBITS, chunk_size, members = True)]
+    else:
+        # Algunos servidores envían deflate sin la cabecera zlib.
+        sources = [lambda: zlib_chunks(body, zlib.MAX_WBITS, chunk_size),
+                   lambda: zlib_chunks(body, -zlib.MAX_WBITS, chunk_size)]
+
+    for index, source in enumerate(sources):
+        chunks, size = [], 0
+        try:
+            for chunk in source():
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise ResponseTooLargeError('Decompressed body exceeds {} bytes'.format(max_size))
+                chunks.append(chunk)
+            return b''.join(chunks)
+        except zlib.error:
+            if index == len(sources) - 1:
+                raise
+
+
+class ResponseSizeBudgetMiddleware:
+    '''
+    Limita el tamaño de las respuestas según el presupuesto de su petición (request.meta['size_budget']):
+    'listing' (listados), 'product' (páginas de productos), 'lazyload' (listados de Geelbe) y
+    'splash' (páginas renderizadas por Splash). El tamaño máximo de cada presupuesto es la
+    variable de configuración RESPONSE_MAX_SIZE_<PRESUPUESTO> (None para no limitarlo)
+
+    - Durante la descarga: El tamaño máximo se establece como download_maxsize de la petición,
+    por lo que Scrapy cancela la descarga en cuanto la respuesta lo supera.
+    - Al descomprimir (gzip, deflate y brotli si está instalado el paquete brotli): El contenido se
+    descomprime por bloques y se descarta la respuesta en cuanto supera el tamaño máximo. Reemplaza
+    a HttpCompressionMiddleware de Scrapy.
+
+    Las respuestas que superan el presupuesto se descartan (IgnoreRequest). Las estadísticas
+    response_size/<presupuesto>/ muestran dónde se usa la memoria:
+        responses: Número de respuestas.
+        bytes, wire_bytes: Tamaño total del contenido (descomprimido y descargado)
+        avg_bytes, max_bytes: Tamaño medio y máximo del contenido de cada respuesta.
+        oversized: Respuestas descartadas por superar el presupuesto.
+    '''
+    encodings = ['gzip', 'x-gzip', 'deflate'] + (['br'] if brotli is not None else [])
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def get_budget(self, request, spider):
+        '''
+        :return: Devuelve una tupla (presupuesto, tamaño máximo en bytes) de la petición.
+        '''
+        budget = request.meta.get('size_budget', 'listing')
+        get_config = getattr(spider, 'get_config', None)
+        if get_config is None:
+            return budget, None
+        return budget, get_config().get_value('RESPONSE_MAX_SIZE_{}'.format(budget.upper()))
+
+    def process_request(self, request, spider):
+        request.headers.setdefault('Accept-Encoding', ', '.join(self.encodings))
+        budget, max_size = self.get_budget(request, spider)
+        if max_size is not None:
+            request.meta.setdefault('download_maxsize', max_size)
+
+    def process_response(self, request, response, spider):
+        budget, max_size = self.get_budget(request, spider)
+        stats = self.crawler.stats
+        wire_size = len(response.body)
+        if max_size is not None and wire_size > max_size:
+            self.oversized(request, spider, budget, max_size)
+
+        encodings = [encoding.decode('latin-1').strip().lower() for encoding in
+                     b','.join(response.headers.getlist('Content-Encoding')).split(b',') if encoding.strip()]
+        if request.method != 'HEAD' and response.status not in (204, 304) and len(encodings) > 0 and \
+                encodings[-1] in self.encodings:
+            body = response.body
+            # Las codificaciones se aplican en orden, por lo que se deshacen en orden inverso.
+            while len(encodings) > 0 and encodings[-1] in self.encodings:
+                try:
+                    body = decompress(body, encodings.pop(), max_size)
+                except ResponseTooLargeError:
+                    self.oversized(request, spider, budget, max_size)
+                except DECOMPRESSION_ERRORS as e:
+                    spider.log.warning('Failed decompressing {}: {}', response.url, e)
+                    return response
+            response = self.decompressed_response(response, body, encodings)
+
+        size = len(response.body)
+        prefix = 'response_size/{}/'.format(budget)
+        stats.inc_value(prefix + 'responses', spider = spider)
+        stats.inc_value(prefix + 'bytes', size, spider = spider)
+        stats.inc_value(prefix + 'wire_bytes', wire_size, spider = spider)
+        stats.max_value(prefix + 'max_bytes', size, spider = spider)
+        stats.set_value(prefix + 'avg_bytes', stats.get_value(prefix + 'bytes', spider = spider) //
+                        stats.get_value(prefix + 'responses', spider = spider), spider = spider)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        # Scrapy cancela las descargas que superan download_maxsize.
+        from twisted.internet.defer import CancelledError
+
+        budget, max_size = self.get_budget(request, spider)
+        if max_size is not None and isinstance(exception, CancelledError):
+            self.crawler.stats.inc_value('response_size/{}/oversized'.format(budget), spider = spider)
+
+    def decompressed_response(self, response, body, encodings):
+        from scrapy.http import TextResponse
+        from scrapy.responsetypes import responsetypes
+
+        headers = response.headers.copy()
+        if len(encodings) > 0:
+            headers['Content-Encoding'] = ', '.join(encodings)
+        else:
+            del headers['Content-Encoding']
+        response_class = responsetypes.from_args(headers = headers, url = response.url, body = body)
+        kwargs = {'cls' : response_class, 'body' : body, 'headers' : headers}
+        if issubclass(response_class, TextResponse):
+            # La codificación se obtiene de nuevo a partir de las cabeceras y del contenido.
+            kwargs['encoding'] = None
+        return response.replace(**kwargs)
+
+    def oversized(self, request, spider, budget, max_size):
+        self.crawler.stats.inc_value('response_size/{}/oversized'.format(budget), spider = spider)
+        spider.log.warning('Response from {} exceeds the "{}" size budget ({} bytes)', request.url, budget, max_size)
+        raise ResponseTooLargeError('Response exceeds the "{}" size budget'.format(budget))
@@ -0,0 +1,227 @@
+'''
+Este script actualiza bases de datos de artículos (articles.db) creadas con versiones anteriores
+del esquema. Cada migración comprueba si es necesaria, por lo que puede ejecutarse varias veces
+sobre la misma base de datos.
+
+Al terminar, muestra el tamaño de la base de datos y el tiempo de una consulta representativa (los
+artículos de la marca más frecuente de un proveedor, ordenados por precio) antes y después.
+
+Uso:
+    PYTHONPATH=dafiti_geelbe_scraper python dafiti_geelbe_scraper/migrations.py [ruta a articles.db]
+'''
+
+import sqlite3
+from os.path import getsize, exists, abspath
+import time
+import sys
+
+
+def table_exists(connection, table):
+    return connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                              (table,)).fetchone() is not None
+
+
+def table_columns(connection, table):
+    return dict([(row[1], row[2].upper()) for row in connection.execute('PRAGMA table_info("{}")'.format(table))])
+
+
+class Migration:
+    '''
+    Representa una migración del esquema de la base de datos.
+    before_mapping se invoca antes de que pony genere el mapeado (y cree las tablas nuevas),
+    y after_mapping después.
+    '''
+    description = ''
+
+    def applies(self, connection):
+        '''
+        :return: Devuelve True si la base de datos necesita esta migración.
+        '''
+        return False
+
+    def before_mapping(self, connection):
+        pass
+
+    def after_mapping(self, connection):
+        pass
+
+
+class LookupTablesMigration(Migration):
+    '''
+    Las columnas brand, line y provider de la tabla Article pasan de ser texto a ser
+    claves foráneas a las tablas Brand, Line y Provider.
+    '''
+    description = 'Normalize brand, line and provider into lookup tables'
+    lookups = [('brand', 'Brand'), ('line', 'Line'), ('provider', 'Provider')]
+
+    def applies(self, connection):
+        return table_exists(connection, 'Article') and table_columns(connection, 'Article').get('brand') == 'TEXT'
+
+    def before_mapping(self, connection):
+        connection.execute('ALTER TABLE Article RENAME TO Article_legacy')
+
+        # Los índices se mantienen con el mismo nombre tras renombrar la tabla. Los eliminamos
+        # para que pony pueda crearlos en la nueva tabla.
+        indexes = connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND "
+                                     "tbl_name = 'Article_legacy' AND sql IS NOT NULL").fetchall()
+        for name, in indexes:
+            connection.execute('DROP INDEX "{}"'.format(name))
+
+    def after_mapping(self, connection):
+        for column, table in self.lookups:
+            connection.execute('INSERT OR IGNORE INTO {table}(name) SELECT DISTINCT {column} FROM Article_legacy'.format(
+                table = table, column = column))
+
+        # Pony guarda los campos de texto opcionales vacíos como '' (columnas NOT NULL)
+        connection.execute('''
+            INSERT INTO Article(id, price, name, line, brand, provider, image, sku)
+            SELECT a.id, a.price, a.name, l.id, b.id, p.id, a.image, ''
+            FROM Article_legacy a
+                JOIN Line l ON l.name = a.line
+                JOIN Brand b ON b.name = a.brand
+                JOIN Provider p ON p.name = a.provider
+        ''')
+        connection.execute('DROP TABLE Article_legacy')
+
+
+class AddColumnMigration(Migration):
+    '''
+    Añade una nueva columna a una tabla existente.
+    '''
+    def __init__(self, table, column, definition):
+        self.table, self.column, self.definition = table, column, definition
+        self.description = 'Add column {}.{}'.format(table, column)
+
+    def applies(self, connection):
+        return table_exists(connection, self.table) and self.column not in table_columns(connection, self.table)
+
+    def before_mapping(self, connection):
+        # Una migración anterior puede haber eliminado la tabla (pony la creará de nuevo)
+        if self.applies(connection):
+            connection.execute('ALTER TABLE "{}" ADD COLUMN "{}" {}'.format(self.table, self.column, self.definition))
+
+
+# Consulta representativa: Artículos de una marca de un proveedor ordenados por precio. Antes de
+# LookupTablesMigration, la marca y el proveedor son columnas de texto de la tabla Article.
+LEGACY_ARTICLES_QUERY = 'SELECT name, price FROM Article WHERE provider = ? AND brand = ? ORDER BY price'
+ARTICLES_QUERY = '''
+    SELECT a.name, a.price
+    FROM Article a
+        JOIN Provider p ON p.id = a.provider
+        JOIN Brand b ON b.id = a.brand
+    WHERE p.name = ? AND b.name = ?
+    ORDER BY a.price
+'''
+LEGACY_TOP_BRAND_QUERY = 'SELECT provider, brand FROM Article GROUP BY provider, brand ORDER BY COUNT(*) DESC LIMIT 1'
+TOP_BRAND_QUERY = '''
+    SELECT p.name, b.name
+    FROM Article a
+        JOIN Provider p ON p.id = a.provider
+        JOIN Brand b ON b.id = a.brand
+    GROUP BY p.name, b.name
+    ORDER BY COUNT(*) DESC
+    LIMIT 1
+'''
+
+
+def top_brand(db_path):
+    '''
+    :return: Devuelve una tupla (proveedor, marca) con la marca con más artículos, o None si no hay
+    artículos.
+    '''
+    connection = sqlite3.connect(db_path)
+    try:
+        if not table_exists(connection, 'Article'):
+            return None
+        legacy = LookupTablesMigration().applies(connection)
+        return connection.execute(LEGACY_TOP_BRAND_QUERY if legacy else TOP_BRAND_QUERY).fetchone()
+    finally:
+        connection.close()
+
+
+def query_time(db_path, provider, brand, repeat = 20):
+    '''
+    Mide el tiempo de la consulta representativa (con el esquema actual de la base de datos)
+    :return: Devuelve el tiempo medio de la consulta en segundos.
+    '''
+    connection = sqlite3.connect(db_path)
+    try:
+        query = LEGACY_ARTICLES_QUERY if LookupTablesMigration().applies(connection) else ARTICLES_QUERY
+        connection.execute(query, (provider, brand)).fetchall()
+        start_time = time.perf_counter()
+        for index in range(0, repeat):
+            connection.execute(query, (provider, brand)).fetchall()
+        return (time.perf_counter() - start_time) / repeat
+    finally:
+        connection.close()
+
+
+# Listado de migraciones, en el orden en el que deben aplicarse.
+MIGRATIONS = [
+    LookupTablesMigration(),
+    AddColumnMigration('Article', 'last_seen', 'INTEGER REFERENCES "CrawlRun" ("id") ON DELETE SET NULL'),
+    AddColumnMigration('Article', 'sku', 'TEXT'),
+    AddColumnMigration('Article', 'list_price', 'REAL'),
+    AddColumnMigration('Article', 'first_seen', 'INTEGER REFERENCES "CrawlRun" ("id") ON DELETE SET NULL'),
+    AddColumnMigration('CrawlRun', 'partial', 'BOOLEAN NOT NULL DEFAULT 0')
+]
+
+
+def migrate(db_path):
+    '''
+    Aplica todas las migraciones pendientes sobre la base de datos indicada.
+    :param db_path: Es la ruta del fichero de base de datos sqlite.
+    :return: Devuelve un listado con las migraciones aplicadas.
+    '''
+    connection = sqlite3.connect(db_path, isolation_level = None)
+    try:
+        pending = [migration for migration in MIGRATIONS if migration.applies(connection)]
+        if len(pending) == 0:
+            return []
+
+        connection.execute('BEGIN')
+        for migration in pending:
+            migration.before_mapping(connection)
+        connection.execute('COMMIT')
+
+        # Pony crea las tablas que faltan con el esquema actual.
+        from db import db
+        db.generate_mapping()
+        db.disconnect()
+
+        connection.execute('BEGIN')
+        for migration in pending:
+            migration.after_mapping(connection)
+        connection.execute('COMMIT')
+
+        connection.execute('VACUUM')
+        return pending
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    from config import global_config
+
+    if len(sys.argv) > 1:
+        # El mapeado de pony usa la base de datos indicada en la configuración.
+        global_config.set_value('OUTPUT_DATA_TO_SQLITE', abspath(sys.argv[1]))
+    db_path = global_config.path.OUTPUT_DATA_TO_SQLITE
+    if not exists(db_path):
+        print('Database "{}" does not exist'.format(db_path))
+        sys.exit(1)
+
+    size_before = getsize(db_path)
+    brand = top_brand(db_path)
+    time_before = query_time(db_path, *brand) if brand is not None else None
+
+    applied = migrate(db_path)
+    for migration in applied:
+        print('Applied: {}'.format(migration.description))
+    if len(applied) == 0:
+        print('Database is up to date')
+
+    if brand is not None:
+        print('Query time (articles of "{}" on {}): {:.3f} -> {:.3f} ms'.format(
+            brand[1], brand[0], time_before * 1000, query_time(db_path, *brand) * 1000))
+    print('Database size: {} -> {} bytes'.format(size_before, getsize(db_path)))
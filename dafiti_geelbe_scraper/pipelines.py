@@ -7,7 +7,18 @@
 
 
 from db import db, db_session
+from datetime import datetime
 from entities.article import Article
+from entities.brand import Brand
+from entities.line import Line
+from entities.provider import Provider
+from entities.crawl_run import CrawlRun
+from feeds import FeedWriter
+from images import ImageStore
+import images
+from scrapy import Request, signals
+from twisted.internet.threads import deferToThread
+import time
 
 class DefaultPipeline(object):
     def process_item(self, item, spider):
@@ -18,26 +29,261 @@ class DefaultPipeline(object):
 class DatabasePipeline:
     '''
     Pipeline que almacena los items scrapeados en una base de datos.
+    Los items se acumulan en memoria y se guardan en bloques de STORAGE_BATCH_SIZE artículos
+    usando el backend de almacenamiento configurado. Si el artículo ya existe (mismo nombre y
+    proveedor), se actualiza.
+    Los artículos nuevos y los cambios de precio de cada bloque se guardan en la tabla
+    PriceSnapshot en la misma transacción que el bloque.
+    Si se indica el directorio OUTPUT_DELTA_DIR, al finalizar se escribe en él un feed con los
+    cambios del catálogo en este escrapeo: Artículos nuevos, eliminados (encontrados en la
+    ejecución anterior de la araña y no en esta) y cambios de precio.
+    Si varias arañas se ejecutan en el mismo proceso (run_all.py), todas escriben a través de la
+    misma base de datos (db) y de la misma conexión.
     '''
     def __init__(self):
-        self.mapping_generated = False
+        self.crawl_id = None
+        self.batch_size = 1
+        self.items = []
 
     def open_spider(self, spider):
-        if not self.mapping_generated:
-            self.mapping_generated = True
-            db.generate_mapping()
+        config = spider.get_config()
+        self.batch_size = config.STORAGE_BATCH_SIZE or 1
+        # Si hay varias arañas en el proceso, la base de datos se enlaza con la configuración de la primera.
+        db.generate_mapping(config = config)
+
+        with db_session:
+            crawl = CrawlRun(spider = spider.name, partial = spider.is_partial_crawl())
+            crawl.flush()
+            self.crawl_id = crawl.id
+        self.items = []
+        spider.crawler.signals.connect(self.spider_closed, signal = signals.spider_closed)
 
     def close_spider(self, spider):
-        pass
+        self.flush_items(spider)
+        with db_session:
+            if spider.get_config().path.OUTPUT_DELTA_DIR:
+                self.write_delta(spider)
+            CrawlRun[self.crawl_id].finished = datetime.now()
+
+    def spider_closed(self, spider, reason):
+        '''
+        Si el escrapeo no ha terminado normalmente (e.g: se ha abortado o cancelado), la ejecución
+        se marca como parcial. El motivo no se conoce aún en close_spider.
+        '''
+        if reason != 'finished' and self.crawl_id is not None:
+            with db_session:
+                CrawlRun[self.crawl_id].partial = True
+
+    def write_delta(self, spider):
+        '''
+        Escribe el feed de cambios del catálogo de este escrapeo en el directorio OUTPUT_DELTA_DIR.
+        Debe invocarse dentro de una sesión de base de datos, después de guardar todos los items.
+        '''
+        config = spider.get_config()
+        connection = db.get_connection()
+
+        # Si la araña solo ha escrapeado una parte del catálogo, no se buscan artículos eliminados.
+        previous_crawl_id = None
+        if not spider.is_partial_crawl():
+            previous_crawl_id = db.backend.previous_crawl(connection, self.crawl_id)
+
+        writer = FeedWriter(
+            directory = config.path.OUTPUT_DELTA_DIR,
+            prefix = '{}-delta-{}'.format(spider.name, self.crawl_id),
+            format = 'jsonl',
+            compression = config.FEED_COMPRESSION,
+            flush_interval = config.FEED_FLUSH_INTERVAL or 1.0)
+
+        counts = {'new' : 0, 'price' : 0, 'removed' : 0}
+        fields = ['change', 'id', 'name', 'brand', 'line', 'provider', 'price', 'previous_price']
+        for row in db.backend.delta_rows(connection, self.crawl_id, previous_crawl_id):
+            record = dict(zip(fields, row))
+            record['crawl'] = self.crawl_id
+            counts[record['change']] += 1
+            writer.write(record)
+        writer.close()
+
+        for change, count in counts.items():
+            spider.crawler.stats.set_value('delta/{}'.format(change), count, spider = spider)
+        spider.log.debug('Delta: {} new, {} price changes, {} removed articles', counts['new'], counts['price'],
+                         counts['removed'])
+
 
-    @db_session
     def process_item(self, item, spider):
-        entity_types = [Article]
+        if isinstance(item, Article.ScrapyItem):
+            self.items.append(item)
+            if len(self.items) >= self.batch_size:
+                self.flush_items(spider)
+
+        return item
+
+    def flush_items(self, spider):
+        '''
+        Guarda en la base de datos los items acumulados.
+        '''
+        if len(self.items) == 0:
+            return
+        items, self.items = self.items, []
+        self.store_in_batches(items, spider)
 
+    def store_in_batches(self, items, spider):
+        '''
+        Guarda en la base de datos los items indicados. Si el bloque falla, se divide en dos
+        mitades y se reintenta cada una, hasta aislar los artículos que fallan. Solo se descartan
+        estos (se cuentan en la estadística database/articles/dropped)
+        '''
         try:
-            entity_type = next(iter([entity_type for entity_type in entity_types if isinstance(item, entity_type.ScrapyItem)]))
-            entity = entity_type.load_from_scrapy_item(item)
-        except:
-            pass
+            self.store_articles(items)
+            spider.crawler.stats.inc_value('database/articles/stored', len(items), spider = spider)
+        except Exception as e:
+            # Los ids creados en la transacción deshecha ya no son válidos.
+            for lookup in [Brand, Line, Provider]:
+                lookup.clear_interned()
+            if len(items) > 1:
+                middle = len(items) // 2
+                self.store_in_batches(items[:middle], spider)
+                self.store_in_batches(items[middle:], spider)
+                return
+            spider.crawler.stats.inc_value('database/articles/dropped', spider = spider)
+            spider.log.error('Failed to store article "{}": {}', items[0].get('name'), e)
+
+    @db_session
+    def store_articles(self, items):
+        '''
+        Inserta o actualiza los artículos asociados a los items scrapeados indicados, y guarda en
+        la tabla PriceSnapshot los artículos nuevos o cuyo precio ha cambiado (en la misma
+        transacción)
+        '''
+        rows = []
+        for item in items:
+            rows.append((item['name'], Provider.intern(item['provider']), Brand.intern(item['brand']),
+                         Line.intern(item['line']), item['price'], item.get('image'), item.get('sku'),
+                         item.get('list_price')))
+
+        connection = db.get_connection()
+        snapshots = db.backend.merge_articles(connection, rows, self.crawl_id)
+        db.backend.insert_snapshots(connection, snapshots)
+        connection.commit()
+
+
+
+class FeedPipeline:
+    '''
+    Pipeline que escribe los items scrapeados en un feed (ficheros JSON lines o CSV comprimidos)
+    en el directorio OUTPUT_DATA_TO_FEED. Ver el módulo feeds.
+    '''
+    def __init__(self):
+        self.writer = None
+
+    def open_spider(self, spider):
+        config = spider.get_config()
+        self.writer = FeedWriter(
+            directory = config.path.OUTPUT_DATA_TO_FEED,
+            prefix = spider.name,
+            format = config.FEED_FORMAT or 'jsonl',
+            compression = config.FEED_COMPRESSION,
+            fields = sorted(Article.ScrapyItem.fields.keys()),
+            rotate_bytes = config.FEED_ROTATE_BYTES,
+            rotate_items = config.FEED_ROTATE_ITEMS,
+            flush_interval = config.FEED_FLUSH_INTERVAL or 1.0)
 
+    def close_spider(self, spider):
+        file_paths = self.writer.close()
+        spider.log.debug('Feed written to {} files', len(file_paths))
+
+    def process_item(self, item, spider):
+        if isinstance(item, Article.ScrapyItem):
+            self.writer.write(dict(item))
         return item
+
+
+
+class ImagePipeline:
+    '''
+    Pipeline que descarga las imágenes de los artículos al almacén de imágenes del directorio
+    OUTPUT_IMAGES_DIR (ver el módulo images)
+    - Las descargas usan el slot "images", con IMAGES_CONCURRENCY peticiones simultáneas.
+    - Si la imagen se descargó antes y el servidor devolvió una cabecera ETag, la petición es
+    condicional: Si la imagen no ha cambiado (respuesta 304), no se descarga de nuevo.
+    - Las imágenes repetidas (mismo contenido) se guardan una sola vez.
+    Al terminar se muestran el número de imágenes descargadas por segundo y el porcentaje de
+    imágenes repetidas (estadísticas images/*)
+    '''
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.store = None
+        self.start_time = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def open_spider(self, spider):
+        config = spider.get_config()
+        sizes = [int(size) for size in (config.IMAGES_THUMBNAIL_SIZES or '').split(',') if size.strip()]
+        if len(sizes) > 0 and images.Image is None:
+            spider.log.warning('Pillow is not installed. Image thumbnails are disabled')
+            sizes = []
+        self.store = ImageStore(config.path.OUTPUT_IMAGES_DIR, thumbnail_sizes = sizes)
+        self.start_time = time.time()
+
+    def close_spider(self, spider):
+        self.store.close()
+
+        downloaded = self.stats.get_value('images/downloaded', 0, spider = spider)
+        duplicates = self.stats.get_value('images/duplicates', 0, spider = spider)
+        seconds = max(time.time() - self.start_time, 1e-6)
+        self.stats.set_value('images/dedup_ratio', round(duplicates / downloaded, 4) if downloaded > 0 else 0.0,
+                             spider = spider)
+        spider.log.warning('Images: {} downloaded ({:.2f}/s), {} new, {} duplicates, {} not modified, {} failed',
+                           downloaded, downloaded / seconds, self.stats.get_value('images/stored', 0, spider = spider),
+                           duplicates, self.stats.get_value('images/not_modified', 0, spider = spider),
+                           self.stats.get_value('images/failed', 0, spider = spider))
+
+    def process_item(self, item, spider):
+        url = item.get('image') if isinstance(item, Article.ScrapyItem) else None
+        if url is None or not url.startswith(('http://', 'https://')):
+            return item
+
+        headers = {}
+        previous = self.store.lookup(url)
+        if previous is not None and previous[1] is not None:
+            headers['If-None-Match'] = previous[1]
+
+        request = Request(url = url, headers = headers, priority = 100,
+                          meta = {'download_slot' : 'images', 'request_type' : 'image',
+                                  'handle_httpstatus_list' : [304]})
+        deferred = self.crawler.engine.download(request)
+        deferred.addCallback(self.image_downloaded, url, previous, spider)
+        deferred.addErrback(self.image_failed, url, spider)
+        deferred.addBoth(lambda _: item)
+        return deferred
+
+    def image_downloaded(self, response, url, previous, spider):
+        if response.status == 304 and previous is not None:
+            self.stats.inc_value('images/not_modified', spider = spider)
+            return
+        if response.status != 200:
+            self.stats.inc_value('images/failed', spider = spider)
+            return
+
+        self.stats.inc_value('images/downloaded', spider = spider)
+        self.stats.inc_value('images/bytes', len(response.body), spider = spider)
+        content_type = response.headers.get('Content-Type', b'').decode('latin-1')
+        etag = response.headers.get('ETag')
+        etag = etag.decode('latin-1') if etag is not None else None
+
+        # Las imágenes se escriben en disco en otro hilo. El índice solo se usa en este.
+        deferred = deferToThread(self.store.put, url, response.body, content_type)
+        deferred.addCallback(self.image_stored, url, etag, spider)
+        return deferred
+
+    def image_stored(self, result, url, etag, spider):
+        hash, new = result
+        self.stats.inc_value('images/stored' if new else 'images/duplicates', spider = spider)
+        self.store.register(url, hash, etag)
+
+    def image_failed(self, failure, url, spider):
+        self.stats.inc_value('images/failed', spider = spider)
+        spider.log.warning('Failed downloading image {}: {}', url, failure.getErrorMessage())
@@ -0,0 +1,227 @@
+'''
+Este script genera informes sobre los artículos escrapeados. Accede a la base de datos en modo
+de solo lectura, por lo que puede ejecutarse mientras las arañas escriben en ella.
+
+Informes:
+- prices: Número de artículos y precio mínimo, medio y máximo por proveedor, marca y línea.
+Se resuelve con el índice de cobertura (provider, brand, line, price), sin leer la tabla de
+artículos.
+- cheapest: Proveedor más barato de cada producto relacionado entre proveedores (ver matching.py)
+- counts: Número de artículos, marcas y líneas de cada proveedor, y artículos encontrados en la
+última ejecución de cada araña.
+
+Las consultas son sentencias SQL fijas con parámetros, por lo que el driver reutiliza las
+sentencias preparadas. Los resultados se guardan en caché (directorio REPORT_CACHE_DIR) asociados a
+la versión de los datos (última ejecución de las arañas y parejas de artículos, ver data_version):
+Mientras no cambie, se devuelven los resultados guardados. Al guardar un resultado se eliminan
+los de versiones anteriores.
+
+Uso:
+    PYTHONPATH=dafiti_geelbe_scraper python dafiti_geelbe_scraper/report.py <prices|cheapest|counts>
+        [--provider P] [--brand B] [--limit N] [--format table|json] [--no-cache]
+'''
+
+from config import global_config
+from storage import get_storage_backend
+from os import makedirs, replace, listdir, remove
+from os.path import join, exists
+from hashlib import sha1
+from datetime import datetime, timedelta
+import argparse
+import json
+import time
+
+
+REPORT_QUERIES = {
+    'prices' : '''
+        SELECT p.name, b.name, l.name, s.articles, s.min_price, s.avg_price, s.max_price
+        FROM (
+            SELECT provider, brand, line, COUNT(*) AS articles, MIN(price) AS min_price,
+                AVG(price) AS avg_price, MAX(price) AS max_price
+            FROM Article
+            WHERE ({param} IS NULL OR provider = (SELECT id FROM Provider WHERE name = {param}))
+                AND ({param} IS NULL OR brand = (SELECT id FROM Brand WHERE name = {param}))
+            GROUP BY provider, brand, line
+        ) s
+            JOIN Provider p ON p.id = s.provider
+            JOIN Brand b ON b.id = s.brand
+            JOIN Line l ON l.id = s.line
+        ORDER BY p.name, b.name, l.name
+        LIMIT {param}
+    ''',
+    'cheapest' : '''
+        SELECT b.name, a.name, pa.name, a.price, o.name, po.name, o.price, m.similarity,
+            CASE WHEN a.price <= o.price THEN pa.name ELSE po.name END
+        FROM ArticleMatch m
+            JOIN Article a ON a.id = m.article
+            JOIN Article o ON o.id = m.other
+            JOIN Brand b ON b.id = a.brand
+            JOIN Provider pa ON pa.id = a.provider
+            JOIN Provider po ON po.id = o.provider
+        WHERE ({param} IS NULL OR pa.name = {param} OR po.name = {param}) AND ({param} IS NULL OR b.name = {param})
+        ORDER BY ABS(a.price - o.price) DESC
+        LIMIT {param}
+    ''',
+    'counts' : '''
+        SELECT p.name, COUNT(*), COUNT(DISTINCT a.brand), COUNT(DISTINCT a.line),
+            SUM(CASE WHEN a.last_seen = (SELECT MAX(c.id) FROM CrawlRun c WHERE c.spider = p.name
+                AND c.finished IS NOT NULL) THEN 1 ELSE 0 END)
+        FROM Article a
+            JOIN Provider p ON p.id = a.provider
+        WHERE ({param} IS NULL OR p.name = {param})
+        GROUP BY p.name
+        ORDER BY p.name
+        LIMIT {param}
+    '''
+}
+
+# Parámetros de las consultas de los informes.
+REPORT_PARAMS = {
+    'prices' : lambda provider, brand, limit: [provider, provider, brand, brand, limit],
+    'cheapest' : lambda provider, brand, limit: [provider, provider, provider, brand, brand, limit],
+    'counts' : lambda provider, brand, limit: [provider, provider, limit]
+}
+
+REPORT_COLUMNS = {
+    'prices' : ['provider', 'brand', 'line', 'articles', 'min_price', 'avg_price', 'max_price'],
+    'cheapest' : ['brand', 'article', 'provider', 'price', 'other_article', 'other_provider', 'other_price',
+                  'similarity', 'cheapest_provider'],
+    'counts' : ['provider', 'articles', 'brands', 'lines', 'last_crawl_articles']
+}
+
+
+def data_version(connection, stale_hours = None):
+    '''
+    :param stale_hours: Las ejecuciones sin terminar que comenzaron hace más de estas horas se
+    consideran abortadas (e.g: el proceso terminó sin cerrar la ejecución) y se ignoran. Por defecto,
+    REPORT_STALE_CRAWL_HOURS.
+    :return: Devuelve la versión de los datos de la base de datos: Una tupla con el id y la fecha
+    de fin de la última ejecución de las arañas y una suma de comprobación de las parejas de
+    ArticleMatch (matching.py las calcula de nuevo fuera de las arañas). Devuelve None si hay alguna
+    ejecución en curso (los datos pueden cambiar en cualquier momento)
+    '''
+    if stale_hours is None:
+        stale_hours = global_config.REPORT_STALE_CRAWL_HOURS
+    cursor = connection.cursor()
+    cursor.execute('SELECT MAX(id), MAX(finished) FROM CrawlRun')
+    last_crawl, last_finished = cursor.fetchone()
+    cursor.execute('SELECT started FROM CrawlRun WHERE finished IS NULL')
+    unfinished = [started if isinstance(started, datetime) else datetime.fromisoformat(started)
+                  for started, in cursor.fetchall()]
+    cursor.execute('SELECT COUNT(*), SUM(article + other), SUM(similarity) FROM ArticleMatch')
+    matches = tuple(cursor.fetchone())
+    cursor.close()
+
+    stale_before = datetime.now() - timedelta(hours = stale_hours)
+    if any([started > stale_before for started in unfinished]):
+        return None
+    return (last_crawl, str(last_finished)) + matches
+
+
+class Reporter:
+    '''
+    Ejecuta los informes sobre una conexión de solo lectura a la base de datos.
+    '''
+    def __init__(self, backend = None, cache_dir = None):
+        '''
+        Inicializa la instancia.
+        :param backend: Es el backend de almacenamiento. Por defecto, el de la configuración.
+        :param cache_dir: Es el directorio de la caché de resultados. Si es None, no se usa la caché.
+        '''
+        self.backend = backend or get_storage_backend()
+        self.connection = self.backend.connect_readonly()
+        self.cache_dir = cache_dir
+        # Las consultas se formatean una única vez. El texto de cada sentencia es siempre el mismo.
+        self.queries = dict([(name, query.format(param = self.backend.param)) for name, query in REPORT_QUERIES.items()])
+
+    def cache_paths(self, report, params):
+        '''
+        :return: Devuelve la ruta del fichero de la caché de un informe y el prefijo de los ficheros
+        de la versión actual de los datos. La ruta depende de sus parámetros y de la versión.
+        Devuelve (None, None) si hay alguna ejecución en curso (los resultados pueden cambiar en
+        cualquier momento)
+        '''
+        version = data_version(self.connection)
+        if version is None:
+            return None, None
+        prefix = sha1(json.dumps(version).encode('utf-8')).hexdigest()[:16]
+        key = sha1(json.dumps([report, params]).encode('utf-8')).hexdigest()
+        return join(self.cache_dir, '{}-{}-{}.json'.format(prefix, report, key)), prefix
+
+    def prune_cache(self, prefix):
+        '''
+        Elimina de la caché los ficheros de otras versiones de los datos (no volverán a usarse),
+        incluidos los temporales que hayan quedado.
+        '''
+        for name in listdir(self.cache_dir):
+            if not name.startswith(prefix + '-'):
+                try:
+                    remove(join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    def run(self, report, provider = None, brand = None, limit = 1000):
+        '''
+        :param report: Es el nombre del informe ('prices', 'cheapest' o 'counts')
+        :return: Devuelve las filas del informe (diccionarios con las columnas REPORT_COLUMNS)
+        '''
+        if report not in self.queries:
+            raise ValueError('Invalid report "{}"'.format(report))
+        params = REPORT_PARAMS[report](provider, brand, limit)
+
+        cache_path = None
+        if self.cache_dir is not None:
+            cache_path, prefix = self.cache_paths(report, params)
+            if cache_path is not None and exists(cache_path):
+                with open(cache_path, 'r') as fh:
+                    return json.load(fh)
+
+        cursor = self.connection.cursor()
+        cursor.execute(self.queries[report], params)
+        rows = [dict(zip(REPORT_COLUMNS[report], row)) for row in cursor.fetchall()]
+
+        if cache_path is not None:
+            makedirs(self.cache_dir, exist_ok = True)
+            self.prune_cache(prefix)
+            with open(cache_path + '.part', 'w') as fh:
+                json.dump(rows, fh)
+            replace(cache_path + '.part', cache_path)
+        return rows
+
+    def close(self):
+        self.connection.close()
+
+
+def format_table(columns, rows):
+    '''
+    :return: Devuelve un string con las filas indicadas en forma de tabla (columnas alineadas)
+    '''
+    def format_value(value):
+        return '{:.2f}'.format(value) if isinstance(value, float) else str(value)
+
+    cells = [columns] + [[format_value(row[column]) for column in columns] for row in rows]
+    widths = [max([len(row[index]) for row in cells]) for index in range(0, len(columns))]
+    return '\n'.join(['  '.join([cell.ljust(width) for cell, width in zip(row, widths)]).rstrip() for row in cells])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Reports over the scraped articles (read-only)')
+    parser.add_argument('report', choices = list(REPORT_QUERIES.keys()))
+    parser.add_argument('--provider')
+    parser.add_argument('--brand')
+    parser.add_argument('--limit', type = int, default = 1000)
+    parser.add_argument('--format', default = 'table', choices = ['table', 'json'])
+    parser.add_argument('--no-cache', action = 'store_true')
+    args = parser.parse_args()
+
+    reporter = Reporter(cache_dir = None if args.no_cache else global_config.path.REPORT_CACHE_DIR)
+    start_time = time.time()
+    rows = reporter.run(args.report, provider = args.provider, brand = args.brand, limit = args.limit)
+    elapsed = time.time() - start_time
+    reporter.close()
+
+    if args.format == 'json':
+        print(json.dumps(rows, indent = 2, default = str))
+    else:
+        print(format_table(REPORT_COLUMNS[args.report], rows))
+        print('{} rows in {:.1f}ms'.format(len(rows), elapsed * 1000))
@@ -0,0 +1,44 @@
+'''
+Este script ejecuta las arañas de Dafiti y Geelbe a la vez, en el mismo proceso.
+Ambas comparten el reactor, la base de datos (una sola conexión y un solo mapeado) y la
+configuración. Al terminar se muestra el rendimiento de cada araña y del conjunto.
+
+Uso:
+    ./crawl.sh all [-a VARIABLE=VALOR ...]
+    PYTHONPATH=dafiti_geelbe_scraper python dafiti_geelbe_scraper/run_all.py [-a VARIABLE=VALOR ...]
+'''
+
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+from metrics import throughput_report
+import argparse
+
+
+SPIDERS = ['dafiti', 'geelbe']
+
+
+def run_all(spiders = SPIDERS, spider_vars = {}):
+    '''
+    Ejecuta las arañas indicadas en el mismo proceso y espera a que terminen.
+    :param spiders: Nombres (o clases) de las arañas.
+    :param spider_vars: Variables de configuración para todas las arañas.
+    :return: Devuelve un diccionario con las estadísticas de cada araña (por nombre)
+    '''
+    process = CrawlerProcess(get_project_settings())
+    crawlers = {}
+    for spider in spiders:
+        crawler = process.create_crawler(spider)
+        crawlers[crawler.spidercls.name] = crawler
+        process.crawl(crawler, **spider_vars)
+    process.start()
+    return dict([(spider, crawler.stats.get_stats()) for spider, crawler in crawlers.items()])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Run the Dafiti and Geelbe spiders in one process')
+    parser.add_argument('-a', dest = 'vars', action = 'append', default = [], metavar = 'VARIABLE=VALUE',
+                        help = 'Configuration variable for all the spiders')
+    args = parser.parse_args()
+
+    stats = run_all(spider_vars = dict([var.split('=', 1) for var in args.vars]))
+    print(throughput_report(stats))
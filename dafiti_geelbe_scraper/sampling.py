@@ -0,0 +1,76 @@
+'''
+Este script define las funciones del modo de muestreo de las arañas (canary): Antes de un
+escrapeo completo, se escrapea una muestra pequeña y determinista del catálogo para comprobar
+que la extracción de datos funciona.
+
+El modo de muestreo se activa con la variable de configuración SAMPLE_SEED:
+    ./crawl.sh dafiti -a SAMPLE_SEED=1 -a SAMPLE_SIZE=20 -a SAMPLE_MAX_ITEMS=500 -a SAMPLE_MAX_SECONDS=120
+
+- Dafiti: Se escrapean SAMPLE_SIZE marcas, repartidas proporcionalmente entre sus letras iniciales.
+- Geelbe: Se escrapean SAMPLE_SIZE páginas de los listados de productos de cada línea, elegidas
+entre las primeras SAMPLE_GEELBE_MAX_PAGE páginas.
+
+La misma semilla genera siempre la misma muestra. Al terminar, la extensión SamplingReport
+(ver extensions.py) muestra el porcentaje de páginas de las que se extraen items y la latencia
+de las peticiones.
+'''
+
+from random import Random
+
+
+def stratified_sample(values, size, key, seed):
+    '''
+    Obtiene una muestra estratificada y determinista de un listado de valores.
+    Los valores se agrupan por estratos y de cada estrato se toma un número de valores
+    proporcional a su tamaño (al menos uno, si el tamaño de la muestra lo permite)
+    :param values: Es el listado de valores.
+    :param size: Es el tamaño de la muestra.
+    :param key: Es una función que devuelve el estrato de un valor.
+    :param seed: Es la semilla del muestreo.
+    :return: Devuelve los valores de la muestra en el mismo orden que en el listado original.
+    '''
+    values = list(values)
+    if size >= len(values):
+        return values
+
+    strata = {}
+    for index, value in enumerate(values):
+        strata.setdefault(key(value), []).append(index)
+    strata = sorted(strata.items())
+
+    # Reparto proporcional por el método del resto mayor.
+    quotas = [size * len(indexes) / len(values) for _, indexes in strata]
+    sizes = [int(quota) for quota in quotas]
+    remainders = sorted(range(0, len(strata)), key = lambda index: (sizes[index] > 0, sizes[index] - quotas[index]))
+    for index in remainders[:size - sum(sizes)]:
+        sizes[index] += 1
+
+    random = Random(seed)
+    sample = []
+    for (_, indexes), stratum_size in zip(strata, sizes):
+        sample.extend(random.sample(indexes, stratum_size))
+    return [values[index] for index in sorted(sample)]
+
+
+def sample_pages(max_page, size, seed, stratum = None):
+    '''
+    :param max_page: Es el número de la última página que puede elegirse.
+    :param size: Es el número de páginas.
+    :param seed: Es la semilla del muestreo.
+    :param stratum: Si se indica, se combina con la semilla, de forma que cada estrato (e.g: cada
+    línea de productos) tiene una muestra distinta.
+    :return: Devuelve una muestra determinista y ordenada de números de página entre 1 y max_page
+    '''
+    random = Random('{}:{}'.format(seed, stratum))
+    return sorted(random.sample(range(1, max_page + 1), min(size, max_page)))
+
+
+def percentile(values, fraction):
+    '''
+    :return: Devuelve el percentil indicado (entre 0 y 1) de un listado de valores, o None si
+    está vacío.
+    '''
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
@@ -1,7 +1,5 @@
 
 
-from config import global_config
-
 BOT_NAME = 'dafiti-geelbe-scraper'
 
 SPIDER_MODULES = ['dafiti_geelbe_scraper.spiders']
@@ -16,39 +14,28 @@ ROBOTSTXT_OBEY = False
 DOWNLOADER_MIDDLEWARES = {
     'scrapy_splash.SplashCookiesMiddleware': 723,
     'scrapy_splash.SplashMiddleware': 725,
-    'scrapy.downloadermiddlewares.httpcompression.HttpCompressionMiddleware': 810,
+    # Descompresión con presupuestos de tamaño de las respuestas (ver middlewares.py)
+    'scrapy.downloadermiddlewares.httpcompression.HttpCompressionMiddleware': None,
+    'dafiti_geelbe_scraper.middlewares.ResponseSizeBudgetMiddleware': 810,
 }
 SPIDER_MIDDLEWARES = {
     'scrapy_splash.SplashDeduplicateArgsMiddleware': 100,
+    'dafiti_geelbe_scraper.middlewares.ExtractionHealthMiddleware': 900,
 }
 DUPEFILTER_CLASS = 'scrapy_splash.SplashAwareDupeFilter'
 HTTPCACHE_STORAGE = 'scrapy_splash.SplashAwareFSCacheStorage'
-SPLASH_URL = global_config.SPLASH_PROXY_URL
-
-
-# Configuración de los pipelines
-pipelines = [
-    'dafiti_geelbe_scraper.pipelines.DefaultPipeline'
-]
-
-if global_config.path.OUTPUT_DATA_TO_SQLITE:
-    pipelines.append('dafiti_geelbe_scraper.pipelines.DatabasePipeline')
 
-ITEM_PIPELINES = {}
-for index in range(0, len(pipelines)):
-    pipeline = pipelines[index]
-    priority = 1 + index
-    ITEM_PIPELINES[pipeline] = priority
+# Los settings que dependen de la configuración del scraper (url de Splash, concurrencia, slots de
+# descarga, cola de peticiones y pipelines) los establece cada araña al crearse, con su
+# configuración. Ver Spider.update_crawler_settings
+SETTINGS_FROM_SCRAPER_CONFIG = True
 
-# Configure maximum concurrent requests performed by Scrapy (default: 16)
-#CONCURRENT_REQUESTS = 32
+# Descargas: Métricas de conexión (ver downloader.py) y HTTP/2 opcional para https.
+DOWNLOAD_HANDLERS = {
+    'http' : 'dafiti_geelbe_scraper.downloader.MeteredHTTP11DownloadHandler',
+    'https' : 'dafiti_geelbe_scraper.downloader.MeteredHTTP11DownloadHandler'
+}
 
-# Configure a delay for requests for the same website (default: 0)
-# See http://scrapy.readthedocs.org/en/latest/topics/settings.html#download-delay
-# See also autothrottle settings and docs
-#DOWNLOAD_DELAY = 3
-# The download delay setting will honor only one of:
-#CONCURRENT_REQUESTS_PER_DOMAIN = 16
 #CONCURRENT_REQUESTS_PER_IP = 16
 
 # Disable cookies (enabled by default)
@@ -79,9 +66,11 @@ for index in range(0, len(pipelines)):
 
 # Enable or disable extensions
 # See http://scrapy.readthedocs.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    'scrapy.extensions.telnet.TelnetConsole': None,
-#}
+EXTENSIONS = {
+    'dafiti_geelbe_scraper.extensions.ItemMilestones': 500,
+    'dafiti_geelbe_scraper.extensions.SamplingReport': 510,
+    'dafiti_geelbe_scraper.extensions.MemorySnapshots': 520,
+}
 
 # Configure item pipelines
 # See http://scrapy.readthedocs.org/en/latest/topics/item-pipeline.html
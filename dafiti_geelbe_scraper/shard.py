@@ -0,0 +1,133 @@
+'''
+Este script reparte el escrapeo de una araña entre varios procesos (uno por núcleo por defecto)
+
+- Dafiti: Cada proceso escrapea las marcas cuya letra inicial está en un rango distinto
+(variable DAFITI_BRAND_LETTERS)
+- Geelbe: Cada proceso escrapea todas las líneas, pero solo una de cada N páginas de los listados
+de productos (variables GEELBE_PAGE_OFFSET y GEELBE_PAGE_STEP)
+
+Todos los procesos guardan los artículos en la misma base de datos. Los artículos se insertan o
+actualizan por nombre y proveedor, por lo que no se generan duplicados.
+
+bench_shard.py compara la velocidad con 1 y con N fragmentos sobre un sitio local.
+
+Uso:
+    PYTHONPATH=dafiti_geelbe_scraper python dafiti_geelbe_scraper/shard.py <dafiti|geelbe> [--workers N]
+        [-a VARIABLE=VALOR ...]
+'''
+
+from multiprocessing import cpu_count
+from subprocess import Popen
+from datetime import datetime
+from os.path import dirname, abspath
+import argparse
+import sys
+import time
+
+
+# Letras iniciales de las marcas de Dafiti, en orden. '#' representa las marcas que no
+# comienzan por una letra.
+BRAND_LETTERS = '#abcdefghijklmnopqrstuvwxyz'
+
+
+def dafiti_shards(num_shards):
+    '''
+    Divide las letras iniciales de las marcas en rangos contiguos.
+    :return: Devuelve un listado con las variables de configuración de cada fragmento.
+    '''
+    num_shards = min(num_shards, len(BRAND_LETTERS))
+    shards = []
+    for index in range(0, num_shards):
+        start = index * len(BRAND_LETTERS) // num_shards
+        end = (index + 1) * len(BRAND_LETTERS) // num_shards
+        letters = list(BRAND_LETTERS[start:end])
+
+        ranges = []
+        if letters[0] == '#':
+            ranges.append(letters.pop(0))
+        if len(letters) > 0:
+            ranges.append('{}-{}'.format(letters[0], letters[-1]))
+        shards.append({'DAFITI_BRAND_LETTERS' : ','.join(ranges)})
+    return shards
+
+
+def geelbe_shards(num_shards):
+    '''
+    Cada fragmento escrapea una de cada num_shards páginas de los listados de productos.
+    :return: Devuelve un listado con las variables de configuración de cada fragmento.
+    '''
+    return [{'GEELBE_PAGE_OFFSET' : index, 'GEELBE_PAGE_STEP' : num_shards} for index in range(0, num_shards)]
+
+
+SHARDERS = {
+    'dafiti' : dafiti_shards,
+    'geelbe' : geelbe_shards
+}
+
+SPIDER_LOGS = {
+    'dafiti' : 'OUTPUT_DAFITI_SPIDER_LOG',
+    'geelbe' : 'OUTPUT_GEELBE_SPIDER_LOG'
+}
+
+
+def run_shards(spider, num_workers, extra_vars = {}):
+    '''
+    Ejecuta la araña indicada en varios procesos y espera a que terminen.
+    :param spider: Es el nombre de la araña ('dafiti' o 'geelbe')
+    :param num_workers: Es el número de procesos.
+    :param extra_vars: Variables de configuración adicionales para todos los procesos.
+    :return: Devuelve el listado de códigos de salida de los procesos.
+    '''
+    from config import global_config
+
+    processes = []
+    for index, shard_vars in enumerate(SHARDERS[spider](num_workers)):
+        shard_vars = dict(shard_vars)
+        shard_vars.update(extra_vars)
+
+        # Cada proceso escribe los logs en un fichero distinto.
+        log_path = global_config.get_path(SPIDER_LOGS[spider])
+        if log_path is not None and SPIDER_LOGS[spider] not in shard_vars:
+            shard_vars[SPIDER_LOGS[spider]] = '{}.shard{}'.format(log_path, index)
+
+        command = [sys.executable, '-m', 'scrapy', 'crawl', spider]
+        for var, value in shard_vars.items():
+            command.extend(['-a', '{}={}'.format(var, value)])
+        processes.append(Popen(command, cwd = dirname(dirname(abspath(__file__)))))
+
+    return [process.wait() for process in processes]
+
+
+def count_articles_since(started):
+    '''
+    :return: Devuelve el número de artículos guardados por las ejecuciones de las arañas que
+    comenzaron después de la fecha indicada.
+    '''
+    from db import db, db_session
+    from pony.orm import count
+    from entities.article import Article
+
+    db.generate_mapping()
+    with db_session:
+        return count(article for article in Article if article.last_seen.started >= started)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Run a spider sharded across several processes')
+    parser.add_argument('spider', choices = list(SHARDERS.keys()))
+    parser.add_argument('--workers', type = int, default = cpu_count())
+    parser.add_argument('-a', dest = 'vars', action = 'append', default = [], metavar = 'VARIABLE=VALUE',
+                        help = 'Configuration variable for all the workers')
+    args = parser.parse_args()
+
+    extra_vars = dict([var.split('=', 1) for var in args.vars])
+
+    started = datetime.now()
+    start_time = time.time()
+    exit_codes = run_shards(args.spider, args.workers, extra_vars)
+    elapsed = time.time() - start_time
+
+    num_articles = count_articles_since(started)
+    print('{} workers finished in {:.1f}s. Exit codes: {}'.format(len(exit_codes), elapsed, exit_codes))
+    print('{} articles stored ({:.1f} articles/s)'.format(num_articles, num_articles / max(elapsed, 1e-6)))
+    sys.exit(0 if all([code == 0 for code in exit_codes]) else 1)
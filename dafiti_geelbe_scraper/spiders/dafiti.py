@@ -1,9 +1,37 @@
 import scrapy
-from scrapy import Request
 from .spider import Spider
+from sampling import stratified_sample
+from extraction import DAFITI_PRODUCT, DAFITI_PRODUCT_CONTAINER, MissingContainerError, json_ld_products, merge_products
 from logger import Logger
 from scrapy.selector import Selector
 from entities.article import Article
+from unicodedata import normalize
+
+
+def brand_letter(brand):
+    '''
+    :return: Devuelve la letra inicial (minúscula y sin acentos) del nombre de una marca, o '#'
+    si no comienza por una letra.
+    '''
+    letter = normalize('NFKD', (brand or '').strip()[:1]).encode('ascii', 'ignore').decode().lower()
+    return letter if 'a' <= letter <= 'z' else '#'
+
+
+def parse_letter_ranges(ranges):
+    '''
+    Convierte un listado de rangos de letras a un conjunto de letras.
+    e.g: parse_letter_ranges('a-c,x,#') = {'a', 'b', 'c', 'x', '#'}
+    '''
+    letters = set()
+    for letter_range in ranges.lower().split(','):
+        letter_range = letter_range.strip()
+        if len(letter_range) == 3 and letter_range[1] == '-':
+            letters.update([chr(code) for code in range(ord(letter_range[0]), ord(letter_range[2]) + 1)])
+        elif len(letter_range) == 1:
+            letters.add(letter_range)
+        else:
+            raise ValueError('Invalid brand letters range "{}"'.format(letter_range))
+    return letters
 
 class DafitiSpider(Spider):
     '''
@@ -22,7 +50,8 @@ class DafitiSpider(Spider):
 
     def request_brand_list(self):
         self.log.debug('Requesting brands list')
-        request = Request(url = 'https://www.dafiti.com.co/marcas/', callback = self.parse_brand_list)
+        request = self.request(url = 'https://www.dafiti.com.co/marcas/', callback = self.parse_brand_list,
+                               request_type = 'discovery')
         return request
 
     def parse_brand_list(self, response):
@@ -36,6 +65,18 @@ class DafitiSpider(Spider):
 
         self.log.debug('Extracted {} brands.', len(brands))
 
+        # Solo se escrapean las marcas del fragmento asignado a esta araña (ver shard.py)
+        if self.get_config().DAFITI_BRAND_LETTERS is not None:
+            letters = parse_letter_ranges(self.get_config().DAFITI_BRAND_LETTERS)
+            brands = [(brand, brand_url) for brand, brand_url in brands if brand_letter(brand) in letters]
+            self.log.debug('{} brands in letters "{}"', len(brands), self.get_config().DAFITI_BRAND_LETTERS)
+
+        # En modo de muestreo, se escrapea una muestra de las marcas estratificada por letra inicial.
+        if self.is_sampling():
+            brands = stratified_sample(brands, size = self.get_config().SAMPLE_SIZE,
+                                       key = lambda brand: brand_letter(brand[0]), seed = self.get_config().SAMPLE_SEED)
+            self.log.debug('Sampled {} brands with seed {}', len(brands), self.get_config().SAMPLE_SEED)
+
         for brand, brand_url in brands:
             yield self.request_brand_products_list(url = brand_url, brand = brand)
 
@@ -47,21 +88,41 @@ class DafitiSpider(Spider):
         else:
             self.log.debug('Requesting "{}" products on line "{}"', brand, line)
 
-        callback = lambda response: self.parse_brand_products_list(response, response.meta['brand'], response.meta['line'])
-        request = Request(url = url, callback = callback)
-        request.meta['brand'] = brand
-        request.meta['line'] = line
+        # Los listados de productos de una línea generan items. Los de una marca, solo líneas.
+        request = self.request(url = url, callback = self.parse_brand_products_list,
+                               request_type = 'discovery' if line is None else 'leaf',
+                               cb_kwargs = {'brand' : brand, 'line' : line}, size_budget = 'listing')
         return request
 
     def parse_brand_products_list(self, response, brand, line = None):
         if not line is None:
             self.log.debug('Parsing "{}" products list on "{}" line', brand, line)
-            for item in response.css('div.itm-product-main-info').extract():
+
+            products = [self.parse_product(selector = item, response = response)
+                        for item in response.css(DAFITI_PRODUCT_CONTAINER)]
+
+            # Si el selector de los productos no encuentra ninguno, se registra como un campo que
+            # falta (aunque los datos estructurados tengan productos, el HTML ha podido cambiar)
+            if len(products) == 0:
+                self.extraction_error(response, MissingContainerError(DAFITI_PRODUCT_CONTAINER))
+
+            # Los productos se extraen de los datos estructurados de la página si los tiene. Los del
+            # HTML completan sus campos (por referencia o url) y se añaden si no están en ellos.
+            if self.get_config().DAFITI_EXTRACTION_MODE == 'json':
+                json_products = json_ld_products(response)
+                for fields in json_products:
+                    if fields['url'] is not None:
+                        fields['url'] = response.urljoin(fields['url'])
+                if len(json_products) > 0:
+                    products = merge_products(json_products, products)
+                else:
+                    self.log.debug('No structured data on "{}" products list. Using html', brand)
+
+            for fields in products:
                 try:
-                    product = self.parse_product(selector = Selector(text = item), brand = brand, line = line)
-                    yield product
+                    yield self.load_product(brand = brand, line = line, **fields)
                 except Exception as e:
-                    self.log.error(str(e))
+                    self.extraction_error(response, e)
         else:
             self.log.debug('Parsing "{}" product lines', brand)
 
@@ -76,11 +137,19 @@ class DafitiSpider(Spider):
                 yield self.request_brand_products_list(url = line_url, brand = brand, line = line)
 
 
-    def parse_product(self, selector, brand, line):
-        name = selector.css('p.itm-title::text').extract_first()
-        price = selector.css('span.itm-price:not(.price-prefix-listing)::text').re_first('^\D*([\d\.]+)$')
-        image = None
+    def parse_product(self, selector, response):
+        '''
+        :return: Devuelve un diccionario con los campos de un producto del listado (selector es
+        su elemento DAFITI_PRODUCT_CONTAINER)
+        '''
+        fields = DAFITI_PRODUCT.extract(selector)
+        if fields['url'] is not None:
+            fields['url'] = response.urljoin(fields['url'])
+        return fields
+
 
+    def load_product(self, brand, line, name, price, image = None, sku = None, list_price = None, url = None):
+        # La url no se guarda: Solo sirve para combinar los productos del HTML y de los datos estructurados.
         loader = Article.get_scrapy_item_loader()
         loader.add_value('price', price)
         loader.add_value('line', line)
@@ -88,6 +157,8 @@ class DafitiSpider(Spider):
         loader.add_value('brand', brand)
         loader.add_value('provider', 'dafiti')
         loader.add_value('image', image)
+        loader.add_value('sku', sku)
+        loader.add_value('list_price', list_price)
         item = loader.load_item()
 
 
@@ -1,13 +1,13 @@
 import scrapy
-from scrapy import Request
 from .spider import Spider
+from sampling import sample_pages
 from splash_utils import splash_request
 from entities.article import Article
+from extraction import GEELBE_PRODUCT
 
 from logger import Logger
 
 from urllib.parse import urlencode
-import re
 
 class GeelbeSpider(Spider):
     '''
@@ -21,15 +21,28 @@ class GeelbeSpider(Spider):
         self.log.set_level(self.get_config().LOG_LEVEL)
         self.log.output_to_stdout(True)
 
-    def start_requests(self):
-        # Scrapeamos productos de la línea 'Mujeres'
-        yield self.request_products_list(line = 'woman')
-
-        # Scrapeamos productos de la línea 'Hombres'
-        yield self.request_products_list(line = 'man')
+    # Líneas de productos: 'Mujeres', 'Hombres' y 'Niños'
+    lines = ['woman', 'man', 'child']
 
-        # Scrapeamos productos de la línea 'Niños'
-        yield self.request_products_list(line = 'child')
+    def start_requests(self):
+        lines = self.lines
+        if self.get_config().GEELBE_LINES is not None:
+            lines = [line.strip() for line in self.get_config().GEELBE_LINES.split(',')]
+            for line in lines:
+                if line not in self.lines:
+                    raise ValueError('Invalid Geelbe line "{}"'.format(line))
+
+        # En modo de muestreo, se escrapea una muestra de las páginas de cada línea.
+        if self.is_sampling():
+            for line in lines:
+                for page in sample_pages(self.get_config().SAMPLE_GEELBE_MAX_PAGE, self.get_config().SAMPLE_SIZE,
+                                         seed = self.get_config().SAMPLE_SEED, stratum = line):
+                    yield self.request_products_list(line = line, page = page)
+            return
+
+        # Solo se escrapean las páginas del fragmento asignado a esta araña (ver shard.py)
+        for line in lines:
+            yield self.request_products_list(line = line, page = 1 + self.get_config().GEELBE_PAGE_OFFSET)
 
 
     def request_products_list(self, line, page = 1):
@@ -52,11 +65,9 @@ class GeelbeSpider(Spider):
         params = dict([(key, str(value)) for key, value in params.items()])
         url = 'http://www.geelbe.com/ajax/lazyLoad.php?{}'.format(urlencode(params))
 
-        callback = lambda response: self.parse_products_list(response, response.meta['line'], response.meta['page'])
-
         self.log.debug('Requesting products list on Geelbe. Line: {}, page: {}', line, page)
-        request = Request(url = url, callback = callback)
-        request.meta['line'], request.meta['page'] = line, page
+        request = self.request(url = url, callback = self.parse_products_list, request_type = 'listing',
+                               cb_kwargs = {'line' : line, 'page' : page}, size_budget = 'lazyload')
         return request
 
 
@@ -68,41 +79,26 @@ class GeelbeSpider(Spider):
             for product_url in product_urls:
                 yield self.request_product(url = product_url, line = line)
 
-            # Pedir la siguiente página
-            yield self.request_products_list(line = line, page = page + 1)
+            # Pedir la siguiente página (en modo de muestreo solo se piden las páginas de la muestra)
+            if not self.is_sampling():
+                yield self.request_products_list(line = line, page = page + self.get_config().GEELBE_PAGE_STEP)
 
 
 
     def request_product(self, url, line):
-        callback = lambda response:self.parse_product(response, response.meta['line'])
-        request = Request(url = url, callback = callback)
-        request.meta['line'] = line
+        request = self.request(url = url, callback = self.parse_product, request_type = 'leaf',
+                               cb_kwargs = {'line' : line})
         return request
 
 
     def parse_product(self, response, line):
         try:
-            description =  '\n'.join(response.xpath('//div[@itemprop = "description"]/node()').extract())
-            name = response.xpath('//h1[@itemprop = "name"]/text()').extract_first()
-            price = response.xpath('//span[@itemprop = "price"]/text()').extract_first()
-            image = response.css('.fotos > img::attr(src)').extract_first()
-            category = None
+            fields = GEELBE_PRODUCT.extract(response)
+            name, price = fields['name'], fields['price']
+            image = response.urljoin(fields['image']) if fields['image'] is not None else None
+            brand, line = fields['brand'], fields['line']
 
             self.log.debug('Parsing product with name: "{}"', name)
-
-            search = lambda pattern, string: re.search(pattern, string, re.DOTALL)
-            match = lambda pattern, string: re.match(pattern, string, re.DOTALL)
-
-
-            def product_property(property):
-                value = search('<b>{}</b>([^<]+)<br>'.format(property), description).group(1)
-                value = match('^\s*:\s*([ \w]+)\s*$', value).group(1)
-                value = match('^[ ]*([ \w]*\w)[ ]*$', value).group(1)
-                return value
-
-            brand = product_property('Marca')
-            line = product_property('L.nea')
-
             self.log.debug('Info extracted. Price: {}, Brand: {}', price, brand)
 
 
@@ -118,4 +114,4 @@ class GeelbeSpider(Spider):
             yield item
 
         except Exception as e:
-            self.log.error('Failed extracting data: {}', e)
\ No newline at end of file
+            self.extraction_error(response, e)
\ No newline at end of file
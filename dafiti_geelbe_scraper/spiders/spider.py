@@ -1,23 +1,108 @@
 
 import scrapy
+from scrapy import Request
 import webbrowser
 from config import global_config, Config
 from tempfile import mkstemp
+from splash_utils import splash_request
 
 class Spider(scrapy.Spider):
     '''
     Clase base de GeelbeSpider y DafitiSpider
     '''
+
+    # Prioridades de las peticiones según su tipo:
+    # - discovery: Páginas de las que solo se extraen otras páginas (marcas, líneas...)
+    # - listing: Listados de los que se extraen páginas de productos.
+    # - leaf: Páginas de las que se extraen items.
+    # Las páginas que generan items se procesan primero: Los items empiezan a generarse antes y la
+    # cola de peticiones pendientes no crece con las de descubrimiento.
+    priorities = {
+        'discovery' : 0,
+        'listing' : 10,
+        'leaf' : 20
+    }
+
+    # Presupuesto de tamaño de las respuestas de cada tipo de petición (ver
+    # middlewares.ResponseSizeBudgetMiddleware): 'listing', 'product', 'lazyload' o 'splash'
+    size_budgets = {
+        'discovery' : 'listing',
+        'listing' : 'listing',
+        'leaf' : 'product'
+    }
+
     def __init__(self, **kwargs):
         super().__init__()
 
         # Se pueden especificar más variables de configuración por línea de comandos,
-        # o por settings de Scrapy.
-        self.config = global_config.copy()
-        self.config.override(Config(kwargs))
+        # o por settings de Scrapy. scrapyd añade el argumento _job, que no es una variable.
+        config = global_config.copy()
+        config.override(Config(dict([(key, value) for key, value in kwargs.items() if key not in ['_job']])))
+
+        # La configuración del scraper debe ser correcta. Las variables desconocidas o con valores
+        # no válidos generan una excepción antes de realizar ninguna petición.
+        self.config = config.freeze()
+
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        if crawler.settings.getbool('SETTINGS_FROM_SCRAPER_CONFIG'):
+            spider.update_crawler_settings(crawler.settings)
+        return spider
+
+
+    def update_crawler_settings(self, settings):
+        '''
+        Establece los settings de Scrapy que dependen de la configuración de esta araña (incluidas
+        las variables indicadas por línea de comandos). settings.py no lee la configuración: Se
+        carga al crear la primera araña. Scrapy congela los settings después de crear la araña.
+        Los settings indicados por línea de comandos (-s) tienen prioridad.
+        :param settings: Son los settings del crawler de la araña.
+        '''
+        config = self.get_config()
 
-        # La configuración del scraper debe ser correcta
-        self.config.check()
+        settings.set('SPLASH_URL', config.SPLASH_PROXY_URL, priority = 'project')
+        settings.set('CONCURRENT_REQUESTS', config.CONCURRENT_REQUESTS, priority = 'project')
+        settings.set('CONCURRENT_REQUESTS_PER_DOMAIN', config.CONCURRENT_REQUESTS_PER_DOMAIN, priority = 'project')
+        settings.set('DOWNLOAD_DELAY', config.DOWNLOAD_DELAY, priority = 'project')
+
+        # Las peticiones a Splash comparten el slot de descarga "splash" (ver splash_utils.splash_request)
+        # y las descargas de imágenes el slot "images" (ver pipelines.ImagePipeline)
+        slots = settings.getdict('DOWNLOAD_SLOTS')
+        slots['splash'] = {'concurrency' : config.SPLASH_CONCURRENCY}
+        slots['images'] = {'concurrency' : config.IMAGES_CONCURRENCY}
+        settings.set('DOWNLOAD_SLOTS', slots, priority = 'project')
+
+        if config.DOWNLOADER_HTTP2:
+            handlers = settings.getdict('DOWNLOAD_HANDLERS')
+            handlers['https'] = 'scrapy.core.downloader.handlers.http2.H2DownloadHandler'
+            settings.set('DOWNLOAD_HANDLERS', handlers, priority = 'project')
+
+        # Cola de peticiones compartida (ver frontier.py)
+        if config.FRONTIER_BROKER is not None:
+            settings.set('SCHEDULER', 'dafiti_geelbe_scraper.frontier.FrontierScheduler', priority = 'project')
+            for name, priority in [('SPIDER_MIDDLEWARES', 10), ('DOWNLOADER_MIDDLEWARES', 50)]:
+                middlewares = settings.getdict(name)
+                middlewares['dafiti_geelbe_scraper.frontier.FrontierMiddleware'] = priority
+                settings.set(name, middlewares, priority = 'project')
+        elif config.MEMORY_BOUNDED:
+            # Modo de memoria acotada: Las peticiones pendientes que no caben en memoria y las huellas de
+            # las peticiones vistas se guardan en disco (ver frontier.BoundedMemoryScheduler). Con la
+            # frontera compartida, ya están en el broker.
+            settings.set('SCHEDULER', 'dafiti_geelbe_scraper.frontier.BoundedMemoryScheduler', priority = 'project')
+
+        pipelines = ['dafiti_geelbe_scraper.pipelines.DefaultPipeline']
+        if config.STORAGE_BACKEND != 'sqlite' or config.path.OUTPUT_DATA_TO_SQLITE:
+            pipelines.append('dafiti_geelbe_scraper.pipelines.DatabasePipeline')
+        if config.path.OUTPUT_DATA_TO_FEED:
+            pipelines.append('dafiti_geelbe_scraper.pipelines.FeedPipeline')
+        if config.path.OUTPUT_IMAGES_DIR:
+            pipelines.append('dafiti_geelbe_scraper.pipelines.ImagePipeline')
+        item_pipelines = settings.getdict('ITEM_PIPELINES')
+        for index, pipeline in enumerate(pipelines):
+            item_pipelines[pipeline] = 1 + index
+        settings.set('ITEM_PIPELINES', item_pipelines, priority = 'project')
 
 
     def view(self, response):
@@ -33,6 +118,69 @@ class Spider(scrapy.Spider):
         webbrowser.open(path)
 
 
+    def get_priority(self, request_type):
+        '''
+        :param request_type: Es el tipo de petición: 'discovery', 'listing' o 'leaf'
+        :return: Devuelve la prioridad de las peticiones del tipo indicado. Si la variable de
+        configuración PRIORITIZE_LEAF_REQUESTS es False, todas tienen la misma prioridad.
+        '''
+        if not self.get_config().is_true('PRIORITIZE_LEAF_REQUESTS'):
+            return 0
+        return self.priorities[request_type]
+
+
+    def request(self, url, callback, request_type, cb_kwargs = None, size_budget = None, **kwargs):
+        '''
+        Crea una petición con la prioridad correspondiente a su tipo. El tipo de la petición se
+        guarda en request.meta['request_type'] (lo usan las extensiones y middlewares)
+        :param request_type: Es el tipo de petición: 'discovery', 'listing' o 'leaf'
+        :param size_budget: Es el presupuesto de tamaño de la respuesta. Por defecto, el del tipo
+        de petición. Se guarda en request.meta['size_budget']
+        '''
+        meta = dict(kwargs.pop('meta', {}))
+        meta['request_type'] = request_type
+        meta['size_budget'] = size_budget or self.size_budgets[request_type]
+        return Request(url = url, callback = callback, cb_kwargs = cb_kwargs or {}, meta = meta,
+                       priority = self.get_priority(request_type), **kwargs)
+
+
+    def splash_request(self, url, callback, actions = None, **kwargs):
+        '''
+        Crea una petición a Splash (ver splash_utils.splash_request) con el tiempo máximo de
+        renderizado de la configuración de esta araña (SPLASH_TIMEOUT)
+        '''
+        return splash_request(url = url, callback = callback, actions = actions,
+                              timeout = self.get_config().SPLASH_TIMEOUT, **kwargs)
+
+
+    def extraction_error(self, response, error):
+        '''
+        Registra un error al extraer un item de una respuesta. Los errores se guardan en
+        response.meta['extraction_errors'] para que los procese ExtractionHealthMiddleware
+        (ver middlewares.py)
+        '''
+        self.log.error('Failed extracting data from {}: {}', response.url, error)
+        response.meta.setdefault('extraction_errors', []).append(error)
+
+
+    def is_sampling(self):
+        '''
+        :return: Devuelve True si la araña está en modo de muestreo (ver sampling.py)
+        '''
+        return self.get_config().is_set('SAMPLE_SEED')
+
+
+    def is_partial_crawl(self):
+        '''
+        :return: Devuelve True si esta araña solo escrapea una parte del catálogo (modo de muestreo,
+        fragmentos de shard.py o frontera compartida con otras arañas). En ese caso, no puede
+        saberse qué artículos han dejado de estar en el catálogo.
+        '''
+        config = self.get_config()
+        return self.is_sampling() or config.is_set('FRONTIER_BROKER') or config.is_set('DAFITI_BRAND_LETTERS') or \
+               config.is_set('GEELBE_LINES') or config.GEELBE_PAGE_STEP > 1
+
+
     def get_config(self):
         '''
         :return: Devuelve la configuración de esta araña
@@ -34,7 +34,8 @@ yield splash_request(url = ..., callback = ..., actions = actions)
 
 
 from os.path import dirname, join
-from scrapy_splash import SplashRequest
+from scrapy_splash import SplashRequest, SlotPolicy
+from config import global_config
 from urllib.parse import urlencode
 import logging
 
@@ -585,7 +586,7 @@ class LuaSplashScript(Code):
         super().__init__(code)
 
 
-def splash_request(url, callback, actions = None, **kwargs):
+def splash_request(url, callback, actions = None, timeout = None, **kwargs):
     '''
     Realiza una petición a la página cuya url se indica como parámetro y devuelve una instancia
     de la clase Request como valor de retorno.
@@ -602,6 +603,8 @@ def splash_request(url, callback, actions = None, **kwargs):
     :param callback: Es un callback que scrapeará la página
     :param actions: Es un listado de acciones a realizar antes de servir la página. Permite crear
     un usuario virtual que pueda interactuar con la web para cargar contenido dinámico.
+    :param timeout: Segundos máximos de renderizado. Por defecto, la variable SPLASH_TIMEOUT de la
+    configuración global. Las arañas usan el de su configuración (ver Spider.splash_request)
     '''
 
     def read_js_script(path):
@@ -609,12 +612,23 @@ def splash_request(url, callback, actions = None, **kwargs):
             return fh.read()
 
     code = LuaSplashScript(actions)
+
+    # Todas las peticiones a Splash comparten el slot de descarga "splash", cuya concurrencia
+    # se limita con la variable de configuración SPLASH_CONCURRENCY
+    meta = kwargs.pop('meta', {})
+    meta.setdefault('download_slot', 'splash')
+    # El HTML renderizado por Splash tiene su propio presupuesto de tamaño (ver middlewares.py)
+    meta.setdefault('size_budget', 'splash')
+
     return SplashRequest(callback=callback,
                          endpoint='execute',
                          args={
                              'lua_source': str(code),
                              'url': url,
                              'scrap_utils': read_js_script('scrap_utils.js'),
-                             'jquery': read_js_script('jquery.min.js')
+                             'jquery': read_js_script('jquery.min.js'),
+                             'timeout': timeout if timeout is not None else global_config.SPLASH_TIMEOUT
                          },
+                         slot_policy=SlotPolicy.SCRAPY_DEFAULT,
+                         meta=meta,
                          **kwargs)
\ No newline at end of file
@@ -0,0 +1,343 @@
+'''
+Este script define los backends de almacenamiento de los artículos escrapeados.
+El backend se selecciona con la variable de configuración STORAGE_BACKEND ('sqlite' o 'postgres')
+
+Cada backend sabe cómo enlazar la base de datos de pony con su proveedor y cómo cargar
+artículos en bloque: Los items se cargan primero en una tabla temporal (staging) y después se
+combinan con la tabla de artículos en una sola sentencia.
+'''
+
+from config import global_config
+from io import StringIO
+from urllib.parse import quote
+import sqlite3
+import csv
+
+
+# Índices secundarios que se crean tras generar el mapeado si STORAGE_CREATE_INDEXES es True.
+# Pony ya crea un índice por cada clave foránea (brand, line, first_seen, last_seen...), salvo
+# provider: Es la primera columna del índice de cobertura.
+ARTICLE_INDEXES = [
+    'DROP INDEX IF EXISTS idx_article__provider',
+    'DROP INDEX IF EXISTS idx_article__provider_brand_line',
+    # Índice de cobertura de los informes de precios (ver report.py) y de las consultas por proveedor.
+    'CREATE INDEX IF NOT EXISTS idx_article__provider_brand_line_price ON Article (provider, brand, line, price)'
+]
+
+
+class StorageBackend:
+    '''
+    Clase base de los backends de almacenamiento.
+    Los nombres de tablas y columnas en las sentencias SQL no se entrecomillan: sqlite no distingue
+    mayúsculas y minúsculas, y postgres convierte a minúsculas (igual que pony)
+    '''
+    name = None
+
+    # Marcador de parámetros de las sentencias SQL del driver
+    param = '?'
+
+    def __init__(self, config = global_config):
+        self.config = config
+
+    def bind(self, db):
+        '''
+        Enlaza la base de datos de pony indicada con este backend.
+        '''
+        raise NotImplementedError()
+
+    def create_indexes(self, db):
+        '''
+        Crea los índices secundarios de los artículos. Debe invocarse dentro de una sesión de
+        base de datos, después de generar el mapeado.
+        '''
+        for statement in ARTICLE_INDEXES:
+            db.execute(statement)
+
+    def create_staging_table(self, cursor):
+        raise NotImplementedError()
+
+    def connect_readonly(self):
+        '''
+        :return: Devuelve una conexión (DBAPI) de solo lectura a la base de datos, sin pasar por
+        pony. La usan las consultas de informes y la API (report.py y api.py)
+        '''
+        raise NotImplementedError()
+
+    def database_errors(self):
+        '''
+        :return: Devuelve una tupla con las clases de las excepciones del driver (DBAPI) de las
+        conexiones de connect_readonly.
+        '''
+        raise NotImplementedError()
+
+    def streaming_cursor(self, connection):
+        '''
+        :return: Devuelve un cursor con el que pueden leerse consultas grandes por partes (fetchmany)
+        sin cargar todos los resultados en memoria.
+        '''
+        return connection.cursor()
+
+    def load_staging_table(self, cursor, rows):
+        '''
+        Carga los artículos en la tabla staging_article.
+        :param rows: Tuplas (name, provider, brand, line, price, image, sku, list_price)
+        '''
+        cursor.executemany('INSERT INTO staging_article (name, provider, brand, line, price, image, sku, list_price) '
+                           'VALUES ({})'.format(', '.join([self.param] * 8)), rows)
+
+
+    def merge_articles(self, connection, rows, crawl_id):
+        '''
+        Inserta o actualiza en bloque los artículos indicados.
+        :param connection: Es la conexión de la base de datos (DBAPI)
+        :param rows: Tuplas (name, provider, brand, line, price, image, sku, list_price). Las marcas, líneas y
+        proveedores son ids.
+        :param crawl_id: Es el id de la ejecución actual de la araña.
+        :return: Devuelve un listado de tuplas (article, crawl, price, previous_price, change) con
+        los artículos nuevos o cuyo precio ha cambiado.
+        '''
+        # Si un artículo aparece varias veces, nos quedamos con el último.
+        rows = list(dict([((row[0], row[1]), row) for row in rows]).values())
+
+        cursor = connection.cursor()
+        self.create_staging_table(cursor)
+        self.load_staging_table(cursor, rows)
+
+        # Precios anteriores de los artículos que ya existían
+        cursor.execute('SELECT a.id, s.name, s.provider, a.price FROM staging_article s '
+                       'JOIN Article a ON a.name = s.name AND a.provider = s.provider')
+        previous_prices = dict([((name, provider), (id, price)) for id, name, provider, price in cursor.fetchall()])
+
+        # pony guarda los atributos Optional(str) vacíos como '' (las columnas son NOT NULL)
+        cursor.execute('''
+            INSERT INTO Article (name, provider, brand, line, price, image, sku, list_price, first_seen, last_seen)
+            SELECT name, provider, brand, line, price, COALESCE(image, ''), COALESCE(sku, ''), list_price, {param}, {param}
+            FROM staging_article WHERE true
+            ON CONFLICT (name, provider) DO UPDATE SET
+                brand = excluded.brand,
+                line = excluded.line,
+                price = excluded.price,
+                image = COALESCE(NULLIF(excluded.image, ''), Article.image),
+                sku = COALESCE(NULLIF(excluded.sku, ''), Article.sku),
+                list_price = excluded.list_price,
+                last_seen = excluded.last_seen
+        '''.format(param = self.param), (crawl_id, crawl_id))
+
+        cursor.execute('SELECT a.id, s.name, s.provider, a.price FROM staging_article s '
+                       'JOIN Article a ON a.name = s.name AND a.provider = s.provider')
+        snapshots = []
+        for id, name, provider, price in cursor.fetchall():
+            _, previous_price = previous_prices.get((name, provider), (None, None))
+            if previous_price is None or previous_price != price:
+                change = None if previous_price is None else price - previous_price
+                snapshots.append((id, crawl_id, price, previous_price, change))
+
+        cursor.execute('DELETE FROM staging_article')
+        return snapshots
+
+
+    def previous_crawl(self, connection, crawl_id):
+        '''
+        :return: Devuelve el id de la última ejecución completa (terminada y no parcial) de la misma
+        araña anterior a la indicada, o None si no hay ninguna.
+        '''
+        cursor = connection.cursor()
+        cursor.execute('SELECT MAX(p.id) FROM CrawlRun c JOIN CrawlRun p ON p.spider = c.spider '
+                       'WHERE c.id = {param} AND p.id < c.id AND p.finished IS NOT NULL AND NOT p.partial'.format(param = self.param),
+                       (crawl_id,))
+        return cursor.fetchone()[0]
+
+
+    def delta_rows(self, connection, crawl_id, previous_crawl_id = None):
+        '''
+        Calcula los cambios del catálogo en una ejecución de una araña. Debe invocarse después de
+        guardar los registros de PriceSnapshot de la ejecución.
+        :param previous_crawl_id: Es el id de la ejecución anterior de la misma araña. Si se indica,
+        los artículos encontrados en ella y no en la actual se devuelven como eliminados.
+        :return: Devuelve un generador de tuplas (change, id, name, brand, line, provider, price,
+        previous_price). change es 'new', 'price' o 'removed'
+        '''
+        columns = 'a.id, a.name, b.name, l.name, p.name, a.price'
+        joins = 'JOIN Brand b ON b.id = a.brand JOIN Line l ON l.id = a.line JOIN Provider p ON p.id = a.provider'
+
+        # Artículos nuevos y cambios de precio (resuelto con el índice (crawl, change) de PriceSnapshot)
+        cursor = self.streaming_cursor(connection)
+        cursor.execute('SELECT {columns}, s.previous_price FROM PriceSnapshot s JOIN Article a ON a.id = s.article {joins} '
+                       'WHERE s.crawl = {param}'.format(columns = columns, joins = joins, param = self.param), (crawl_id,))
+        for rows in iter(lambda: cursor.fetchmany(1000), []):
+            for article in rows:
+                yield ('new' if article[6] is None else 'price',) + tuple(article)
+        cursor.close()
+
+        # Artículos eliminados (resuelto con el índice de last_seen)
+        if previous_crawl_id is not None:
+            cursor = self.streaming_cursor(connection)
+            cursor.execute('SELECT {columns}, NULL FROM Article a {joins} WHERE a.last_seen = {param}'.format(
+                columns = columns, joins = joins, param = self.param), (previous_crawl_id,))
+            for row in iter(lambda: cursor.fetchmany(1000), []):
+                for article in row:
+                    yield ('removed',) + tuple(article)
+            cursor.close()
+
+
+    def insert_snapshots(self, connection, snapshots):
+        '''
+        Inserta en bloque registros en la tabla PriceSnapshot.
+        :param snapshots: Tuplas (article, crawl, price, previous_price, change)
+        '''
+        cursor = connection.cursor()
+        cursor.executemany('INSERT INTO PriceSnapshot (article, crawl, price, previous_price, change) '
+                           'VALUES ({})'.format(', '.join([self.param] * 5)), snapshots)
+
+
+
+class SQLiteBackend(StorageBackend):
+    '''
+    Backend que almacena los artículos en un fichero sqlite (OUTPUT_DATA_TO_SQLITE). Es el backend
+    por defecto.
+    Los pragmas de cada conexión se establecen según el perfil SQLITE_PROFILE
+    '''
+    name = 'sqlite'
+    param = '?'
+
+    # Perfiles de configuración de sqlite. Se selecciona uno con la variable SQLITE_PROFILE y puede
+    # modificarse cualquier valor con las variables SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS,
+    # SQLITE_CACHE_SIZE, SQLITE_MMAP_SIZE y SQLITE_BUSY_TIMEOUT
+    profiles = {
+        # Valores por defecto de sqlite (rollback journal y synchronous = FULL)
+        'default' : {},
+
+        # WAL: Permite lectores concurrentes mientras una araña escribe.
+        'safe' : {
+            'journal_mode' : 'WAL',
+            'synchronous' : 'FULL',
+            'cache_size' : -16000,
+            'mmap_size' : 0,
+            'busy_timeout' : 5000
+        },
+
+        # WAL con synchronous = NORMAL. Una caída del sistema puede perder las últimas transacciones,
+        # pero nunca corrompe la base de datos.
+        'fast' : {
+            'journal_mode' : 'WAL',
+            'synchronous' : 'NORMAL',
+            'cache_size' : -64000,
+            'mmap_size' : 268435456,
+            'busy_timeout' : 5000
+        }
+    }
+
+    def get_pragmas(self):
+        '''
+        :return: Devuelve los pragmas de sqlite a establecer en cada conexión según la configuración:
+        Una lista de tuplas (pragma, valor)
+        '''
+        profile_name = self.config.SQLITE_PROFILE or 'default'
+        if profile_name not in self.profiles:
+            raise ValueError('Invalid sqlite profile "{}"'.format(profile_name))
+        profile = dict(self.profiles[profile_name])
+
+        for pragma in ['journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'busy_timeout']:
+            value = self.config.get_value('SQLITE_{}'.format(pragma.upper()))
+            if value is not None:
+                profile[pragma] = value
+
+        # journal_mode debe establecerse antes que el resto.
+        return sorted(profile.items(), key = lambda pragma: pragma[0] != 'journal_mode')
+
+    def bind(self, db):
+        # Los pragmas deben registrarse antes de establecer la primera conexión.
+        pragmas = self.get_pragmas()
+        @db.on_connect(provider = 'sqlite')
+        def configure_connection(db, connection):
+            cursor = connection.cursor()
+            for pragma, value in pragmas:
+                cursor.execute('PRAGMA {} = {}'.format(pragma, value))
+
+        db.bind(provider = 'sqlite', filename = self.config.path.OUTPUT_DATA_TO_SQLITE, create_db = True)
+
+    def connect_readonly(self):
+        # Los lectores no bloquean a las arañas si la base de datos está en modo WAL.
+        connection = sqlite3.connect('file:{}?mode=ro'.format(quote(self.config.path.OUTPUT_DATA_TO_SQLITE)),
+                                     uri = True, check_same_thread = False, cached_statements = 256)
+        for pragma, value in self.get_pragmas():
+            if pragma in ['cache_size', 'mmap_size', 'busy_timeout']:
+                connection.execute('PRAGMA {} = {}'.format(pragma, value))
+        return connection
+
+    def database_errors(self):
+        return (sqlite3.Error,)
+
+    def create_staging_table(self, cursor):
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS staging_article '
+                       '(name TEXT, provider INTEGER, brand INTEGER, line INTEGER, price REAL, image TEXT, '
+                       'sku TEXT, list_price REAL)')
+
+
+
+class PostgresBackend(StorageBackend):
+    '''
+    Backend que almacena los artículos en una base de datos PostgreSQL. Permite que varias
+    arañas escriban a la vez.
+    Los items se cargan en la tabla staging con COPY, que es mucho más rápido que insertarlos
+    uno a uno.
+    Requiere el paquete psycopg2.
+    '''
+    name = 'postgres'
+    param = '%s'
+
+    def bind(self, db):
+        db.bind(provider = 'postgres',
+                host = self.config.POSTGRES_HOST,
+                port = self.config.POSTGRES_PORT,
+                user = self.config.POSTGRES_USER,
+                password = self.config.POSTGRES_PASSWORD,
+                database = self.config.POSTGRES_DATABASE)
+
+    def connect_readonly(self):
+        import psycopg2
+        connection = psycopg2.connect(host = self.config.POSTGRES_HOST, port = self.config.POSTGRES_PORT,
+                                      user = self.config.POSTGRES_USER, password = self.config.POSTGRES_PASSWORD,
+                                      dbname = self.config.POSTGRES_DATABASE)
+        connection.set_session(readonly = True, autocommit = True)
+        return connection
+
+    def database_errors(self):
+        import psycopg2
+        return (psycopg2.Error,)
+
+    def create_staging_table(self, cursor):
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS staging_article '
+                       '(name TEXT, provider INTEGER, brand INTEGER, line INTEGER, price DOUBLE PRECISION, image TEXT, '
+                       'sku TEXT, list_price DOUBLE PRECISION)')
+
+    def streaming_cursor(self, connection):
+        # Los cursores con nombre se ejecutan en el servidor.
+        return connection.cursor(name = 'streaming_cursor')
+
+    def load_staging_table(self, cursor, rows):
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['' if value is None else value for value in row])
+        buffer.seek(0)
+
+        # Los campos vacíos sin comillas se interpretan como NULL en formato csv.
+        cursor.copy_expert('COPY staging_article (name, provider, brand, line, price, image, sku, list_price) '
+                           'FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+
+# Backends disponibles
+STORAGE_BACKENDS = dict([(backend.name, backend) for backend in [SQLiteBackend, PostgresBackend]])
+
+
+def get_storage_backend(config = global_config):
+    '''
+    :return: Devuelve una instancia del backend de almacenamiento indicado en la configuración
+    (variable STORAGE_BACKEND)
+    '''
+    name = config.STORAGE_BACKEND or 'sqlite'
+    if name not in STORAGE_BACKENDS:
+        raise ValueError('Invalid storage backend "{}"'.format(name))
+    return STORAGE_BACKENDS[name](config)
@@ -0,0 +1,74 @@
+'''
+Configuración de los tests. Los módulos del scraper se importan como en las arañas (el directorio
+dafiti_geelbe_scraper está en PYTHONPATH) y la base de datos sqlite es un fichero temporal.
+La base de datos (db) se enlaza una sola vez por proceso: Los tests con otro backend deben
+ejecutarse en un subproceso (ver run_scraper_script)
+'''
+
+from os.path import dirname, abspath, join
+from tempfile import mkdtemp
+import subprocess
+import sys
+import os
+import pytest
+
+SCRAPER_DIR = join(dirname(dirname(abspath(__file__))), 'dafiti_geelbe_scraper')
+FIXTURES_DIR = join(dirname(abspath(__file__)), 'fixtures')
+sys.path.insert(0, SCRAPER_DIR)
+
+from config import global_config
+global_config.set_value('OUTPUT_DATA_TO_SQLITE', join(mkdtemp(), 'articles.db'))
+global_config.set_value('LOG_LEVEL', 'ERROR')
+
+from scrapy.utils.test import get_crawler
+from scrapy.http import HtmlResponse, Request
+from spiders.spider import Spider
+from logger import Logger
+
+
+class StubSpider(Spider):
+    '''
+    Araña sin peticiones para los tests de pipelines, middlewares y extensiones.
+    '''
+    name = 'stub'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.log = Logger()
+
+
+def create_spider(spidercls = StubSpider, settings = None, **kwargs):
+    '''
+    Crea una araña con su crawler. Los argumentos son variables de configuración de la araña.
+    '''
+    crawler = get_crawler(spidercls, settings)
+    crawler.spider = crawler._create_spider(**kwargs)
+    crawler.stats.open_spider(crawler.spider)
+    return crawler.spider
+
+
+@pytest.fixture
+def spider():
+    return create_spider()
+
+
+def html_response(body, url = 'https://www.dafiti.com.co/marca/', **kwargs):
+    '''
+    :return: Devuelve una respuesta HTML con el contenido indicado a una petición de tipo 'leaf'.
+    Los argumentos adicionales son los de la petición (e.g: callback)
+    '''
+    return HtmlResponse(url = url, body = body.encode('utf-8'), encoding = 'utf-8',
+                        request = Request(url, meta = {'request_type' : 'leaf'}, **kwargs))
+
+
+def run_scraper_script(script, env = None):
+    '''
+    Ejecuta un script de Python en un subproceso con los módulos del scraper y de los tests en
+    PYTHONPATH.
+    :return: Devuelve la última línea de la salida estándar.
+    '''
+    env = dict(os.environ, PYTHONPATH = os.pathsep.join([SCRAPER_DIR, dirname(abspath(__file__))]), **(env or {}))
+    result = subprocess.run([sys.executable, '-W', 'ignore', '-c', script], env = env, stdout = subprocess.PIPE,
+                            stderr = subprocess.PIPE, check = False)
+    assert result.returncode == 0, result.stderr.decode()
+    return result.stdout.decode().strip().splitlines()[-1]
@@ -0,0 +1,54 @@
+from api import ArticlesAPI
+from pipelines import DatabasePipeline
+from entities.article import Article
+import sqlite3
+import json
+
+
+def create_api(spider, max_limit = 3):
+    pipeline = DatabasePipeline()
+    pipeline.open_spider(spider)
+    for index in range(0, 5):
+        pipeline.items.append(Article.ScrapyItem(name = 'API {}'.format(index), price = 10.0, brand = 'Api brand',
+                                                 line = 'woman', provider = 'dafiti'))
+    pipeline.close_spider(spider)
+    return ArticlesAPI(pool_size = 1, max_limit = max_limit)
+
+
+def test_limit_is_clamped(spider):
+    api = create_api(spider)
+    for limit, expected in [(0, 1), (-1, 1), (2, 2), (1000, 3)]:
+        status, etag, body = api.get('/articles?brand=Api+brand&limit={}'.format(limit))
+        assert status == 200
+        assert len(json.loads(body)['articles']) == expected
+
+    status, etag, body = api.get('/articles?brand=Api+brand&limit=abc')
+    assert status == 400
+
+
+def test_database_errors_return_500(spider):
+    api = create_api(spider)
+
+    def execute(query, params):
+        raise sqlite3.OperationalError('database is locked')
+    api.pool.execute = execute
+
+    status, etag, body = api.get('/articles?brand=Api+brand')
+    assert status == 500
+    assert json.loads(body) == {'error' : 'Database error'}
+
+
+def test_out_of_range_parameters_return_400(spider):
+    api = create_api(spider)
+    huge = str(2 ** 64)
+    for url in ['/articles/' + huge, '/articles?after=' + huge, '/articles?after=-' + huge,
+                '/articles?min_price=nan', '/articles?max_price=inf', '/articles?min_price=-inf',
+                '/articles?max_price=1e400']:
+        status, etag, body = api.get(url)
+        assert status == 400, url
+
+    status, etag, body = api.get('/articles/{}'.format(2 ** 63 - 1))
+    assert status == 404
+    status, etag, body = api.get('/articles?brand=Api+brand&after={}'.format(2 ** 63 - 1))
+    assert status == 200
+    assert json.loads(body)['articles'] == []
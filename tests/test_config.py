@@ -0,0 +1,31 @@
+from config import Config, SCHEMA
+from os.path import join, dirname
+import config
+import pytest
+
+
+CONFIGS_DIR = join(dirname(config.__file__), 'configs')
+
+
+def load_profile(profile):
+    profile_config = Config.load_from_file(join(CONFIGS_DIR, 'default.conf.py'))
+    if profile is not None:
+        profile_config.override(Config.load_from_file(join(CONFIGS_DIR, '{}.conf.py'.format(profile))))
+    return profile_config
+
+
+def test_every_variable_has_a_default():
+    # Las variables sin valor por defecto valen None (e.g: concurrencia de Scrapy None o timeout null
+    # en Splash). Las variables que valen None en default.conf.py no se cargan.
+    default_config = load_profile(None)
+    missing = [var for var, variable in SCHEMA.items() if not default_config.is_set(var) and not variable.nullable]
+    assert missing == []
+
+
+@pytest.mark.parametrize('profile', [None, 'debug', 'prod'])
+def test_profiles_are_valid(profile):
+    profile_config = load_profile(profile).freeze()
+    for var in ['CONCURRENT_REQUESTS', 'CONCURRENT_REQUESTS_PER_DOMAIN', 'DOWNLOAD_DELAY', 'SPLASH_CONCURRENCY',
+                'SPLASH_TIMEOUT']:
+        assert profile_config.get_value(var) is not None
+    assert profile_config.CONCURRENT_REQUESTS_PER_DOMAIN <= profile_config.CONCURRENT_REQUESTS
@@ -0,0 +1,38 @@
+from export import ColumnarWriter
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+
+
+BATCHES = [
+    [(1, 'Shoe', 'Nike', 'woman', 'dafiti', 100.0, 'http://example.com/1.jpg'),
+     (2, 'Boot', 'Adidas', 'man', 'dafiti', 200.0, '')],
+    # Valores nuevos en las columnas codificadas como diccionario.
+    [(3, 'Hat', 'Puma', 'child', 'dafiti', 50.0, ''),
+     (4, 'Sock', 'Nike', 'woman', 'dafiti', 10.0, '')],
+    [(5, 'Bag', 'Reebok', 'man', 'dafiti', 80.0, '')]
+]
+
+
+def read_file(file_path, format):
+    if format == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_table(file_path)
+    with pa.memory_map(file_path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+@pytest.mark.parametrize('format', ['parquet', 'arrow'])
+def test_write_several_row_groups(tmp_path, format):
+    file_path = str(tmp_path / 'articles.{}'.format(format))
+    writer = ColumnarWriter(file_path, format)
+    for rows in BATCHES:
+        writer.write(rows)
+    writer.close()
+
+    table = read_file(file_path, format)
+    assert table.num_rows == 5
+    assert table.column('id').to_pylist() == [1, 2, 3, 4, 5]
+    assert table.column('brand').to_pylist() == ['Nike', 'Adidas', 'Puma', 'Nike', 'Reebok']
+    assert table.column('line').to_pylist() == ['woman', 'man', 'child', 'woman', 'man']
+    assert pa.types.is_dictionary(table.schema.field('brand').type)
@@ -0,0 +1,107 @@
+from extensions import ItemMilestones, get_rss
+from conftest import create_spider, run_scraper_script, SCRAPER_DIR
+from os.path import join
+import extensions
+import builtins
+import resource
+import json
+
+
+def test_item_milestones_use_the_spider_configuration():
+    spider = create_spider(ITEM_MILESTONES = '2,3')
+    extension = ItemMilestones.from_crawler(spider.crawler)
+    extension.spider_opened(spider)
+    for index in range(0, 3):
+        extension.item_scraped({}, spider)
+    stats = spider.crawler.stats
+    assert stats.get_value('items/time_to_2') is not None
+    assert stats.get_value('items/time_to_3') is not None
+    assert stats.get_value('items/time_to_1') is None
+
+
+def test_get_rss_without_proc(monkeypatch):
+    class Usage:
+        ru_maxrss = 1000
+
+    def open_without_proc(path, *args, **kwargs):
+        raise OSError('No such file or directory: {}'.format(path))
+    monkeypatch.setattr(builtins, 'open', open_without_proc)
+    monkeypatch.setattr(resource, 'getrusage', lambda who: Usage())
+
+    monkeypatch.setattr(extensions.sys, 'platform', 'darwin')
+    assert get_rss() == 1000
+    monkeypatch.setattr(extensions.sys, 'platform', 'linux')
+    assert get_rss() == 1000 * 1024
+
+
+def test_bounded_crawl_memory_is_constant(tmp_path):
+    # Escrapea un sitio sintético pequeño con bench_memory.py, forzando la cola en disco.
+    script = '''
+import sys, runpy
+from config import global_config
+global_config.set_value('MEMORY_QUEUE_PATH', {queue_path!r})
+sys.argv = ['bench_memory.py', '--lists', '20', '--products', '50', '--max-queued', '10', '--interval', '1',
+            '--max-growth', '16']
+runpy.run_path({script!r}, run_name = '__main__')
+'''.format(queue_path = str(tmp_path / 'memory_queue.db'), script = join(SCRAPER_DIR, 'bench_memory.py'))
+    assert run_scraper_script(script).startswith('RSS growth after warm-up')
+
+
+# Escrapea en modo de muestreo el sitio local que imita al de Dafiti (ver bench_shard.py): 27
+# marcas (una por letra inicial), 2 líneas por marca y 4 productos por línea. La primera vez sin
+# límite de items y la segunda con SAMPLE_MAX_ITEMS = 8 (con una petición a la vez y respuestas
+# lentas, para que el escrapeo termine antes de descargar todas las páginas)
+SAMPLING_SCRIPT = '''
+from scrapy.crawler import CrawlerRunner
+from scrapy.settings import Settings
+from twisted.internet import reactor, defer
+from bench_shard import stand_in_site
+from spiders.dafiti import DafitiSpider
+from extensions import SamplingReport
+import json
+
+server = stand_in_site(27, 4, 0.05)
+url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+class SampledDafitiSpider(DafitiSpider):
+    def request_brand_list(self):
+        return self.request(url = url + '/marcas/', callback = self.parse_brand_list, request_type = 'discovery')
+
+settings = Settings()
+settings.setdict({'EXTENSIONS' : {SamplingReport : 510}, 'CONCURRENT_REQUESTS' : 1, 'TELNETCONSOLE_ENABLED' : False,
+                  'LOG_LEVEL' : 'ERROR'}, priority = 'cmdline')
+results = []
+
+@defer.inlineCallbacks
+def run():
+    try:
+        for max_items in ['1000', '8']:
+            crawler = CrawlerRunner(settings).create_crawler(SampledDafitiSpider)
+            yield crawler.crawl(SAMPLE_SEED = '1', SAMPLE_SIZE = '5', SAMPLE_MAX_ITEMS = max_items, LOG_LEVEL = 'ERROR')
+            stats = crawler.stats.get_stats()
+            results.append(dict([(key, value) for key, value in stats.items()
+                                 if key.startswith('sample/') or key in ['finish_reason', 'item_scraped_count']]))
+    finally:
+        reactor.stop()
+
+reactor.callWhenRunning(run)
+reactor.run()
+print(json.dumps(results))
+'''
+
+
+def test_sampling_report():
+    full, limited = json.loads(run_scraper_script(SAMPLING_SCRIPT))
+
+    # 5 marcas de la muestra, con 2 listados de productos (peticiones 'leaf') de 4 productos cada una.
+    assert full['finish_reason'] == 'finished'
+    assert full['sample/items'] == full['item_scraped_count'] == 40
+    assert full['sample/leaf_pages'] == 10
+    assert full['sample/success_rate'] == 1.0
+    for request_type in ['discovery', 'leaf']:
+        assert 0 <= full['sample/latency_p50/{}'.format(request_type)] <= full['sample/latency_p95/{}'.format(request_type)]
+
+    # Los items de las respuestas en curso se siguen procesando al cerrar la araña.
+    assert limited['finish_reason'] == 'sample_item_count'
+    assert 8 <= limited['sample/items'] < 40
+    assert limited['sample/leaf_pages'] >= 2
@@ -0,0 +1,148 @@
+'''
+Tests de las especificaciones de extracción (extraction.py) y de la extracción de productos de las
+arañas, con fragmentos de HTML y con páginas guardadas de Dafiti y Geelbe (tests/fixtures)
+'''
+
+from extraction import parse_price, json_ld_products, merge_products, DAFITI_PRODUCT, DAFITI_PRODUCT_CONTAINER, GEELBE_PRODUCT
+from item_loader import MissingFieldError
+from spiders.dafiti import DafitiSpider
+from spiders.geelbe import GeelbeSpider
+from conftest import create_spider, html_response, FIXTURES_DIR
+from os.path import join
+import pytest
+import json
+
+
+def json_ld(data):
+    return '<script type="application/ld+json">{}</script>'.format(json.dumps(data))
+
+
+def listing_product(sku, name, price, url):
+    return ('<li class="itm" data-sku="{}"><div class="itm-product-main-info"><a href="{}">'
+            '<p class="itm-title">{}</p></a><span class="itm-price">$ {}</span></div></li>').format(sku, url, name, price)
+
+
+def test_parse_price():
+    assert parse_price('129.900') == '129900'
+    assert parse_price('1.299.900') == '1299900'
+    assert parse_price('1.299.900,50') == '1299900.50'
+    assert parse_price('129.90') == '129.90'
+    assert parse_price('129900') == '129900'
+
+
+def test_dafiti_html_price_has_the_json_scale():
+    response = html_response('<ul>{}</ul>'.format(listing_product('SK1', 'Tenis', '129.900', '/tenis-1.html')))
+    fields = DAFITI_PRODUCT.extract(response.css('div.itm-product-main-info')[0])
+    assert fields == {'name' : 'Tenis', 'price' : '129900', 'sku' : 'SK1', 'url' : '/tenis-1.html'}
+
+
+def test_json_ld_type_list():
+    response = html_response(json_ld([{'@type' : ['Product'], 'name' : 'Tenis', 'sku' : 1, 'offers' : {'price' : 129900}},
+                                      {'@type' : ['Thing', 'Product'], 'name' : 'Bolso', 'offers' : {'price' : 50000}},
+                                      {'@type' : ['Offer'], 'name' : 'Other'}]))
+    assert [product['name'] for product in json_ld_products(response)] == ['Tenis', 'Bolso']
+
+
+def test_merge_products():
+    products = [{'sku' : 'A', 'url' : None, 'name' : 'Tenis', 'price' : 10, 'image' : None},
+                {'sku' : None, 'url' : 'http://x/b', 'name' : 'Bolso', 'price' : 20, 'image' : 'b.jpg'}]
+    other = [{'sku' : 'A', 'url' : 'http://x/a', 'name' : 'Tenis html', 'price' : 11, 'image' : 'a.jpg'},
+             {'sku' : 'B', 'url' : 'http://x/b', 'name' : 'Bolso html', 'price' : 21},
+             {'sku' : 'C', 'url' : 'http://x/c', 'name' : 'Gorra', 'price' : 30}]
+    merged = merge_products(products, other)
+    assert merged == [{'sku' : 'A', 'url' : 'http://x/a', 'name' : 'Tenis', 'price' : 10, 'image' : 'a.jpg'},
+                      {'sku' : 'B', 'url' : 'http://x/b', 'name' : 'Bolso', 'price' : 20, 'image' : 'b.jpg'},
+                      {'sku' : 'C', 'url' : 'http://x/c', 'name' : 'Gorra', 'price' : 30}]
+    assert products[0]['image'] is None
+
+
+def test_dafiti_listing_merges_json_and_html_products():
+    spider = create_spider(DafitiSpider)
+    body = '<html><head>{}</head><body><ul>{}{}</ul></body></html>'.format(
+        json_ld({'@graph' : [{'@type' : ['Product'], 'name' : 'Tenis', 'sku' : 'SK1', 'url' : '/tenis-1.html',
+                              'image' : 'https://img/1.jpg', 'offers' : {'price' : '129900'}}]}),
+        listing_product('SK1', 'Tenis', '129.900', '/tenis-1.html'),
+        listing_product('SK2', 'Bolso', '49.900', '/bolso-2.html'))
+    response = html_response(body)
+    items = list(spider.parse_brand_products_list(response, brand = 'Marca', line = 'Mujer'))
+
+    assert [(item['name'], item['price'], item['sku']) for item in items] == [('Tenis', 129900.0, 'SK1'), ('Bolso', 49900.0, 'SK2')]
+    assert items[0]['image'] == 'https://img/1.jpg'
+    assert response.meta.get('extraction_errors', []) == []
+
+
+# Páginas guardadas (tests/fixtures)
+
+def fixture_response(name, url, **kwargs):
+    with open(join(FIXTURES_DIR, name), encoding = 'utf-8') as file:
+        return html_response(file.read(), url = url, **kwargs)
+
+
+def test_dafiti_product_spec_on_saved_listing():
+    response = fixture_response('dafiti_listing.html', 'https://www.dafiti.com.co/adidas/mujer/')
+    products = [DAFITI_PRODUCT.extract(item) for item in response.css(DAFITI_PRODUCT_CONTAINER)]
+    assert products == [
+        {'name' : 'Tenis Running Duramo SL', 'price' : '229900', 'sku' : 'AD112SH51ABCDAFCO',
+         'url' : '/Tenis-Running-Duramo-SL-1234567.html'},
+        {'name' : 'Leggings Essentials 3 Tiras', 'price' : '89900', 'sku' : 'AD112AP22EFGDAFCO',
+         'url' : '/Leggings-Essentials-3-Tiras-7654321.html'},
+        {'name' : 'Gorra Baseball 3 Tiras', 'price' : '1059900', 'sku' : 'AD112AC33HIJDAFCO',
+         'url' : '/Gorra-Baseball-3-Tiras-1122334.html'}
+    ]
+
+
+def test_json_ld_products_on_saved_listing():
+    response = fixture_response('dafiti_listing.html', 'https://www.dafiti.com.co/adidas/mujer/')
+    assert json_ld_products(response) == [
+        {'name' : 'Tenis Running Duramo SL', 'sku' : 'AD112SH51ABCDAFCO',
+         'url' : 'https://www.dafiti.com.co/Tenis-Running-Duramo-SL-1234567.html',
+         'image' : 'https://static.dafiti.com.co/p/adidas-tenis-1234567-1-catalog.jpg', 'price' : '229900', 'list_price' : None},
+        {'name' : 'Leggings Essentials 3 Tiras', 'sku' : 'AD112AP22EFGDAFCO',
+         'url' : 'https://www.dafiti.com.co/Leggings-Essentials-3-Tiras-7654321.html',
+         'image' : 'https://static.dafiti.com.co/p/adidas-leggings-7654321-1-catalog.jpg', 'price' : 89900, 'list_price' : 129900}
+    ]
+
+
+def test_dafiti_spider_on_saved_listing():
+    for mode in ['json', 'html']:
+        spider = create_spider(DafitiSpider, DAFITI_EXTRACTION_MODE = mode)
+        response = fixture_response('dafiti_listing.html', 'https://www.dafiti.com.co/adidas/mujer/')
+        items = list(spider.parse_brand_products_list(response, brand = 'adidas Performance', line = 'mujer'))
+
+        assert [(item['name'], item['price'], item['sku'], item['brand'], item['line'], item['provider']) for item in items] == [
+            ('Tenis Running Duramo SL', 229900.0, 'AD112SH51ABCDAFCO', 'Adidas performance', 'Mujer', 'dafiti'),
+            ('Leggings Essentials 3 Tiras', 89900.0, 'AD112AP22EFGDAFCO', 'Adidas performance', 'Mujer', 'dafiti'),
+            ('Gorra Baseball 3 Tiras', 1059900.0, 'AD112AC33HIJDAFCO', 'Adidas performance', 'Mujer', 'dafiti')]
+        if mode == 'json':
+            assert items[1]['list_price'] == 129900.0
+            assert items[1]['image'] == 'https://static.dafiti.com.co/p/adidas-leggings-7654321-1-catalog.jpg'
+            assert 'image' not in items[2]
+        else:
+            assert all('image' not in item for item in items)
+
+
+def test_geelbe_product_spec_on_saved_page():
+    response = fixture_response('geelbe_product.html', 'http://www.geelbe.com/producto/chaqueta-impermeable')
+    fields = GEELBE_PRODUCT.extract(response)
+    del fields['description']
+    assert fields == {'name' : 'Chaqueta Impermeable', 'price' : '159900',
+                      'image' : '/imagenes/productos/chaqueta-impermeable-nautica-1.jpg',
+                      'brand' : 'Nautica', 'line' : 'Hombre'}
+
+
+def test_geelbe_spider_on_saved_page():
+    spider = create_spider(GeelbeSpider)
+    response = fixture_response('geelbe_product.html', 'http://www.geelbe.com/producto/chaqueta-impermeable')
+    items = list(spider.parse_product(response, line = 'man'))
+    assert len(items) == 1
+    assert dict(items[0]) == {'name' : 'Chaqueta Impermeable', 'price' : 159900.0, 'brand' : 'Nautica',
+                              'line' : 'Hombre', 'provider' : 'geelbe',
+                              'image' : 'http://www.geelbe.com/imagenes/productos/chaqueta-impermeable-nautica-1.jpg'}
+
+
+def test_geelbe_product_without_brand():
+    response = fixture_response('geelbe_product.html', 'http://www.geelbe.com/producto/chaqueta-impermeable')
+    body = response.text.replace('<b>Marca</b>', '<b>Fabricante</b>')
+    with pytest.raises(MissingFieldError) as error:
+        GEELBE_PRODUCT.extract(response.replace(body = body.encode('utf-8')))
+    assert error.value.field == 'brand'
@@ -0,0 +1,93 @@
+from feeds import FeedWriter
+import feeds
+import pytest
+import gzip
+import json
+import time
+import zlib
+import csv
+
+
+RECORDS = [{'name' : 'Zapatilla "ñ"', 'price' : 10.5, 'brand' : 'Marca, S.A.'},
+           {'name' : 'Camisa', 'price' : 20.0, 'brand' : None}]
+
+
+def read_jsonl(file_path, open = open):
+    with open(file_path, 'rt', encoding = 'utf-8') as file:
+        return [json.loads(line) for line in file]
+
+
+def test_jsonl_feed(tmp_path):
+    writer = FeedWriter(str(tmp_path), 'articles')
+    for record in RECORDS:
+        writer.write(record)
+    file_paths = writer.close()
+
+    assert len(file_paths) == 1
+    assert file_paths[0].endswith('-00001.jsonl')
+    assert read_jsonl(file_paths[0]) == RECORDS
+
+
+def test_csv_feed(tmp_path):
+    writer = FeedWriter(str(tmp_path), 'articles', format = 'csv', fields = ['name', 'price', 'brand'])
+    for record in RECORDS:
+        writer.write(record)
+    file_paths = writer.close()
+
+    with open(file_paths[0], newline = '', encoding = 'utf-8') as file:
+        rows = list(csv.reader(file))
+    assert rows == [['name', 'price', 'brand'], ['Zapatilla "ñ"', '10.5', 'Marca, S.A.'], ['Camisa', '20.0', '']]
+
+
+def test_rotate_by_items(tmp_path):
+    writer = FeedWriter(str(tmp_path), 'articles', rotate_items = 2)
+    for index in range(0, 5):
+        writer.write({'index' : index})
+    file_paths = writer.close()
+
+    assert [len(read_jsonl(file_path)) for file_path in file_paths] == [2, 2, 1]
+    assert [record['index'] for file_path in file_paths for record in read_jsonl(file_path)] == list(range(0, 5))
+
+
+def test_rotate_by_bytes(tmp_path):
+    writer = FeedWriter(str(tmp_path), 'articles', rotate_bytes = 100)
+    for index in range(0, 20):
+        writer.write({'index' : index, 'padding' : 'x' * 20})
+    file_paths = writer.close()
+
+    assert len(file_paths) > 1
+    records = [record for file_path in file_paths for record in read_jsonl(file_path)]
+    assert [record['index'] for record in records] == list(range(0, 20))
+    # Se rota en cuanto se supera el tamaño: Ningún fichero tiene más de un registro por encima.
+    assert all(len(read_jsonl(file_path)) <= 3 for file_path in file_paths)
+
+
+def test_gzip_feed(tmp_path):
+    writer = FeedWriter(str(tmp_path), 'articles', compression = 'gzip')
+    for record in RECORDS:
+        writer.write(record)
+    file_paths = writer.close()
+
+    assert file_paths[0].endswith('.jsonl.gz')
+    assert read_jsonl(file_paths[0], open = gzip.open) == RECORDS
+
+
+def test_periodic_flush(tmp_path):
+    writer = FeedWriter(str(tmp_path), 'articles', compression = 'gzip', flush_interval = 0.1)
+    # Los registros siguen llegando más rápido que el intervalo: Aun así se vacían periódicamente.
+    end = time.time() + 0.5
+    while time.time() < end:
+        writer.write({'name' : 'article'})
+        time.sleep(0.01)
+
+    # El fichero sigue abierto: Descomprimimos lo vaciado hasta ahora, sin el final del stream gzip.
+    with open(writer.file_paths[0], 'rb') as file:
+        data = zlib.decompressobj(wbits = 31).decompress(file.read())
+    assert data.count(b'\n') > 0
+    writer.close()
+
+
+def test_zstd_requires_zstandard(tmp_path, monkeypatch):
+    monkeypatch.setattr(feeds, 'zstandard', None)
+    with pytest.raises(ValueError, match = 'zstandard'):
+        FeedWriter(str(tmp_path), 'articles', compression = 'zstd')
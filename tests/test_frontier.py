@@ -0,0 +1,118 @@
+from frontier import LocalBroker, FrontierScheduler, BoundedMemoryScheduler
+from conftest import create_spider
+from scrapy import Request
+import subprocess
+import frontier
+import pytest
+import time
+import sys
+import os
+
+
+@pytest.fixture
+def broker(tmp_path):
+    return LocalBroker(str(tmp_path / 'frontier.db'))
+
+
+def test_pop_by_priority(broker):
+    broker.push('queue', b'low', priority = 0)
+    broker.push('queue', b'high', priority = 10)
+    broker.push('queue', b'low 2', priority = 0)
+    broker.push('other', b'other', priority = 20)
+
+    payloads = [broker.pop('queue', 60)[1] for index in range(0, 3)]
+    assert payloads == [b'high', b'low', b'low 2']
+    assert broker.pop('queue', 60) is None
+    assert broker.stats('queue') == {'queued' : 0, 'leased' : 3, 'fingerprints' : 0}
+
+
+def test_ack_removes_the_request(broker):
+    broker.push('queue', b'request')
+    lease, payload = broker.pop('queue', 60)
+    assert broker.pending('queue') == 1
+    broker.ack('queue', lease)
+    assert broker.pending('queue') == 0
+
+
+def test_expired_lease_returns_to_the_queue(broker):
+    broker.push('queue', b'request')
+    first_lease, _ = broker.pop('queue', 0.01)
+    time.sleep(0.05)
+    second_lease, payload = broker.pop('queue', 60)
+    assert payload == b'request' and second_lease != first_lease
+
+    # El préstamo expirado ya no permite confirmar la petición.
+    broker.ack('queue', first_lease)
+    assert broker.pending('queue') == 1
+    broker.ack('queue', second_lease)
+    assert broker.pending('queue') == 0
+
+
+def test_fingerprints(broker):
+    assert broker.add_fingerprint('queue', 'a')
+    assert not broker.add_fingerprint('queue', 'a')
+    assert broker.add_fingerprint('other', 'a')
+    broker.clear('queue')
+    assert broker.add_fingerprint('queue', 'a')
+    assert broker.stats('other')['fingerprints'] == 1
+
+
+@pytest.fixture
+def scheduler(tmp_path, monkeypatch):
+    monkeypatch.setattr(frontier, 'broker', None)
+    spider = create_spider(FRONTIER_BROKER = 'local', FRONTIER_LOCAL_PATH = str(tmp_path / 'frontier.db'))
+    scheduler = FrontierScheduler.from_crawler(spider.crawler)
+    scheduler.open(spider)
+    return scheduler
+
+
+def test_filtered_request_acks_its_lease(scheduler):
+    assert scheduler.enqueue_request(Request('http://example.com/a'))
+    request = scheduler.next_request()
+    assert len(scheduler) == 1
+
+    # e.g: Redirección a una página ya vista: Conserva el préstamo de la petición original.
+    redirect = Request('http://example.com/a', meta = {'frontier_lease' : request.meta['frontier_lease']})
+    assert not scheduler.enqueue_request(redirect)
+    assert len(scheduler) == 0
+
+
+def test_queue_is_cleared_when_the_crawl_finishes(scheduler):
+    scheduler.enqueue_request(Request('http://example.com/a'))
+    scheduler.close('shutdown')
+    assert scheduler.broker.stats(scheduler.queue) == {'queued' : 1, 'leased' : 0, 'fingerprints' : 1}
+
+    request = scheduler.next_request()
+    scheduler.broker.ack(scheduler.queue, request.meta['frontier_lease'])
+    scheduler.close('finished')
+    assert scheduler.broker.stats(scheduler.queue) == {'queued' : 0, 'leased' : 0, 'fingerprints' : 0}
+    # El siguiente escrapeo puede volver a pedir la misma página.
+    assert scheduler.enqueue_request(Request('http://example.com/a'))
+
+
+def test_bounded_scheduler_clears_queues_of_dead_processes(tmp_path):
+    path = str(tmp_path / 'memory_queue.db')
+    # Pid de un proceso que ya ha terminado.
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    dead_pid = process.pid
+
+    broker = LocalBroker(path)
+    for queue in ['stub-{}'.format(dead_pid), 'stub-{}'.format(os.getppid()), 'other-{}'.format(dead_pid)]:
+        broker.push(queue, b'request')
+        broker.add_fingerprint(queue, 'fingerprint')
+
+    spider = create_spider(MEMORY_MAX_QUEUED_REQUESTS = 1, MEMORY_QUEUE_PATH = path)
+    scheduler = BoundedMemoryScheduler(spider.crawler)
+    scheduler.open(spider)
+    assert sorted(broker.queues()) == sorted(['stub-{}'.format(os.getppid()), 'other-{}'.format(dead_pid)])
+    assert spider.crawler.stats.get_value('scheduler/stale_queues_cleared') == 1
+
+    # Las peticiones que no caben en memoria van a la cola del proceso y se vacía al terminar.
+    for index in range(0, 3):
+        assert scheduler.enqueue_request(Request('http://example.com/{}'.format(index)))
+    assert broker.pending(scheduler.queue) == 2
+    assert [scheduler.next_request().url for index in range(0, 3)] == ['http://example.com/{}'.format(index)
+                                                                       for index in range(0, 3)]
+    scheduler.close('finished')
+    assert scheduler.queue not in broker.queues()
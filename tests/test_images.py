@@ -0,0 +1,111 @@
+from images import ImageStore
+from conftest import run_scraper_script
+import json
+
+
+def test_image_store_deduplicates_by_content(tmp_path):
+    store = ImageStore(str(tmp_path))
+    hash, new = store.put('http://example.com/a.jpg', b'image', 'image/jpeg')
+    assert new
+    assert store.put('http://example.com/b', b'image', 'image/jpeg') == (hash, False)
+    assert (tmp_path / 'full' / hash[:2] / (hash + '.jpg')).read_bytes() == b'image'
+
+    assert store.lookup('http://example.com/a.jpg') is None
+    store.register('http://example.com/a.jpg', hash, '"etag"')
+    assert store.lookup('http://example.com/a.jpg') == (hash, '"etag"')
+    store.close()
+
+
+# Escrapea dos veces con el mismo almacén de imágenes una página con 4 artículos: Dos imágenes
+# distintas, una repetida (mismo contenido que la primera) y una que no existe.
+CRAWL_SCRIPT = '''
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from scrapy.crawler import CrawlerRunner
+from scrapy.settings import Settings
+from twisted.internet import reactor, defer
+from conftest import StubSpider
+from entities.article import Article
+from pipelines import ImagePipeline
+import json
+
+IMAGES = {{'/img/0.png' : b'image 0', '/img/1.png' : b'image 1', '/img/dup.png' : b'image 0'}}
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        etag = '"{{}}"'.format(self.path)
+        if self.path == '/page':
+            self.reply(200, b'<html></html>', 'text/html')
+        elif self.path not in IMAGES:
+            self.reply(404, b'', 'text/plain')
+        elif self.headers.get('If-None-Match') == etag:
+            self.reply(304, b'', None, etag)
+        else:
+            self.reply(200, IMAGES[self.path], 'image/png', etag)
+
+    def reply(self, status, body, content_type, etag = None):
+        self.send_response(status)
+        if content_type is not None:
+            self.send_header('Content-Type', content_type)
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), ImageRequestHandler)
+server.daemon_threads = True
+Thread(target = server.serve_forever, daemon = True).start()
+url = 'http://127.0.0.1:{{}}'.format(server.server_address[1])
+
+class ImagesSpider(StubSpider):
+    name = 'images'
+
+    def start_requests(self):
+        yield self.request(url = url + '/page', callback = self.parse, request_type = 'leaf')
+
+    def parse(self, response):
+        # Scrapy inspecciona el código de los generadores, que no existe en un script pasado con -c.
+        return [Article.ScrapyItem(name = 'Article {{}}'.format(index), price = 10.0, brand = 'Brand', line = 'woman',
+                                   provider = 'dafiti', image = url + path)
+                for index, path in enumerate(['/img/0.png', '/img/1.png', '/img/dup.png', '/img/missing.png'])]
+
+settings = Settings()
+settings.setdict({{'ITEM_PIPELINES' : {{ImagePipeline : 1}}, 'CONCURRENT_ITEMS' : 1, 'TELNETCONSOLE_ENABLED' : False,
+                  'LOG_LEVEL' : 'ERROR'}}, priority = 'cmdline')
+results = []
+
+@defer.inlineCallbacks
+def run():
+    for index in range(0, 2):
+        crawler = CrawlerRunner(settings).create_crawler(ImagesSpider)
+        yield crawler.crawl(OUTPUT_IMAGES_DIR = {images_dir!r})
+        results.append(dict([(key, value) for key, value in crawler.stats.get_stats().items()
+                             if key.startswith('images/')]))
+    reactor.stop()
+
+reactor.callWhenRunning(run)
+reactor.run()
+print(json.dumps(results))
+'''
+
+
+def test_image_pipeline(tmp_path):
+    first, second = json.loads(run_scraper_script(CRAWL_SCRIPT.format(images_dir = str(tmp_path / 'images'))))
+
+    assert first['images/downloaded'] == 3
+    assert first['images/stored'] == 2
+    assert first['images/duplicates'] == 1
+    assert first['images/failed'] == 1
+    assert first['images/dedup_ratio'] == round(1 / 3, 4)
+    assert 'images/not_modified' not in first
+
+    # Las imágenes no han cambiado: Peticiones condicionales (If-None-Match) con respuesta 304.
+    assert second['images/not_modified'] == 3
+    assert second['images/failed'] == 1
+    assert 'images/downloaded' not in second
@@ -0,0 +1,62 @@
+from matching import normalize_name, tfidf_vectors, match_block, match_articles
+from pipelines import DatabasePipeline
+from entities.article import Article
+from db import db, db_session
+from math import sqrt
+import pytest
+
+
+def test_normalize_name():
+    assert normalize_name('  Camiseta   Básica-Azul ') == 'camiseta basica azul'
+    assert normalize_name('ZAPATILLA Niño (Talla 32)') == 'zapatilla nino talla 32'
+    assert normalize_name('¡Oferta!') == 'oferta'
+    assert normalize_name(None) == ''
+
+
+def test_tfidf_vectors():
+    vectors = tfidf_vectors([['camiseta', 'azul'], ['camiseta', 'roja'], ['camiseta', 'camiseta'], []])
+
+    for vector in vectors[:3]:
+        assert sqrt(sum([weight * weight for weight in vector.values()])) == pytest.approx(1.0)
+    # Las palabras menos frecuentes pesan más.
+    assert vectors[0]['azul'] > vectors[0]['camiseta']
+    assert vectors[2] == {'camiseta' : pytest.approx(1.0)}
+    assert vectors[3] == {}
+
+
+def test_match_block_requires_mutual_best_match():
+    vectors = tfidf_vectors([normalize_name(name).split() for name in [
+        'Camiseta basica azul', 'Camiseta basica', 'Camiseta basica azul marino', 'Pantalon negro']])
+    left, right = [(1, vectors[0]), (2, vectors[1])], [(10, vectors[2]), (11, vectors[3])]
+
+    # Ambos artículos de la izquierda prefieren el 10, pero el 10 solo prefiere al 1.
+    matches = match_block(left, right, min_similarity = 0.1)
+    assert [(article, other) for article, other, similarity in matches] == [(1, 10)]
+    assert 0 < matches[0][2] <= 1.0
+
+    # Sin palabras en común, no hay candidatos. Por debajo de la similitud mínima, no hay parejas.
+    assert match_block([(1, vectors[3])], [(10, vectors[0])], min_similarity = 0.1) == []
+    assert match_block(left, right, min_similarity = 0.99) == []
+
+
+def test_match_articles_replaces_matches_in_any_order(spider):
+    pipeline = DatabasePipeline()
+    pipeline.open_spider(spider)
+    for name, provider in [('Camiseta básica azul', 'match left'), ('CAMISETA BASICA-AZUL', 'match right'),
+                           ('Pantalón negro', 'match left'), ('Vestido rojo', 'match right')]:
+        pipeline.items.append(Article.ScrapyItem(name = name, price = 10.0, brand = 'Match brand', line = 'woman',
+                                                 provider = provider))
+    pipeline.close_spider(spider)
+
+    def matches():
+        with db_session:
+            return db.select('SELECT a.name, o.name FROM ArticleMatch m JOIN Article a ON a.id = m.article '
+                             'JOIN Article o ON o.id = m.other WHERE a.name LIKE $pattern OR o.name LIKE $pattern',
+                             {'pattern' : '%amiseta%'})
+
+    assert match_articles(providers = ('match left', 'match right')) == 1
+    assert matches() == [('Camiseta básica azul', 'CAMISETA BASICA-AZUL')]
+
+    # Con los proveedores al revés, la pareja anterior se reemplaza.
+    assert match_articles(providers = ('match right', 'match left')) == 1
+    assert matches() == [('CAMISETA BASICA-AZUL', 'Camiseta básica azul')]
@@ -0,0 +1,96 @@
+from middlewares import ExtractionHealthMiddleware, ResponseSizeBudgetMiddleware, ResponseTooLargeError, decompress
+from spiders.dafiti import DafitiSpider
+from conftest import create_spider, html_response
+from scrapy.http import Request, Response, HtmlResponse
+import brotli
+import gzip
+import zlib
+import tracemalloc
+import pytest
+
+
+def test_missing_product_container_is_reported():
+    spider = create_spider(DafitiSpider, DAFITI_EXTRACTION_MODE = 'html', EXTRACTION_HEALTH_MIN_PAGES = 1,
+                           EXTRACTION_HEALTH_ACTION = 'log')
+    errors = []
+    spider.log.error = lambda message, *args: errors.append(message.format(*args))
+    middleware = ExtractionHealthMiddleware.from_crawler(spider.crawler)
+
+    response = html_response('<html><body><ul class="new-markup"></ul></body></html>',
+                             callback = spider.parse_brand_products_list)
+    result = spider.parse_brand_products_list(response, brand = 'Marca', line = 'Mujer')
+    assert list(middleware.process_spider_output(response, result, spider)) == []
+
+    stats = spider.crawler.stats
+    assert stats.get_value('extraction/parse_brand_products_list/missing/div.itm-product-main-info') == 1
+    assert stats.get_value('extraction/parse_brand_products_list/unhealthy') is True
+    assert 'div.itm-product-main-info (100%)' in errors[-1]
+
+
+BODY = b'<html><body>' + b''.join([b'<p>Product %d</p>' % index for index in range(0, 20000)]) + b'</body></html>'
+
+
+def test_decompress():
+    compressor = zlib.compressobj(wbits = -zlib.MAX_WBITS)
+    raw_deflate = compressor.compress(BODY) + compressor.flush()
+    for encoding, body in [('gzip', gzip.compress(BODY)), ('x-gzip', gzip.compress(BODY)), ('deflate', zlib.compress(BODY)),
+                           ('deflate', raw_deflate), ('br', brotli.compress(BODY))]:
+        assert decompress(body, encoding, chunk_size = 1024) == BODY
+        assert decompress(body, encoding, max_size = len(BODY)) == BODY
+        with pytest.raises(ResponseTooLargeError):
+            decompress(body, encoding, max_size = len(BODY) - 1)
+
+
+def test_decompress_multi_member_gzip():
+    body = gzip.compress(BODY[:1000]) + gzip.compress(BODY[1000:])
+    assert decompress(body, 'gzip', chunk_size = 1024) == BODY
+    # Lo que sigue al último miembro se ignora.
+    assert decompress(body + b'\x00' * 16, 'gzip') == BODY
+
+
+def test_decompression_bomb():
+    size = 64 * 1024 * 1024
+    bombs = [('gzip', gzip.compress(b'\x00' * size, compresslevel = 9)),
+             ('deflate', zlib.compress(b'\x00' * size, 9)),
+             ('br', brotli.compress(b'\x00' * size, quality = 1))]
+    for encoding, body in bombs:
+        tracemalloc.start()
+        with pytest.raises(ResponseTooLargeError):
+            decompress(body, encoding, max_size = 1024 * 1024)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        # La descompresión se detiene al superar el tamaño máximo (no se descomprimen los 64MB)
+        assert peak < 4 * 1024 * 1024, encoding
+
+
+def budget_response(middleware, spider, body, encoding = None, size_budget = 'listing'):
+    request = Request('https://www.dafiti.com.co/marca/', meta = {'size_budget' : size_budget})
+    middleware.process_request(request, spider)
+    headers = {'Content-Type' : 'text/html; charset=utf-8'}
+    if encoding is not None:
+        headers['Content-Encoding'] = encoding
+    response = Response(request.url, body = body, headers = headers, request = request)
+    return request, middleware.process_response(request, response, spider)
+
+
+def test_response_size_budget():
+    spider = create_spider(RESPONSE_MAX_SIZE_LISTING = len(BODY), RESPONSE_MAX_SIZE_PRODUCT = 1000)
+    middleware = ResponseSizeBudgetMiddleware.from_crawler(spider.crawler)
+    stats = spider.crawler.stats
+
+    request, response = budget_response(middleware, spider, brotli.compress(BODY), encoding = 'br')
+    assert request.meta['download_maxsize'] == len(BODY)
+    assert b'br' in request.headers['Accept-Encoding']
+    assert isinstance(response, HtmlResponse) and response.body == BODY
+    assert 'Content-Encoding' not in response.headers
+    assert stats.get_value('response_size/listing/bytes') == len(BODY)
+    assert stats.get_value('response_size/listing/wire_bytes') == len(brotli.compress(BODY))
+
+    # Comprimido cabe en el presupuesto, pero descomprimido no.
+    with pytest.raises(ResponseTooLargeError):
+        budget_response(middleware, spider, gzip.compress(BODY), encoding = 'gzip', size_budget = 'product')
+    # Sin comprimir (e.g: el servidor no ha indicado la longitud y no se ha cancelado la descarga)
+    with pytest.raises(ResponseTooLargeError):
+        budget_response(middleware, spider, BODY, size_budget = 'product')
+    assert stats.get_value('response_size/product/oversized') == 2
+    assert stats.get_value('response_size/product/responses') is None
@@ -0,0 +1,106 @@
+from pipelines import DatabasePipeline
+from entities.entity import LookupEntityMixins
+from entities.brand import Brand
+from entities.line import Line
+from conftest import run_scraper_script, SCRAPER_DIR
+from pony.orm import db_session, rollback
+from os.path import join
+import sqlite3
+import json
+
+
+def test_intern_caches_ids(spider):
+    pipeline = DatabasePipeline()
+    pipeline.open_spider(spider)
+
+    with db_session:
+        brand_id = Brand.intern('Interned brand')
+        assert Brand[brand_id].name == 'Interned brand'
+        assert LookupEntityMixins._interned['Brand']['Interned brand'] == brand_id
+        assert Brand.intern('Interned brand') == brand_id
+
+        # Cada entidad tiene su propia caché.
+        line_id = Line.intern('Interned brand')
+        assert Line[line_id].name == 'Interned brand'
+        assert LookupEntityMixins._interned['Brand']['Interned brand'] == brand_id
+
+
+def test_clear_interned_after_rollback(spider):
+    pipeline = DatabasePipeline()
+    pipeline.open_spider(spider)
+
+    with db_session:
+        Brand.intern('Rolled back brand')
+        Line.intern('Rolled back line')
+        rollback()
+
+    # La caché conserva el id de la marca deshecha hasta que se vacía.
+    assert 'Rolled back brand' in LookupEntityMixins._interned['Brand']
+    Brand.clear_interned()
+    assert 'Brand' not in LookupEntityMixins._interned
+    assert 'Rolled back line' in LookupEntityMixins._interned['Line']
+    Line.clear_interned()
+
+    with db_session:
+        assert Brand.get(name = 'Rolled back brand') is None
+        brand_id = Brand.intern('Rolled back brand')
+        assert Brand[brand_id].name == 'Rolled back brand'
+
+
+# Esquema de la tabla Article antes de LookupTablesMigration (marca, línea y proveedor en texto)
+LEGACY_SCHEMA = '''
+CREATE TABLE "Article" ("id" INTEGER PRIMARY KEY AUTOINCREMENT, "price" REAL NOT NULL, "name" TEXT NOT NULL,
+    "line" TEXT NOT NULL, "brand" TEXT NOT NULL, "provider" TEXT NOT NULL, "image" TEXT NOT NULL,
+    CONSTRAINT "unq_article__name_provider" UNIQUE ("name", "provider"));
+CREATE INDEX "idx_article__brand" ON "Article" ("brand");
+'''
+
+MIGRATE_SCRIPT = '''
+from contextlib import redirect_stdout
+from io import StringIO
+import runpy, sqlite3, sys, json
+
+sys.argv = ['migrations.py', {db_path!r}]
+output = StringIO()
+with redirect_stdout(output):
+    runpy.run_path({script!r}, run_name = '__main__')
+
+connection = sqlite3.connect({db_path!r})
+articles = connection.execute(\'\'\'
+    SELECT a.id, a.name, a.price, l.name, b.name, p.name, a.image, a.sku, a.last_seen
+    FROM Article a JOIN Line l ON l.id = a.line JOIN Brand b ON b.id = a.brand JOIN Provider p ON p.id = a.provider
+    ORDER BY a.id\'\'\').fetchall()
+brands = [name for name, in connection.execute('SELECT name FROM Brand ORDER BY name')]
+tables = [name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+print(json.dumps({{'output' : output.getvalue().splitlines(), 'articles' : articles, 'brands' : brands,
+                  'tables' : tables}}))
+'''
+
+
+def test_lookup_tables_migration(tmp_path):
+    db_path = str(tmp_path / 'legacy.db')
+    connection = sqlite3.connect(db_path)
+    connection.executescript(LEGACY_SCHEMA)
+    connection.executemany('INSERT INTO Article(id, price, name, line, brand, provider, image) VALUES (?, ?, ?, ?, ?, ?, ?)', [
+        (1, 10.0, 'Camisa', 'Woman', 'Nike', 'dafiti', 'http://example.com/1.jpg'),
+        (2, 20.0, 'Zapato', 'Man', 'Nike', 'geelbe', ''),
+        (5, 30.0, 'Bolso', 'Woman', 'Adidas', 'dafiti', ''),
+        (6, 15.0, 'Pantalón', 'Man', 'Nike', 'dafiti', '')
+    ])
+    connection.commit()
+    connection.close()
+
+    result = json.loads(run_scraper_script(MIGRATE_SCRIPT.format(db_path = db_path, script = join(SCRAPER_DIR, 'migrations.py'))))
+
+    assert 'Applied: Normalize brand, line and provider into lookup tables' in result['output']
+    assert any(line.startswith('Query time (articles of "Nike" on dafiti): ') for line in result['output'])
+    assert result['output'][-1].startswith('Database size: ')
+    # Los ids de los artículos se conservan y las columnas nuevas están vacías.
+    assert result['articles'] == [
+        [1, 'Camisa', 10.0, 'Woman', 'Nike', 'dafiti', 'http://example.com/1.jpg', '', None],
+        [2, 'Zapato', 20.0, 'Man', 'Nike', 'geelbe', '', '', None],
+        [5, 'Bolso', 30.0, 'Woman', 'Adidas', 'dafiti', '', '', None],
+        [6, 'Pantalón', 15.0, 'Man', 'Nike', 'dafiti', '', '', None]
+    ]
+    assert result['brands'] == ['Adidas', 'Nike']
+    assert 'Article_legacy' not in result['tables']
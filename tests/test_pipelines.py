@@ -0,0 +1,62 @@
+from db import db, db_session
+from pipelines import DatabasePipeline
+from entities.article import Article
+from entities.crawl_run import CrawlRun
+from conftest import create_spider
+
+
+def article(name, price, brand = 'Brand', provider = 'dafiti'):
+    return Article.ScrapyItem(name = name, price = price, brand = brand, line = 'woman', provider = provider)
+
+
+def test_failed_batch_only_drops_the_failing_articles(spider):
+    pipeline = DatabasePipeline()
+    pipeline.open_spider(spider)
+
+    # El precio es obligatorio: El artículo sin precio hace fallar el bloque.
+    items = [article('Good {}'.format(index), 100.0 + index) for index in range(0, 7)]
+    items.insert(3, article('Bad', None))
+    for item in items:
+        pipeline.items.append(item)
+    pipeline.flush_items(spider)
+
+    stats = spider.crawler.stats
+    assert stats.get_value('database/articles/stored') == 7
+    assert stats.get_value('database/articles/dropped') == 1
+    with db_session:
+        names = set([stored.name for stored in Article.select(lambda stored: stored.name.startswith('Good '))])
+        # Los registros de PriceSnapshot se guardan con cada bloque, no al finalizar.
+        snapshots = db.select('SELECT a.name FROM PriceSnapshot s JOIN Article a ON a.id = s.article '
+                              'WHERE s.crawl = $crawl_id', {'crawl_id' : pipeline.crawl_id})
+    assert names == set(['Good {}'.format(index) for index in range(0, 7)])
+    assert set(snapshots) == names
+
+
+def test_spider_arguments_configure_the_pipeline(tmp_path):
+    spider = create_spider(STORAGE_BATCH_SIZE = '2', OUTPUT_DELTA_DIR = str(tmp_path))
+    pipeline = DatabasePipeline()
+    pipeline.open_spider(spider)
+    assert pipeline.batch_size == 2
+
+    for index in range(0, 3):
+        pipeline.process_item(article('Delta {}'.format(index), 10.0), spider)
+    assert len(pipeline.items) == 1
+    pipeline.close_spider(spider)
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_previous_crawl_skips_partial_runs():
+    spider = create_spider()
+    runs = []
+    for partial_spider, reason in [(spider, 'finished'), (create_spider(SAMPLE_SEED = '1'), 'finished'),
+                                   (spider, 'extraction_unhealthy'), (spider, 'finished')]:
+        pipeline = DatabasePipeline()
+        pipeline.open_spider(partial_spider)
+        pipeline.close_spider(partial_spider)
+        pipeline.spider_closed(partial_spider, reason)
+        runs.append(pipeline.crawl_id)
+
+    with db_session:
+        assert [CrawlRun[crawl_id].partial for crawl_id in runs] == [False, True, True, False]
+        connection = db.get_connection()
+        assert db.backend.previous_crawl(connection, runs[3]) == runs[0]
@@ -0,0 +1,45 @@
+from config import global_config
+from db import db
+from report import Reporter, data_version
+from datetime import datetime, timedelta
+from os import listdir
+import sqlite3
+
+
+def execute(query, params = ()):
+    connection = sqlite3.connect(global_config.path.OUTPUT_DATA_TO_SQLITE)
+    connection.execute(query, params)
+    connection.commit()
+    connection.close()
+
+
+def test_report_cache(tmp_path):
+    db.generate_mapping(config = global_config)
+    # Las ejecuciones de otros tests que no se han cerrado impedirían usar la caché.
+    execute('UPDATE CrawlRun SET finished = started WHERE finished IS NULL')
+    execute("INSERT INTO CrawlRun (spider, started, finished, partial) VALUES ('report', ?, ?, 0)",
+            (str(datetime.now()), str(datetime.now())))
+
+    reporter = Reporter(cache_dir = str(tmp_path))
+    reporter.run('counts')
+    reporter.run('prices')
+    assert len(listdir(str(tmp_path))) == 2
+    version = data_version(reporter.connection)
+    assert version is not None
+
+    # Una ejecución abandonada hace tiempo no desactiva la caché. Una reciente sí.
+    execute("INSERT INTO CrawlRun (spider, started, partial) VALUES ('report', ?, 0)",
+            (str(datetime.now() - timedelta(hours = global_config.REPORT_STALE_CRAWL_HOURS + 1)),))
+    assert data_version(reporter.connection) is not None
+    execute("INSERT INTO CrawlRun (spider, started, partial) VALUES ('report', ?, 0)", (str(datetime.now()),))
+    assert data_version(reporter.connection) is None
+    execute("UPDATE CrawlRun SET finished = ? WHERE finished IS NULL", (str(datetime.now()),))
+
+    # Las parejas de artículos (matching.py) cambian la versión de los datos. Al guardar un
+    # resultado de la nueva versión se eliminan los anteriores.
+    version = data_version(reporter.connection)
+    execute('INSERT INTO ArticleMatch (article, other, similarity) VALUES (1, 2, 0.9)')
+    assert data_version(reporter.connection) != version
+    reporter.run('counts')
+    assert len(listdir(str(tmp_path))) == 1
+    reporter.close()
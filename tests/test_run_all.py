@@ -0,0 +1,55 @@
+from conftest import run_scraper_script, SCRAPER_DIR
+from os.path import dirname
+import json
+
+
+# Ejecuta dos arañas sin peticiones de red (data: urls) con run_all y los settings del proyecto.
+RUN_ALL_SCRIPT = '''
+import os, sys, json
+sys.path.insert(0, {project_dir!r})
+os.environ['SCRAPY_SETTINGS_MODULE'] = 'dafiti_geelbe_scraper.settings'
+from conftest import StubSpider
+from entities.article import Article
+from run_all import run_all
+from metrics import combined_throughput, throughput_report
+
+def stub_spider(spider_name, num_items):
+    class ItemsSpider(StubSpider):
+        name = spider_name
+
+        def start_requests(self):
+            yield self.request(url = 'data:,products', callback = self.parse, request_type = 'leaf')
+
+        def parse(self, response):
+            # Scrapy inspecciona el código de los generadores, que no existe en un script pasado con -c.
+            return [Article.ScrapyItem(name = 'Run all {{}}'.format(index), price = 10.0, brand = 'Brand',
+                                       line = 'woman', provider = spider_name) for index in range(0, num_items)]
+    return ItemsSpider
+
+stats = run_all(spiders = [stub_spider('stub_a', 3), stub_spider('stub_b', 5)])
+print(json.dumps({{
+    'spiders' : sorted(stats.keys()),
+    'items' : dict([(name, spider_stats.get('item_scraped_count')) for name, spider_stats in stats.items()]),
+    'stored' : dict([(name, spider_stats.get('database/articles/stored')) for name, spider_stats in stats.items()]),
+    'combined' : combined_throughput(stats),
+    'report' : throughput_report(stats).splitlines()
+}}))
+'''
+
+
+def test_run_all_merges_the_stats():
+    result = json.loads(run_scraper_script(RUN_ALL_SCRIPT.format(project_dir = dirname(SCRAPER_DIR))))
+
+    assert result['spiders'] == ['stub_a', 'stub_b']
+    assert result['items'] == {'stub_a' : 3, 'stub_b' : 5}
+    # Ambas arañas guardan sus artículos a través de la misma base de datos.
+    assert result['stored'] == {'stub_a' : 3, 'stub_b' : 5}
+    assert result['combined']['items'] == 8
+    assert result['combined']['responses'] == 2
+    assert result['combined']['seconds'] > 0
+
+    report = result['report']
+    assert len(report) == 3
+    assert report[0].startswith('stub_a: 3 items, 1 responses')
+    assert report[1].startswith('stub_b: 5 items, 1 responses')
+    assert report[2].startswith('total: 8 items, 2 responses')
@@ -0,0 +1,36 @@
+from scrapy.settings import Settings
+from scrapy.crawler import Crawler
+from spiders.geelbe import GeelbeSpider
+import config
+
+
+def create_spider(**kwargs):
+    settings = Settings()
+    settings.setmodule('settings', priority = 'project')
+    crawler = Crawler(GeelbeSpider, settings)
+    return crawler._create_spider(**kwargs), crawler.settings
+
+
+def test_settings_module_does_not_read_the_configuration():
+    settings = Settings()
+    settings.setmodule('settings', priority = 'project')
+    # Los settings que dependen de la configuración los establece la araña.
+    assert settings.get('SPLASH_URL') is None
+    assert settings.getbool('SETTINGS_FROM_SCRAPER_CONFIG')
+
+
+def test_spider_arguments_override_the_crawler_settings():
+    spider, settings = create_spider(CONCURRENT_REQUESTS = '3', SPLASH_CONCURRENCY = '1', MEMORY_BOUNDED = 'True')
+    assert settings.getint('CONCURRENT_REQUESTS') == 3
+    assert settings.getdict('DOWNLOAD_SLOTS')['splash'] == {'concurrency' : 1}
+    assert settings.get('SCHEDULER') == 'dafiti_geelbe_scraper.frontier.BoundedMemoryScheduler'
+    assert settings.get('SPLASH_URL') == config.global_config.SPLASH_PROXY_URL
+
+
+def test_command_line_settings_have_priority():
+    settings = Settings()
+    settings.setmodule('settings', priority = 'project')
+    settings.set('CONCURRENT_REQUESTS', 7, priority = 'cmdline')
+    crawler = Crawler(GeelbeSpider, settings)
+    crawler._create_spider(CONCURRENT_REQUESTS = '3')
+    assert crawler.settings.getint('CONCURRENT_REQUESTS') == 7
@@ -0,0 +1,65 @@
+from shard import BRAND_LETTERS, dafiti_shards, geelbe_shards
+from spiders.dafiti import DafitiSpider, parse_letter_ranges, brand_letter
+from spiders.geelbe import GeelbeSpider
+from conftest import create_spider, html_response
+from urllib.parse import urlsplit, parse_qs
+import pytest
+
+
+def test_parse_letter_ranges():
+    assert parse_letter_ranges('a-c,x,#') == {'a', 'b', 'c', 'x', '#'}
+    assert parse_letter_ranges(' A-B , Z ') == {'a', 'b', 'z'}
+    for ranges in ['a-', 'abc', 'a-c-e', '']:
+        with pytest.raises(ValueError):
+            parse_letter_ranges(ranges)
+
+
+@pytest.mark.parametrize('num_shards', [1, 2, 3, 4, 7, 27, 100])
+def test_dafiti_shards_cover_every_letter_once(num_shards):
+    shards = dafiti_shards(num_shards)
+    assert len(shards) == min(num_shards, len(BRAND_LETTERS))
+
+    letters = [letter for shard in shards for letter in sorted(parse_letter_ranges(shard['DAFITI_BRAND_LETTERS']))]
+    assert sorted(letters) == sorted(BRAND_LETTERS)
+
+
+def test_dafiti_shards():
+    assert dafiti_shards(2) == [{'DAFITI_BRAND_LETTERS' : '#,a-l'}, {'DAFITI_BRAND_LETTERS' : 'm-z'}]
+
+
+def test_geelbe_shards():
+    assert geelbe_shards(3) == [{'GEELBE_PAGE_OFFSET' : 0, 'GEELBE_PAGE_STEP' : 3},
+                                {'GEELBE_PAGE_OFFSET' : 1, 'GEELBE_PAGE_STEP' : 3},
+                                {'GEELBE_PAGE_OFFSET' : 2, 'GEELBE_PAGE_STEP' : 3}]
+
+
+BRANDS_PAGE = ''.join(['<li class="brandsLetter"><a href="https://www.dafiti.com.co/{0}/">{1}</a></li>'.format(index, brand)
+                       for index, brand in enumerate(['Adidas', 'Ésika', 'Nike', 'Zara', '7 For All'])])
+
+
+def test_dafiti_brand_letters_filter():
+    assert [brand_letter(brand) for brand in ['Adidas', 'Ésika', ' nike', '7 For All', '']] == ['a', 'e', 'n', '#', '#']
+
+    spider = create_spider(DafitiSpider, DAFITI_BRAND_LETTERS = '#,a-m')
+    requests = list(spider.parse_brand_list(html_response(BRANDS_PAGE)))
+    assert [request.cb_kwargs['brand'] for request in requests] == ['Adidas', 'Ésika', '7 For All']
+
+    spider = create_spider(DafitiSpider)
+    assert len(list(spider.parse_brand_list(html_response(BRANDS_PAGE)))) == 5
+
+
+def page(request):
+    return int(parse_qs(urlsplit(request.url).query)['page'][0])
+
+
+def test_geelbe_page_offset_and_step():
+    spider = create_spider(GeelbeSpider, GEELBE_PAGE_OFFSET = 2, GEELBE_PAGE_STEP = 3, GEELBE_LINES = 'woman')
+    requests = list(spider.start_requests())
+    assert [page(request) for request in requests] == [3]
+
+    # La siguiente página del fragmento está GEELBE_PAGE_STEP páginas más adelante.
+    response = html_response('<div class="analyticsProduct"><a href="https://www.geelbe.com/p/1">Product</a></div>',
+                             url = requests[0].url)
+    next_requests = list(spider.parse_products_list(response, line = 'woman', page = 3))
+    assert page(next_requests[-1]) == 6
+    assert next_requests[-1].cb_kwargs == {'line' : 'woman', 'page' : 6}
@@ -0,0 +1,37 @@
+from scrapy.core.scheduler import Scheduler
+from conftest import create_spider
+
+
+def test_request_priorities_by_type():
+    spider = create_spider(PRIORITIZE_LEAF_REQUESTS = 'True')
+    requests = dict([(request_type, spider.request(url = 'https://example.com/{}'.format(request_type),
+                                                   callback = None, request_type = request_type))
+                     for request_type in ['discovery', 'listing', 'leaf']])
+
+    assert [requests[request_type].priority for request_type in ['discovery', 'listing', 'leaf']] == [0, 10, 20]
+    assert requests['leaf'].meta['request_type'] == 'leaf'
+    assert requests['leaf'].meta['size_budget'] == 'product'
+
+    spider = create_spider(PRIORITIZE_LEAF_REQUESTS = 'False')
+    assert spider.request(url = 'https://example.com/', callback = None, request_type = 'leaf').priority == 0
+
+
+def test_leaf_requests_are_scheduled_first():
+    spider = create_spider(PRIORITIZE_LEAF_REQUESTS = 'True')
+    scheduler = Scheduler.from_crawler(spider.crawler)
+    scheduler.open(spider)
+
+    # Las peticiones se encolan en orden inverso al de su prioridad.
+    for index in range(0, 2):
+        for request_type in ['discovery', 'listing', 'leaf']:
+            scheduler.enqueue_request(spider.request(url = 'https://example.com/{}/{}'.format(request_type, index),
+                                                     callback = None, request_type = request_type))
+
+    order = []
+    while scheduler.has_pending_requests():
+        request = scheduler.next_request()
+        order.append(request.meta['request_type'])
+    scheduler.close('finished')
+
+    # Con la misma prioridad, el orden depende de la cola de Scrapy (LIFO por defecto)
+    assert order == ['leaf', 'leaf', 'listing', 'listing', 'discovery', 'discovery']
@@ -0,0 +1,93 @@
+'''
+Test de integración del backend postgres (carga con COPY y merge). Se ejecuta contra un servidor
+PostgreSQL temporal (paquete pgserver) y se omite si no están instalados pgserver y psycopg2.
+'''
+
+from conftest import run_scraper_script
+from urllib.parse import urlparse, parse_qs
+import json
+import pytest
+
+pgserver = pytest.importorskip('pgserver')
+psycopg2 = pytest.importorskip('psycopg2')
+
+
+SCRIPT = '''
+from config import global_config
+for var, value in [('STORAGE_BACKEND', 'postgres'), ('POSTGRES_HOST', {host!r}), ('POSTGRES_USER', 'postgres'),
+                   ('POSTGRES_DATABASE', 'articles'), ('STORAGE_BATCH_SIZE', 4), ('LOG_LEVEL', 'ERROR')]:
+    global_config.set_value(var, value)
+
+from conftest import StubSpider
+from scrapy.utils.test import get_crawler
+from db import db, db_session
+from pipelines import DatabasePipeline
+from entities.article import Article
+import json
+
+def run(items):
+    crawler = get_crawler(StubSpider)
+    spider = crawler._create_spider()
+    pipeline = DatabasePipeline()
+    pipeline.open_spider(spider)
+    for item in items:
+        pipeline.process_item(Article.ScrapyItem(line = 'woman', provider = 'dafiti', **item), spider)
+    pipeline.close_spider(spider)
+    return crawler.stats.get_stats()
+
+first = run([dict(name = 'Shoe {{}}'.format(index), brand = 'Brand {{}}'.format(index % 2), price = 100.0 + index,
+                  image = 'http://example.com/{{}}.jpg'.format(index)) for index in range(0, 10)] +
+            [dict(name = 'Broken', brand = 'Brand 0', price = None)])
+# Artículo repetido en el mismo bloque: Se guarda el último.
+second = run([dict(name = 'Shoe 0', brand = 'Brand 0', price = 90.0, sku = 'SKU0'),
+              dict(name = 'Shoe 1', brand = 'Brand 1', price = 101.0),
+              dict(name = 'Shoe 10', brand = 'Brand 0', price = 50.0),
+              dict(name = 'Shoe 10', brand = 'Brand 0', price = 55.0)])
+
+with db_session:
+    articles = dict([(name, (price, image, sku)) for name, price, image, sku in
+                     db.select('SELECT name, price, image, sku FROM Article')])
+    snapshots = db.select('SELECT a.name, s.price, s.previous_price, s.crawl FROM PriceSnapshot s '
+                          'JOIN Article a ON a.id = s.article ORDER BY s.crawl, a.name')
+print(json.dumps(dict(first = first.get('database/articles/stored'), dropped = first.get('database/articles/dropped'),
+                      second = second.get('database/articles/stored'), articles = articles,
+                      snapshots = [list(row) for row in snapshots])))
+'''
+
+
+@pytest.fixture(scope = 'module')
+def postgres(tmp_path_factory):
+    '''
+    :return: Devuelve el directorio del socket de un servidor PostgreSQL temporal con la base de
+    datos articles vacía.
+    '''
+    server = pgserver.get_server(str(tmp_path_factory.mktemp('postgres')), cleanup_mode = 'stop')
+    host = parse_qs(urlparse(server.get_uri()).query)['host'][0]
+    connection = psycopg2.connect(host = host, user = 'postgres', dbname = 'postgres')
+    connection.autocommit = True
+    connection.cursor().execute('CREATE DATABASE articles')
+    connection.close()
+    yield host
+    server.cleanup()
+
+
+def test_copy_and_merge(postgres):
+    result = json.loads(run_scraper_script(SCRIPT.format(host = postgres)))
+
+    assert result['first'] == 10
+    assert result['dropped'] == 1
+    assert result['second'] == 4
+
+    articles = result['articles']
+    assert 'Broken' not in articles
+    # La imagen se mantiene si el item no la tiene y la referencia se actualiza.
+    assert articles['Shoe 0'] == [90.0, 'http://example.com/0.jpg', 'SKU0']
+    assert articles['Shoe 10'] == [55.0, '', '']
+    assert articles['Shoe 2'] == [102.0, 'http://example.com/2.jpg', '']
+
+    # Primera ejecución: Todos los artículos son nuevos. Segunda: Shoe 0 cambia de precio,
+    # Shoe 1 no cambia y Shoe 10 es nuevo.
+    first_crawl = [row for row in result['snapshots'] if row[3] == result['snapshots'][0][3]]
+    second_crawl = [row[:3] for row in result['snapshots'] if row[3] != result['snapshots'][0][3]]
+    assert len(first_crawl) == 10
+    assert second_crawl == [['Shoe 0', 90.0, 100.0], ['Shoe 10', 55.0, None]]